@@ -1,7 +1,8 @@
 # Importing required and necessary modules, functions and classes
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import CustomUser
 
@@ -22,12 +23,22 @@ class CustomUserSerializer(serializers.ModelSerializer):
 # Login Serializer
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField(required=True)
-    password = serializers.CharField(required=True)
+    password = serializers.CharField(required=True, write_only=True)
+    # Also returns a JWT token pair, saving clients a call to token/
+    jwt = serializers.BooleanField(required=False, default=False, write_only=True)
 
-    # Validating the users data
+    # Validating the users data. The password is hashed once, here, and the
+    # authenticated user is handed to the view in validated_data['user']
     def validate(self, data):
-        user = authenticate(
-            username=data['username'], password=data['password'])
+        user = authenticate(self.context.get('request'),
+                            username=data['username'], password=data['password'])
+        # authenticate() already rejects inactive users
         if not user:
-            raise serializers.ValidationError('Invalid username or password')
+            raise exceptions.AuthenticationFailed('Invalid username or password')
+        data['user'] = user
         return data
+
+    # Tokens for the logged in user, when asked for
+    def get_tokens(self, user):
+        refresh = RefreshToken.for_user(user)
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -1,4 +1,6 @@
 # Importing required and necessary modules, functions and classes
+from unittest import mock
+
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
@@ -68,6 +70,35 @@ class AccountsTestCase(TestCase):
         response = self.client.post(self.login_url, login_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    # Testing a login hashes the password once and can return tokens
+    def test_user_login_jwt(self):
+        self.client.post(self.register_url, self.user_data, format='json')
+        login_data = {
+            'username': 'testuser',
+            'password': 'testing@123',
+            'jwt': True
+        }
+
+        with mock.patch.object(CustomUser, 'check_password', autospec=True,
+                               side_effect=CustomUser.check_password) as check_password:
+            response = self.client.post(self.login_url, login_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(check_password.call_count, 1)
+        self.assertIn('access', response.data)
+        self.assertIn('refresh', response.data)
+
+        # the access token authenticates API requests
+        response = self.client.get(reverse('stock-reservations-list'),
+                                   HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # Testing inactive users cannot login
+    def test_user_login_inactive(self):
+        self.client.post(self.register_url, self.user_data, format='json')
+        CustomUser.objects.update(is_active=False)
+        response = self.client.post(self.login_url, self.user_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     # Testing the Token Obtain Enpoint
     def test_token_obtain(self):
         # creating user first
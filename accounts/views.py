@@ -1,7 +1,5 @@
 # Importing required and necessary modules, functions and classes
-from django.contrib.auth import authenticate, login
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from django.contrib.auth import login
 from rest_framework import generics, permissions, status, views
 from rest_framework.response import Response
 
@@ -28,32 +26,23 @@ class UserLoginView(views.APIView):
     serializer_class = LoginSerializer
     permission_classes = [permissions.AllowAny]
 
-    @swagger_auto_schema(
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            required=['username', 'password'],
-            properties={
-                'username': openapi.Schema(type=openapi.TYPE_STRING, description='Username'),
-                'password': openapi.Schema(type=openapi.TYPE_STRING, description='Password'),
-            },
-        ),
-        responses={200: 'Login successful', 401: 'Invalid credentials'},
-    )
-    # A function to validate user data
+    # A function to validate user data (its request and responses are documented in
+    # e_commerce_api/docs_urls.py). The serializer checks the credentials and
+    # returns the active user, so the password is hashed only once per login
     def post(self, request, *args, **kwargs):
-        serializer = self.serializer_class(data=request.data)
+        serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        user = authenticate(username=serializer.validated_data['username'],
-                            password=serializer.validated_data['password'])
-
-        # Check if user is active and login the user and then return the data of the user
-        if user and user.is_active:
-            login(request, user)
-            return Response({
-                'id': user.id,
-                'username': user.username,
-                'message': 'Login successful'
-            }, status=status.HTTP_200_OK)
-        return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+        user = serializer.validated_data['user']
+
+        # Login the user and then return the data of the user
+        login(request, user)
+        data = {
+            'id': user.id,
+            'username': user.username,
+            'message': 'Login successful'
+        }
+        if serializer.validated_data['jwt']:
+            data.update(serializer.get_tokens(user))
+        return Response(data, status=status.HTTP_200_OK)
 
     
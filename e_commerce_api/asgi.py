@@ -13,4 +13,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'e_commerce_api.settings')
 
+# Catalog reads are served by async views under ASGI, unless ASYNC_VIEWS=False
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+# Under ASGI the synchronous code of each request runs in a thread of its own, and a
+# persistent connection would be left behind with it: connections are closed after each
+# request instead (the postgres-pool profile reuses them)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
 application = get_asgi_application()
@@ -0,0 +1,68 @@
+# Importing modules, functions and classes
+from django.urls import path
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+from accounts.views import UserLoginView
+
+from .views import SchemaView
+
+# API documentation URLs, imported on the first request for them (see urls.py)
+
+# The login request, which drf_yasg cannot infer from an APIView. Described here rather
+# than on the view, so that views do not import drf_yasg.
+swagger_auto_schema(
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['username', 'password'],
+        properties={
+            'username': openapi.Schema(type=openapi.TYPE_STRING, description='Username'),
+            'password': openapi.Schema(type=openapi.TYPE_STRING, description='Password'),
+            'jwt': openapi.Schema(type=openapi.TYPE_BOOLEAN,
+                                  description='Also return a refresh and access token'),
+        },
+    ),
+    responses={200: 'Login successful', 401: 'Invalid credentials'},
+)(UserLoginView.post)
+
+# Swagger UI
+api_info = openapi.Info(
+    title="E-Commerce Product API",
+    default_version='v1',
+    description="API documentation",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="mimshach.e@gmail.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Generates the schema served by SchemaView (see schema.py). The UIs below only render
+# their page, which loads the schema from SPEC_URL.
+schema_view = get_schema_view(
+    api_info,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+
+# Serves the precomputed schema for the UIs' own spec URL, ?format=openapi, which
+# older pages and links still request
+def spec_or_ui(ui_view):
+    schema = SchemaView.as_view()
+
+    def view(request, *args, **kwargs):
+        if request.GET.get('format') == 'openapi':
+            return schema(request)
+        return ui_view(request, *args, **kwargs)
+    return view
+
+
+urlpatterns = [
+    # Swager UI URLs
+    path('swagger<format>/', SchemaView.as_view(), name='schema-json'),
+    path('swagger/', spec_or_ui(schema_view.with_ui('swagger',
+         cache_timeout=0)), name='schema-swagger-ui'),
+    path('redoc/', spec_or_ui(schema_view.with_ui('redoc',
+         cache_timeout=0)), name='schema-redoc'),
+]
@@ -0,0 +1,100 @@
+# Importing modules, functions and classes
+import bisect
+import threading
+from collections import Counter, defaultdict
+
+# Request metrics of this process, per view, in Prometheus text format.
+# Histograms have fixed buckets, so recording a request is a few additions under a lock
+# and memory stays bounded by the number of views. Every process of a deployment keeps
+# its own metrics, which Prometheus sums when scraping each of them.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Histogram name: (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Wall time of requests', SECONDS_BUCKETS),
+    'http_request_db_seconds': ('Time spent in SQL queries per request', SECONDS_BUCKETS),
+    'http_request_app_seconds': ('Time spent in views, serializers and middleware per '
+                                 'request, without SQL queries and rendering', SECONDS_BUCKETS),
+    'http_request_render_seconds': ('Time spent rendering responses', SECONDS_BUCKETS),
+    'http_request_db_queries': ('SQL queries per request', QUERY_BUCKETS),
+    'http_response_size_bytes': ('Size of response bodies', SIZE_BUCKETS),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket, the last for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                           for name, (_, buckets) in HISTOGRAMS.items()}
+        self.requests = Counter()
+        self.slow_queries = Counter()
+
+    # Records a request; values missing from `observations` (e.g. the size of a
+    # streamed response) are left out of their histogram
+    def record(self, view, status, slow_queries=0, **observations):
+        with self.lock:
+            self.requests[view, status] += 1
+            self.slow_queries[view] += slow_queries
+            for name, value in observations.items():
+                if value is not None:
+                    self.histograms[name][view].observe(value)
+
+    def reset(self):
+        with self.lock:
+            for histograms in self.histograms.values():
+                histograms.clear()
+            self.requests.clear()
+            self.slow_queries.clear()
+
+    def as_prometheus(self):
+        lines = []
+        with self.lock:
+            lines += ['# HELP http_requests_total Requests served',
+                      '# TYPE http_requests_total counter']
+            for (view, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{view="{escape_label(view)}",status="{status}"}} {count}')
+
+            lines += ['# HELP http_request_slow_queries_total SQL queries slower than the slow query threshold',
+                      '# TYPE http_request_slow_queries_total counter']
+            for view, count in sorted(self.slow_queries.items()):
+                lines.append(f'http_request_slow_queries_total{{view="{escape_label(view)}"}} {count}')
+
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = f'view="{escape_label(view)}"'
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}}} {format_number(histogram.sum)}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
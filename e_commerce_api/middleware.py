@@ -0,0 +1,212 @@
+# Importing modules, functions and classes
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import SAFE_METHODS
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import request_metrics
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+# The middleware below run as they are called: as coroutines under ASGI, so async views
+# are not switched to a thread and back per middleware, and as functions under WSGI.
+
+
+# Static Files Middleware: WhiteNoise, serving its files in a thread under ASGI
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+# Replica Middleware: pins requests to the primary database so users read their own
+# writes. A request that writes (any method but GET, HEAD and OPTIONS) reads from the
+# primary, and sets a cookie that keeps the next REPLICA_PIN_SECONDS of requests of the
+# client on it too, while the replicas catch up.
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_primary(self.pinned(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with use_primary(self.pinned(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def pinned(self, request):
+        return request.method not in SAFE_METHODS or settings.REPLICA_PIN_COOKIE in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+# Times the SQL queries of a request, on every database, logging those slower than
+# SLOW_QUERY_MS
+class QueryTimer:
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.seconds = 0
+        self.slow = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.seconds += duration
+            if duration * 1000 >= settings.SLOW_QUERY_MS:
+                self.slow += 1
+                logger.warning(json.dumps({
+                    'event': 'slow_query', 'view': view_name(self.request),
+                    'database': context['connection'].alias,
+                    'ms': round(duration * 1000, 3), 'sql': sql[:2000]}))
+
+
+# The QueryTimer of the request being served. Async views run their queries in threads,
+# which get a copy of the context of the request.
+_query_timer = ContextVar('query_timer', default=None)
+
+
+# Installed on every database connection: passes its queries to the QueryTimer of the
+# current request, if any
+def time_query(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='install_query_timer')
+
+
+# Instrumentation Middleware: measures each request - wall time, SQL queries and their
+# time, rendering time and response size - and reports them in a Server-Timing header,
+# a log line and the request metrics (see metrics.py). Time that is neither SQL nor
+# rendering is counted as "app": views, serializers and the other middleware.
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, timer = time.perf_counter(), QueryTimer(request)
+        request._render_seconds = None
+        token = _query_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        return self.report(request, response, time.perf_counter() - start, timer)
+
+    async def __acall__(self, request):
+        start, timer = time.perf_counter(), QueryTimer(request)
+        request._render_seconds = None
+        token = _query_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        return self.report(request, response, time.perf_counter() - start, timer)
+
+    def report(self, request, response, total, timer):
+        render = request._render_seconds
+        app = max(total - timer.seconds - (render or 0), 0)
+        size = None if response.streaming else len(response.content)
+        view = view_name(request)
+        request_metrics.record(
+            view, response.status_code, slow_queries=timer.slow,
+            http_request_duration_seconds=total, http_request_db_seconds=timer.seconds,
+            http_request_app_seconds=app, http_request_render_seconds=render,
+            http_request_db_queries=timer.count, http_response_size_bytes=size)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timer.seconds * 1000:.3f};desc="{timer.count} queries"',
+                f'app;dur={app * 1000:.3f}',
+                *([f'render;dur={render * 1000:.3f}'] if render is not None else []),
+                f'total;dur={total * 1000:.3f}',
+            ])
+        logger.info(json.dumps({
+            'event': 'request', 'view': view, 'method': request.method, 'path': request.path,
+            'status': response.status_code, 'ms': round(total * 1000, 3),
+            'db_ms': round(timer.seconds * 1000, 3), 'queries': timer.count,
+            'app_ms': round(app * 1000, 3),
+            'render_ms': round(render * 1000, 3) if render is not None else None, 'bytes': size}))
+        return response
+
+    # Runs before a response is rendered, e.g. a DRF Response to JSON
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
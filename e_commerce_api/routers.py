@@ -0,0 +1,117 @@
+# Importing modules, functions and classes
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+# Read replicas.
+# Reads go to a replica of DATABASE_REPLICAS, writes to the primary ('default'). Reads
+# stay on the primary while a request is pinned to it (see ReplicaMiddleware), inside a
+# transaction of the primary, and when no replica is caught up.
+# How far behind a replica is comes from the catalog: the oldest product, category or
+# discount change of the primary the replica does not have yet. Ratings are covered by
+# the rating aggregates they update on their product; wishlists are only read by their
+# own user, whom a write pins to the primary. It is checked at most every
+# REPLICA_LAG_CHECK_INTERVAL seconds per process, and a replica more than
+# REPLICA_MAX_LAG seconds behind, or unreachable, is skipped until the next check.
+
+# Models whose update times tell how far behind a replica is
+WATERMARK_MODELS = ['products.Product', 'products.Category', 'products.Discount']
+
+_pinned = ContextVar('replica_pinned', default=False)
+_replica_read = ContextVar('replica_read', default=False)
+
+
+# Sends every read of the block to the primary (or lets them go to replicas, with
+# pinned=False), and resets whether a replica was read from
+@contextmanager
+def use_primary(pinned=True):
+    pinned_token, read_token = _pinned.set(pinned), _replica_read.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _replica_read.reset(read_token)
+
+
+# Whether a replica was read from in the current use_primary() block, i.e. request
+def read_from_replica():
+    return _replica_read.get()
+
+
+# Seconds the replica is behind the primary, or None if it cannot be reached
+def replica_lag(alias):
+    lags = []
+    for label in WATERMARK_MODELS:
+        model = apps.get_model(label)
+        try:
+            newest = model.objects.using(alias).aggregate(newest=Max('updated_at'))['newest']
+        except DatabaseError:
+            return None
+        missing = model.objects.using(DEFAULT_DB_ALIAS)
+        if newest is not None:
+            missing = missing.filter(updated_at__gt=newest)
+        oldest = missing.aggregate(oldest=Min('updated_at'))['oldest']
+        lags.append(0 if oldest is None else max((timezone.now() - oldest).total_seconds(), 0))
+    return max(lags)
+
+
+# Which replicas are caught up, as of their last check in this process
+class ReplicaHealth:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+        self.available = {}
+
+    def available_replicas(self):
+        replicas = []
+        for alias in settings.DATABASE_REPLICAS:
+            now = time.monotonic()
+            due = now - self.checked.get(alias, float('-inf')) >= settings.REPLICA_LAG_CHECK_INTERVAL
+            # one thread checks while the others keep the last result, a replica never
+            # checked yet counting as unavailable
+            if due and self.lock.acquire(blocking=False):
+                try:
+                    lag = replica_lag(alias)
+                    self.available[alias] = lag is not None and lag <= settings.REPLICA_MAX_LAG
+                    self.checked[alias] = now
+                finally:
+                    self.lock.release()
+            if self.available.get(alias):
+                replicas.append(alias)
+        return replicas
+
+
+replica_health = ReplicaHealth()
+
+
+# Replica Router
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS or _pinned.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        replicas = replica_health.available_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        _replica_read.set(True)
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # Objects read from a replica can be related to objects of the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
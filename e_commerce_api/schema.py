@@ -0,0 +1,150 @@
+# Importing modules, functions and classes
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+
+# Precomputed OpenAPI schema for the API docs.
+# Introspecting every view and serializer takes drf_yasg hundreds of milliseconds, so the
+# schema is generated once per version of the code and stored in SCHEMA_DIR as JSON and
+# YAML files, each with a gzipped copy. The files are named after a fingerprint of the
+# project's source files and of the packages the schema depends on: a deploy that
+# changes the code looks for new files, and generates them on the first request for
+# the schema if the generate_schema command has not already done so at build time.
+
+SCHEMA_FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+# Packages whose version changes the schema
+SCHEMA_PACKAGES = ['Django', 'djangorestframework', 'drf-yasg', 'djoser', 'djangorestframework-simplejwt']
+
+
+# A schema in one format, with its gzipped copy. Its validators are strong: the schema
+# is the same bytes for the same fingerprint, and so is its copy, which is compressed
+# without a timestamp.
+class SchemaDocument:
+    def __init__(self, content, gzipped, content_type):
+        self.content = content
+        self.gzipped = gzipped
+        self.content_type = content_type
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        self.gzip_etag = f'{self.etag[:-1]}-gzip"'
+
+
+# Returns a digest of the Python files of the project's apps and URLconf, and of the
+# versions of the packages the schema depends on. Computed once per process.
+_fingerprint = None
+
+
+def code_fingerprint():
+    global _fingerprint
+    if _fingerprint is None:
+        base_dir = Path(settings.BASE_DIR)
+        directories = {Path(app.path) for app in apps.get_app_configs()
+                       if Path(app.path).is_relative_to(base_dir)}
+        directories.add(base_dir / settings.ROOT_URLCONF.split('.')[0])
+        digest = hashlib.sha256()
+        for directory in sorted(directories):
+            for source in sorted(directory.rglob('*.py')):
+                digest.update(str(source.relative_to(base_dir)).encode())
+                digest.update(source.read_bytes())
+        for package in SCHEMA_PACKAGES:
+            try:
+                digest.update(f'{package}=={version(package)}'.encode())
+            except PackageNotFoundError:
+                pass
+        digest.update(repr(getattr(settings, 'SWAGGER_SETTINGS', None)).encode())
+        _fingerprint = digest.hexdigest()[:16]
+    return _fingerprint
+
+
+# Generates the schema in every format, as the docs views would for an anonymous
+# request, but without a host: the UIs then call the API on the host serving them
+def generate_schema():
+    from django.test import RequestFactory
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from rest_framework.request import Request
+
+    from .docs_urls import api_info, schema_view
+
+    generator = schema_view.generator_class(api_info, url='')
+    request = Request(RequestFactory().get('/swagger.json'))
+    schema = generator.get_schema(request, public=True)
+    codecs = {'.json': OpenAPICodecJson, '.yaml': OpenAPICodecYaml}
+    documents = {}
+    for extension, content_type in SCHEMA_FORMATS.items():
+        content = codecs[extension](validators=[]).encode(schema)
+        documents[extension] = SchemaDocument(content, gzip.compress(content, mtime=0), content_type)
+    return documents
+
+
+def schema_path(directory, fingerprint, extension):
+    return Path(directory) / f'openapi-{fingerprint}{extension}'
+
+
+# Reads the schema files of a fingerprint, or returns None if any of them is missing
+def read_schema(directory, fingerprint):
+    documents = {}
+    for extension, content_type in SCHEMA_FORMATS.items():
+        path = schema_path(directory, fingerprint, extension)
+        try:
+            documents[extension] = SchemaDocument(
+                path.read_bytes(), path.with_name(path.name + '.gz').read_bytes(), content_type)
+        except FileNotFoundError:
+            return None
+    return documents
+
+
+# Writes the schema files of a fingerprint, each one atomically, and removes the files
+# of other fingerprints. Returns the paths written.
+def write_schema(directory, fingerprint, documents):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for extension, document in documents.items():
+        path = schema_path(directory, fingerprint, extension)
+        for target, content in [(path, document.content),
+                                (path.with_name(path.name + '.gz'), document.gzipped)]:
+            handle, temporary = tempfile.mkstemp(dir=directory, prefix='.openapi-')
+            with os.fdopen(handle, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, target)
+            written.append(target)
+    for stale in directory.glob('openapi-*'):
+        if stale not in written:
+            stale.unlink(missing_ok=True)
+    return written
+
+
+# Returns the schema documents of the current code, by format: from memory, from
+# SCHEMA_DIR, or generated and stored there. A read-only SCHEMA_DIR (e.g. on a
+# serverless platform) keeps the generated schema in memory only.
+_documents = {}
+_lock = threading.Lock()
+
+
+def get_schema_documents():
+    fingerprint = code_fingerprint()
+    documents = _documents.get(fingerprint)
+    if documents is None:
+        with _lock:
+            documents = _documents.get(fingerprint)
+            if documents is None:
+                documents = read_schema(settings.SCHEMA_DIR, fingerprint)
+                if documents is None:
+                    documents = generate_schema()
+                    try:
+                        write_schema(settings.SCHEMA_DIR, fingerprint, documents)
+                    except OSError:
+                        pass
+                _documents.clear()
+                _documents[fingerprint] = documents
+    return documents
@@ -12,17 +12,25 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 
-# import dj_database_url
+from .database import database_settings
+
 # import django_heroku
-from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Lean startup, for serverless deployments (see vercel.json) where every cold start
+# imports the project anew: settings come from the environment only, without a .env
+# file, and packages the API does not use are kept from being imported. See startup.py.
+LEAN_STARTUP = os.getenv('LEAN_STARTUP', 'False').lower() == 'true'
+
 # Load environment variables from .env file
-load_dotenv()
+if not LEAN_STARTUP:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -70,6 +78,13 @@ INSTALLED_APPS = [
 
 ]
 
+if LEAN_STARTUP:
+    # The API docs are served by drf_yasg, whose package imports pkg_resources: it is
+    # imported with the docs instead (see urls.py), and only its templates and static
+    # files are set up below. django-rest-swagger is not used.
+    INSTALLED_APPS.remove('rest_framework_swagger')
+    INSTALLED_APPS.remove('drf_yasg')
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -98,10 +113,15 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME_LATE_USER': timedelta(days=30),
 }
 
+# How long reserved stock is held before it is released back to the catalog
+STOCK_RESERVATION_HOLD = timedelta(minutes=int(os.getenv('STOCK_RESERVATION_MINUTES', '15')))
+
 
+# The docs load the precomputed schema (see schema.py)
 SWAGGER_SETTINGS = {
-    'DEFAULT_INFO': 'e_commerce_api.urls.api_info',
+    'DEFAULT_INFO': 'e_commerce_api.docs_urls.api_info',
     'USE_SESSION_AUTH': False,
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
     'DEFAULT_FIELD_INSPECTORS': [
         'drf_yasg.inspectors.CamelCaseJSONFilter',
         'drf_yasg.inspectors.InlineSerializerInspector',
@@ -114,10 +134,20 @@ SWAGGER_SETTINGS = {
     ],
 }
 
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# Where the precomputed schema is stored, and how long clients may cache it for
+SCHEMA_DIR = Path(os.getenv('SCHEMA_DIR', BASE_DIR / 'cache' / 'schema'))
+SCHEMA_MAX_AGE = int(os.getenv('SCHEMA_MAX_AGE', '3600'))
+
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'e_commerce_api.middleware.StaticFilesMiddleware',
+    'e_commerce_api.middleware.InstrumentationMiddleware',
+    'e_commerce_api.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -126,6 +156,31 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation, see middleware.py. Queries slower than SLOW_QUERY_MS are logged
+# as warnings, and a log line per request is written at REQUEST_LOG_LEVEL=INFO.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'e_commerce_api.middleware': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+# Serve the hot catalog reads with native async views (see products/async_views.py).
+# On by default under ASGI, see asgi.py; the views work under WSGI too, where each
+# request runs them in an event loop of its own.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
 ROOT_URLCONF = 'e_commerce_api.urls'
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
@@ -153,38 +208,51 @@ WSGI_APPLICATION = 'e_commerce_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Selected by DATABASE_URL and DB_PROFILE, see database.py
+DATABASES = database_settings(BASE_DIR)
+
+# Reads go to the replicas of DATABASE_REPLICA_URLS, see routers.py
+DATABASE_ROUTERS = ['e_commerce_api.routers.ReplicaRouter']
 
-# DATABASES = {
-#     'default': dj_database_url.config(
-#         default=os.getenv(
-#             'DATABASE_URL', 'postgres://localhost/e_commerce_db'),
-#         conn_max_age=600
-#     )
-# }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
 
-# DATABASE_URL = os.getenv('DATABASE_URL', 'postgres://localhost/e_commerce_db')
+# Seconds a client reads from the primary after a write
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
 
+REPLICA_PIN_COOKIE = 'use_primary'
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('DB_NAME'),
-#         'USER': os.getenv('DB_USER'),
-#         'PASSWORD': os.getenv('DB_PASSWORD'),
-#         'HOST': os.getenv('DB_HOST', 'localhost'),
-#         'PORT': os.getenv('DB_PORT', '5432'),
-#     }
-# }
+# Replicas further behind the primary than this many seconds are not read from
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
 
-# # Heroku PostgreSQL database
-# db_from_env = dj_database_url.config()
-# DATABASES['default'].update(db_from_env)
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '5'))
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The catalog cache holds responses of anonymous product and category reads. It is
+# in-memory per process by default; CATALOG_CACHE=file shares it between the processes
+# of a host through CATALOG_CACHE_DIR.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+if os.getenv('CATALOG_CACHE') == 'file':
+    CACHES['catalog'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CATALOG_CACHE_DIR', str(BASE_DIR / 'cache' / 'catalog')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+# Longest time, in seconds, a catalog response is cached for
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
 
 
 # Password validation
@@ -225,6 +293,30 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+if LEAN_STARTUP:
+    # found without importing drf_yasg
+    DRF_YASG_DIR = Path(find_spec('drf_yasg').origin).parent
+    TEMPLATES[0]['DIRS'].append(DRF_YASG_DIR / 'templates')
+    STATICFILES_DIRS = [DRF_YASG_DIR / 'static']
+
+# Uploaded product images and their variants
+MEDIA_URL = 'media/'
+MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', BASE_DIR / 'media'))
+
+# Threads resizing uploaded product images in the background. With
+# IMAGE_PROCESSING_EAGER the variants are generated in the request, after its commit.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+IMAGE_PROCESSING_EAGER = os.getenv('IMAGE_PROCESSING_EAGER', 'False').lower() == 'true'
+
+# Resumable image uploads: chunks are kept in UPLOAD_DIR until the image is assembled
+UPLOAD_DIR = Path(os.getenv('UPLOAD_DIR', BASE_DIR / 'uploads'))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+UPLOAD_EXPIRY = timedelta(hours=int(os.getenv('UPLOAD_EXPIRY_HOURS', '24')))
+
+# Stored image files no image refers to are swept once older than this
+MEDIA_SWEEP_GRACE = timedelta(minutes=int(os.getenv('MEDIA_SWEEP_GRACE_MINUTES', '60')))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,53 @@
+# Importing modules, functions and classes
+import json
+import os
+import sys
+import time
+
+# Cold start measurements.
+# `python -m e_commerce_api.startup [path]` starts the project in a fresh interpreter,
+# as a serverless function does on a cold start, and prints as JSON how long each phase
+# took: loading the settings, django.setup() (importing and configuring every app),
+# building the request handler (its middleware) and loading the URLconf to resolve a
+# path. The startup_profile command runs it with `python -X importtime` for the import
+# time of every module.
+
+# Modules imported only once their URLs are first requested, see urls.py (drf_yasg is
+# imported by the default configuration's INSTALLED_APPS)
+LAZY_MODULES = ['e_commerce_api.docs_urls', 'drf_yasg', 'djoser.urls', 'djoser.views']
+
+
+def measure_startup(path='/api/products/'):
+    seconds = {}
+    start = last = time.perf_counter()
+
+    def phase(name):
+        nonlocal last
+        now = time.perf_counter()
+        seconds[name] = round(now - last, 4)
+        last = now
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'e_commerce_api.settings')
+    import django
+    from django.conf import settings
+    lean = settings.LEAN_STARTUP
+    phase('settings')
+
+    django.setup(set_prefix=False)
+    phase('setup')
+
+    from django.core.handlers.wsgi import WSGIHandler
+    WSGIHandler()
+    phase('handler')
+
+    from django.urls import resolve
+    match = resolve(path)
+    phase('urls')
+
+    seconds['total'] = round(time.perf_counter() - start, 4)
+    return {'seconds': seconds, 'lean': lean, 'view': match.view_name, 'module_count': len(sys.modules),
+            'lazy_modules_loaded': [module for module in LAZY_MODULES if module in sys.modules]}
+
+
+if __name__ == '__main__':
+    print(json.dumps(measure_startup(*sys.argv[1:])))
@@ -0,0 +1,53 @@
+# Importing modules, functions and classes
+import gzip
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from . import schema
+
+# Testing the precomputed schema of the API docs
+
+
+class SchemaTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SCHEMA_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory.name
+        schema._documents.clear()
+        self.addCleanup(schema._documents.clear)
+
+    def test_schema_generated_once_and_served_with_validators(self):
+        with mock.patch.object(schema, 'generate_schema', wraps=schema.generate_schema) as generate:
+            response = self.client.get('/swagger.json/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn(b'"/api/products/"', response.content)
+            etag = response['ETag']
+            self.assertFalse(etag.startswith('W/'))
+
+            compressed = self.client.get('/swagger.json/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(compressed['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(compressed.content), response.content)
+            self.assertNotEqual(compressed['ETag'], etag)
+
+            not_modified = self.client.get('/swagger.json/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(self.client.get('/swagger/?format=openapi').content, response.content)
+            self.assertEqual(self.client.get('/swagger.yaml/')['Content-Type'], 'application/yaml')
+            self.assertEqual(generate.call_count, 1)
+
+        # stored for the next process, until the code changes
+        call_command('generate_schema', '--check', stdout=StringIO())
+        with mock.patch.object(schema, '_fingerprint', 'changed'):
+            with self.assertRaises(CommandError):
+                call_command('generate_schema', '--check', stdout=StringIO())
+            call_command('generate_schema', stdout=StringIO())
+            call_command('generate_schema', '--check', stdout=StringIO())
+        self.assertEqual(len(list(schema.Path(self.directory).glob('openapi-*'))), 4)
@@ -0,0 +1,28 @@
+# Importing modules, functions and classes
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Seconds django.setup() and resolving a URL may take on a cold start of the lean
+# configuration; about 0.5s on a developer machine
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', '2'))
+
+# Testing the cold start of the lean configuration, in a fresh interpreter
+
+
+class StartupTestCase(SimpleTestCase):
+    def test_lean_cold_start(self):
+        run = subprocess.run([sys.executable, '-m', 'e_commerce_api.startup', '/api/products/'],
+                             env={**os.environ, 'LEAN_STARTUP': 'True'}, cwd=settings.BASE_DIR,
+                             capture_output=True, text=True)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        result = json.loads(run.stdout.strip().splitlines()[-1])
+        self.assertTrue(result['lean'])
+        self.assertEqual(result['view'], 'products-list')
+        # the docs and Djoser are only imported once requested
+        self.assertEqual(result['lazy_modules_loaded'], [])
+        self.assertLess(result['seconds']['setup'] + result['seconds']['urls'], STARTUP_BUDGET)
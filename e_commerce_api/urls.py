@@ -14,44 +14,38 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
+from django.urls import include, path, re_path
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
-# Swagger UI
-schema_view = get_schema_view(
-    openapi.Info(
-        title="E-Commerce Product API",
-        default_version='v1',
-        description="API documentation",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="mimshach.e@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from .views import MetricsView
+
+
+# Includes the URLs of a module without importing it: the module is imported when a
+# request first reaches its prefix, or a URL is first reversed. Keeps the API docs and
+# Djoser, and everything they import, out of cold starts.
+def lazy_include(module):
+    return module, None, None
+
 
 urlpatterns = [
     # JWT Token Authentication URLs
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    # Swager UI URLs
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0),
-         name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger',
-         cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc',
-         cache_timeout=0), name='schema-redoc'),
+    # Swager UI URLs, see docs_urls.py. The lookahead routes the docs there without
+    # taking part of the path.
+    re_path(r'^(?=swagger|redoc)', lazy_include('e_commerce_api.docs_urls')),
 
     # Admin URL
     path('admin/', admin.site.urls),
 
+    # Request metrics URL, for Prometheus
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
     # Account URL
     path('api/', include('accounts.urls')),
 
@@ -59,7 +53,10 @@ urlpatterns = [
     path('api/', include('products.urls')),
 
     # Djoser URL
-    path('auth/', include('djoser.urls')),
-    path('auth/', include('djoser.urls.jwt')),
+    path('auth/', lazy_include('djoser.urls')),
+    path('auth/', lazy_include('djoser.urls.jwt')),
 
 ]
+
+# Serves uploaded media in development (static() does nothing unless DEBUG is on)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,57 @@
+# Importing modules, functions and classes
+import re
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework import permissions
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .metrics import request_metrics
+from .schema import get_schema_documents
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# Metrics View: the request metrics of this process, in the Prometheus text format
+
+
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+    swagger_schema = None
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(request_metrics.as_prometheus(),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Schema View: the precomputed OpenAPI schema (see schema.py), gzipped for clients that
+# accept it, with a strong ETag. The schema only changes with a deploy, so clients and
+# CDNs may keep it for SCHEMA_MAX_AGE seconds, and revalidate it after.
+
+
+class SchemaView(View):
+    http_method_names = ['get', 'head']
+
+    def get(self, request, format='.json'):
+        documents = get_schema_documents()
+        if format not in documents:
+            raise Http404(f'No schema in the {format} format.')
+        document = documents[format]
+        if ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')):
+            content, etag = document.gzipped, document.gzip_etag
+            headers = {'Content-Encoding': 'gzip'}
+        else:
+            content, etag = document.content, document.etag
+            headers = {}
+        headers.update({'ETag': etag, 'Vary': 'Accept-Encoding',
+                        'Cache-Control': f'public, max-age={settings.SCHEMA_MAX_AGE}'})
+        response = HttpResponse(headers=headers)
+        conditional = get_conditional_response(request, etag=etag, response=response)
+        if conditional is not response:
+            return conditional
+        response.content = content
+        response['Content-Type'] = document.content_type
+        return response
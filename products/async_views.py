@@ -0,0 +1,305 @@
+# Importing modules, functions and classes
+import math
+from abc import abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils import timezone
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from .cache import (amay_be_stale, aresponse_cache_key, cache_stats,
+                    conditional_response, get_cache, validator_headers)
+from .models import Discount, WishList
+from .views import (DetailCategoryView, DetailProductView, ListCategoryView,
+                    ListProductView, RatingView)
+
+# Async catalog views.
+# Native async versions of the hot catalog reads, served when ASYNC_VIEWS is on (as it
+# is under ASGI, see asgi.py). Each one is configured by the DRF view it stands in for -
+# serializer, filters, pagination and permissions - and gives the same responses,
+# cached responses and validators included, but reads the database and the cache with
+# the async ORM and cache APIs, so a request waiting on them does not hold a thread.
+# Authentication, permissions and filter backends are synchronous in DRF, and run in a
+# thread in one hop each; so does cursor pagination. Other methods (OPTIONS, and POST
+# on ratings) are handed to the DRF view in a thread.
+
+
+class AsyncAPIView(View):
+    # The DRF view this view stands in for, and its actions if it is a viewset
+    view_class = None
+    actions = None
+    http_method_names = ['get', 'head', 'options']
+
+    # Views standing in for a DRF view must implement every abstract method: a missing
+    # one fails when the class is defined, not on its first request
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.view_class is not None:
+            missing = [name for name in dir(cls)
+                       if getattr(getattr(cls, name, None), '__isabstractmethod__', False)]
+            if missing:
+                raise TypeError(f'{cls.__name__} does not implement {", ".join(missing)}')
+
+    # The view skips CSRF checks as DRF views do, leaving them to session authentication,
+    # and is documented as the DRF view by the schema
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = csrf_exempt(super().as_view(**initkwargs))
+        view.cls, view.initkwargs = cls.view_class, {}
+        if cls.actions:
+            view.actions = cls.actions
+        return view
+
+    def drf_view(self):
+        if self.actions:
+            return self.view_class.as_view(self.actions)
+        return self.view_class.as_view()
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.drf_view())(request, *args, **kwargs)
+
+    options = delegate
+
+    async def get(self, request, *args, **kwargs):
+        view = self.view_class()
+        if self.actions:
+            view.action_map = self.actions
+        view.args, view.kwargs = args, kwargs
+        view.headers = view.default_response_headers
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        try:
+            await sync_to_async(view.initial)(request, *args, **kwargs)
+            response = await self.respond(view, request, kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        view.response = view.finalize_response(request, response, *args, **kwargs)
+        return view.response
+
+    # Returns the response to a GET, once the DRF view has authenticated the request
+    @abstractmethod
+    async def respond(self, view, request, kwargs):
+        raise NotImplementedError
+
+    async def get_serializer(self, view, instance, many=False):
+        return view.get_serializer(instance, many=many)
+
+    # The view's queryset through its filter backends, filtered once per request
+    async def filtered_queryset(self, view):
+        if not hasattr(self, '_queryset'):
+            self._queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+        return self._queryset
+
+    async def list(self, view, request):
+        queryset = await self.filtered_queryset(view)
+        objects, paginated = await paginate(view, queryset)
+        serializer = await self.get_serializer(view, objects, many=True)
+        if paginated:
+            return view.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    async def retrieve(self, view, request):
+        queryset = await self.filtered_queryset(view)
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        try:
+            instance = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        view.check_object_permissions(request, instance)
+        serializer = await self.get_serializer(view, instance)
+        return Response(serializer.data)
+
+
+# Fetches the page of a queryset the view's paginator asks for, returning the objects and
+# whether they are a page. Page numbers are counted and fetched with the async ORM.
+async def paginate(view, queryset):
+    paginator = view.paginator
+    if paginator is None:
+        return [obj async for obj in queryset], False
+    if not isinstance(paginator, PageNumberPagination):
+        page = await sync_to_async(view.paginate_queryset)(queryset)
+        return (page, True) if page is not None else ([obj async for obj in queryset], False)
+
+    request = view.request
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return [obj async for obj in queryset], False
+    paginator.request = request
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    page.object_list = [obj async for obj in page.object_list]
+    if django_paginator.num_pages > 1 and paginator.template is not None:
+        paginator.display_page_controls = True
+    paginator.page = page
+    return page.object_list, True
+
+
+# Async Cached View: the response cache and validators of the catalog (see cache.py)
+
+
+class AsyncCachedView(AsyncAPIView):
+    cache_namespace = None
+    # Whether the view retrieves one object rather than listing them
+    detail = False
+
+    async def get_cache_timeout(self):
+        return settings.CATALOG_CACHE_TIMEOUT
+
+    # Returns (state, last_modified), as ConditionalGetMixin.get_validators
+    @abstractmethod
+    async def get_validators(self, view, request):
+        raise NotImplementedError
+
+    async def get_cached_validators(self, view, request):
+        if request.user.is_authenticated:
+            return await self.get_validators(view, request)
+        key = await aresponse_cache_key(self.cache_namespace, f'{self.view_class.__name__}:validators',
+                                        view.kwargs, request.query_params)
+        validators = await get_cache().aget(key)
+        if validators is None:
+            validators = await self.get_validators(view, request)
+            timeout = await self.get_cache_timeout()
+            if timeout > 0 and not await amay_be_stale(self.cache_namespace):
+                await get_cache().aset(key, validators, timeout)
+        return validators
+
+    async def respond(self, view, request, kwargs):
+        view_name = self.view_class.__name__
+        headers = {}
+        if view.has_validators():
+            state, last_modified = await self.get_cached_validators(view, request)
+            headers = validator_headers(view_name, request, kwargs, state, last_modified)
+            conditional = conditional_response(request, headers, last_modified)
+            if conditional is not None:
+                return conditional
+
+        key = None
+        if not request.user.is_authenticated:
+            key = await aresponse_cache_key(self.cache_namespace, view_name, kwargs, request.query_params)
+            data = await get_cache().aget(key)
+            cache_stats.record(view_name, hit=data is not None)
+            if data is not None:
+                return Response(data, headers={'X-Cache': 'HIT', **headers})
+
+        response = await self.respond_fresh(view, request)
+        if response.status_code == 200:
+            if key is not None:
+                timeout = await self.get_cache_timeout()
+                if timeout > 0 and not await amay_be_stale(self.cache_namespace):
+                    await get_cache().aset(key, response.data, timeout)
+                response['X-Cache'] = 'MISS'
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    async def respond_fresh(self, view, request):
+        if self.detail:
+            return await self.retrieve(view, request)
+        return await self.list(view, request)
+
+
+# Async Product View: cached no longer than the next discount change, with the wishlist
+# state of the products for ?in_wishlist=true, as ProductCacheMixin
+
+
+class AsyncProductView(AsyncCachedView):
+    cache_namespace = 'products'
+
+    async def get_cache_timeout(self):
+        if not hasattr(self, '_cache_timeout'):
+            timeout = settings.CATALOG_CACHE_TIMEOUT
+            next_change = await Discount.anext_change()
+            if next_change:
+                timeout = min(timeout, math.ceil((next_change - timezone.now()).total_seconds()))
+            self._cache_timeout = timeout
+        return self._cache_timeout
+
+    async def get_validators(self, view, request):
+        products = await self.filtered_queryset(view)
+        discounts = Discount.objects.all()
+        lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+        if lookup is not None:
+            products = products.filter(pk=lookup)
+            discounts = discounts.filter(product=lookup)
+        products = await products.aaggregate(count=Count('id'), updated=Max('updated_at'))
+        discounts = await Discount.astate(discounts)
+        changes = [products['updated'], discounts['updated'], discounts['started'], discounts['ended']]
+        wishlist = None
+        if view.wants_wishlist():
+            wishlist = sorted([product_id async for product_id in WishList.objects.filter(
+                user=request.user).values_list('product_id', flat=True)])
+        last_modified = max(filter(None, changes), default=None) if lookup is not None else None
+        return (products, discounts, wishlist), last_modified
+
+    async def get_serializer(self, view, instance, many=False):
+        if not view.wants_wishlist():
+            return view.get_serializer(instance, many=many)
+        products = instance if many else [instance]
+        wishlist = {product_id async for product_id in WishList.objects.filter(
+            user=view.request.user, product__in=[p.pk for p in products]).values_list('product_id', flat=True)}
+        return view.get_serializer_class()(
+            instance, many=many, context={**view.get_serializer_context(), 'wishlist': wishlist})
+
+
+# Async List Products View
+
+class AsyncListProductView(AsyncProductView):
+    view_class = ListProductView
+
+# Async Detail Products View
+
+class AsyncDetailProductView(AsyncProductView):
+    view_class = DetailProductView
+    detail = True
+
+
+# Async Category View
+
+class AsyncCategoryView(AsyncCachedView):
+    cache_namespace = 'categories'
+
+    async def get_validators(self, view, request):
+        categories = await self.filtered_queryset(view)
+        lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+        if lookup is not None:
+            categories = categories.filter(pk=lookup)
+        categories = await categories.aaggregate(count=Count('id'), updated=Max('updated_at'))
+        return categories, categories['updated'] if lookup is not None else None
+
+# Async List Category View
+
+class AsyncListCategoryView(AsyncCategoryView):
+    view_class = ListCategoryView
+
+# Async Detail Category View
+
+class AsyncDetailCategoryView(AsyncCategoryView):
+    view_class = DetailCategoryView
+    detail = True
+
+
+# Async Rating List View: the ratings of a product, which are not cached. New ratings
+# are posted to the DRF viewset.
+
+class AsyncRatingListView(AsyncAPIView):
+    view_class = RatingView
+    actions = {'get': 'list', 'post': 'create'}
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    post = AsyncAPIView.delegate
+
+    async def respond(self, view, request, kwargs):
+        return await self.list(view, request)
@@ -0,0 +1,166 @@
+# Importing modules, functions and classes
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .cache import invalidate_catalog
+
+# Bulk changes: create, update or delete many rows of a model in one request.
+# A batch is validated as a whole and applied in a single transaction, all or nothing,
+# with one INSERT or UPDATE per batch instead of one save() per row. bulk_create and
+# bulk_update send no signals, so views refresh the search index and the catalog cache
+# themselves in after_write().
+
+MAX_BULK_ITEMS = 5000
+
+
+# Bulk Change View: POST a list of new rows, PATCH a list of changes each with the `id`
+# of its row, DELETE a list of ids. Answers with a result per item, in request order.
+class BulkChangeView(APIView):
+    model = None
+    serializer_class = None
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    # Related fields whose primary keys are resolved in one query per batch
+    preloaded_fields = {}
+    # Field set to the requesting user on created rows
+    owner_field = None
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        validated, invalid = self.validate_items(items)
+        if invalid:
+            return invalid
+
+        objects, related = [], []
+        for data in validated:
+            data, many = self.split_many_to_many(data)
+            if self.owner_field:
+                data[self.owner_field] = request.user
+            objects.append(self.model(**data))
+            related.append(many)
+        with transaction.atomic():
+            try:
+                self.model.objects.bulk_create(objects)
+            except IntegrityError as error:
+                raise serializers.ValidationError({'non_field_errors': [str(error)]})
+            for obj, many in zip(objects, related):
+                for field, values in many.items():
+                    getattr(obj, field).set(values)
+            self.after_write(created=objects)
+        return self.results_response(objects, 'created', status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+
+        with transaction.atomic():
+            # rows are locked until the batch is written, so no concurrent change is lost
+            instances = self.get_queryset().select_for_update().in_bulk(
+                [pk for pk in ids if isinstance(pk, int)])
+            objects = [instances.get(pk) if isinstance(pk, int) else None for pk in ids]
+            validated, invalid = self.validate_items(items, objects)
+            if invalid:
+                return invalid
+
+            # only the fields that change are written, for every row of the batch
+            changed, changed_fields = [], set()
+            now = timezone.now()
+            for instance, data in zip(objects, validated):
+                data, many = self.split_many_to_many(data)
+                fields = {field for field, value in data.items() if getattr(instance, field) != value}
+                for field in fields:
+                    setattr(instance, field, data[field])
+                if fields:
+                    instance.updated_at = now
+                    changed.append(instance)
+                    changed_fields |= fields
+                for field, values in many.items():
+                    getattr(instance, field).set(values)
+            if changed:
+                try:
+                    self.model.objects.bulk_update(
+                        changed, sorted(changed_fields | {'updated_at'}), batch_size=1000)
+                except IntegrityError as error:
+                    raise serializers.ValidationError({'non_field_errors': [str(error)]})
+            self.after_write(updated=changed, changed_fields=changed_fields)
+        return self.results_response(objects, 'updated', status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        with transaction.atomic():
+            instances = self.get_queryset().in_bulk([pk for pk in items if isinstance(pk, int)])
+            errors = [{'index': index, 'status': 'invalid', 'errors': ['Unknown id.']}
+                      for index, pk in enumerate(items)
+                      if not isinstance(pk, int) or pk not in instances]
+            if errors:
+                return Response({'results': errors}, status=status.HTTP_400_BAD_REQUEST)
+            self.get_queryset().filter(pk__in=instances).delete()
+            self.after_write(deleted=list(instances.values()))
+        return Response({'results': [{'index': index, 'id': pk, 'status': 'deleted'}
+                                     for index, pk in enumerate(items)]})
+
+    # Reads the list of items of a request
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise serializers.ValidationError({'non_field_errors': ['Expected a non-empty list.']})
+        if len(items) > MAX_BULK_ITEMS:
+            raise serializers.ValidationError(
+                {'non_field_errors': [f'At most {MAX_BULK_ITEMS} items per request.']})
+        return items
+
+    # Loads the related rows the items refer to, one query per related field
+    def get_serializer_context(self, items):
+        preloaded = {}
+        for field, model in self.preloaded_fields.items():
+            ids = set()
+            for item in items:
+                value = item.get(field) if isinstance(item, dict) else None
+                for pk in (value if isinstance(value, list) else [value]):
+                    if isinstance(pk, int) or (isinstance(pk, str) and pk.isdigit()):
+                        ids.add(int(pk))
+            preloaded[model] = model.objects.in_bulk(ids)
+        return {'request': self.request, 'view': self, 'preloaded': preloaded}
+
+    # Validates every item, with a single serializer whose fields are built once. Returns
+    # the validated data of every item, or a response with every item's result when any
+    # is invalid. When updating, `instances` are the rows of the items, None if unknown.
+    def validate_items(self, items, instances=None):
+        serializer = self.serializer_class(partial=instances is not None,
+                                           context=self.get_serializer_context(items))
+        validated, results = [], []
+        for index, item in enumerate(items):
+            if instances is not None and instances[index] is None:
+                results.append({'index': index, 'status': 'invalid', 'errors': ['Unknown id.']})
+                continue
+            serializer.instance = instances[index] if instances is not None else None
+            try:
+                validated.append(serializer.run_validation(item))
+                results.append({'index': index, 'status': 'valid'})
+            except serializers.ValidationError as error:
+                results.append({'index': index, 'status': 'invalid', 'errors': error.detail})
+        if len(validated) < len(items):
+            return None, Response({'results': results}, status=status.HTTP_400_BAD_REQUEST)
+        return validated, None
+
+    # Separates the many-to-many values of an item, which are set after its row is written
+    def split_many_to_many(self, data):
+        data = dict(data)
+        many = {field.name: data.pop(field.name) for field in self.model._meta.many_to_many
+                if field.name in data}
+        return data, many
+
+    def results_response(self, objects, result, status_code):
+        return Response({'results': [{'index': index, 'id': obj.pk, 'status': result}
+                                     for index, obj in enumerate(objects)]}, status=status_code)
+
+    # Called in the transaction of a batch with the rows it created, updated or deleted
+    def after_write(self, created=(), updated=(), deleted=(), changed_fields=()):
+        invalidate_catalog('products')
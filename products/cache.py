@@ -0,0 +1,222 @@
+# Importing modules, functions and classes
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from e_commerce_api.routers import read_from_replica
+
+# Response cache for anonymous catalog reads.
+# Cached responses are keyed on a namespace version which every write to the catalog
+# bumps, so a write invalidates every page of its namespace at once:
+#   products   - products, their images and discounts (and category changes)
+#   categories - categories
+
+CATALOG_CACHE = 'catalog'
+NAMESPACES = ('products', 'categories')
+
+
+def get_cache():
+    return caches[CATALOG_CACHE]
+
+
+# Returns the current version of a namespace. Versions start from the current time in
+# milliseconds, so a version evicted from the cache never comes back lower than before.
+def namespace_version(namespace):
+    cache = get_cache()
+    key = f'catalog:version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+async def anamespace_version(namespace):
+    cache = get_cache()
+    key = f'catalog:version:{namespace}'
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key)
+    return version
+
+
+# Invalidates every cached response of the given namespaces once the current transaction
+# commits (at once outside of one): a reader between the write and the commit would
+# otherwise cache what it read before the commit under the new version
+def invalidate_catalog(*namespaces):
+    namespaces = namespaces or NAMESPACES
+
+    def bump():
+        cache = get_cache()
+        for namespace in namespaces:
+            key = f'catalog:version:{namespace}'
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, int(time.time() * 1000), None)
+            cache.set(f'catalog:written:{namespace}', time.time(), settings.REPLICA_PIN_SECONDS)
+    transaction.on_commit(bump)
+
+
+# Whether a response of the current request may miss a recent write to a namespace: it
+# was read from a replica, which may not have caught up with the write yet
+def may_be_stale(namespace):
+    return read_from_replica() and get_cache().get(f'catalog:written:{namespace}') is not None
+
+
+async def amay_be_stale(namespace):
+    return read_from_replica() and await get_cache().aget(f'catalog:written:{namespace}') is not None
+
+
+# Returns the non-empty query parameters in a stable order
+def normalized_params(query_params):
+    return sorted((key, value) for key, values in query_params.lists()
+                  for value in values if value != '')
+
+
+def params_fingerprint(kwargs, query_params):
+    return hashlib.sha1(repr((sorted(kwargs.items()), normalized_params(query_params))).encode()).hexdigest()
+
+
+# Builds a cache key from the view, its URL arguments and the normalized query string
+def response_cache_key(namespace, view_name, kwargs, query_params):
+    return (f'catalog:{namespace}:{namespace_version(namespace)}:{view_name}:'
+            f'{params_fingerprint(kwargs, query_params)}')
+
+
+async def aresponse_cache_key(namespace, view_name, kwargs, query_params):
+    return (f'catalog:{namespace}:{await anamespace_version(namespace)}:{view_name}:'
+            f'{params_fingerprint(kwargs, query_params)}')
+
+
+# Hit and miss counters of this process, per view
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def record(self, view_name, hit):
+        with self.lock:
+            (self.hits if hit else self.misses)[view_name] += 1
+
+    def as_dict(self):
+        with self.lock:
+            views = sorted(set(self.hits) | set(self.misses))
+            return {
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'views': {view: {'hits': self.hits[view], 'misses': self.misses[view]}
+                          for view in views},
+            }
+
+
+cache_stats = CacheStats()
+
+
+# Cached Response Mixin: serves GET requests of anonymous users from the catalog cache.
+# Authenticated users always get a fresh response.
+
+
+class CachedResponseMixin:
+    cache_namespace = 'products'
+
+    # Seconds a response may be cached for. Views can lower it, e.g. to the next discount change.
+    def get_cache_timeout(self):
+        return settings.CATALOG_CACHE_TIMEOUT
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        view_name = type(self).__name__
+        key = response_cache_key(self.cache_namespace, view_name, kwargs, request.query_params)
+        data = get_cache().get(key)
+        cache_stats.record(view_name, hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.get_cache_timeout()
+            if timeout > 0 and not may_be_stale(self.cache_namespace):
+                get_cache().set(key, response.data, timeout)
+            response['X-Cache'] = 'MISS'
+        return response
+
+
+# Conditional Get Mixin: adds ETag and Last-Modified headers computed from row counts and
+# update times instead of the rendered body, and answers a matching If-None-Match or
+# If-Modified-Since with a 304 before anything is serialized. The validators of anonymous
+# requests are cached alongside the responses. Views leave Last-Modified out where a
+# deletion would not move it forward.
+
+
+class ConditionalGetMixin:
+    # Returns (state, last_modified): a picklable value that changes whenever the response
+    # would, and the datetime of the last change (or None)
+    def get_validators(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    # Whether responses get validators at all: views skip them where the aggregates would
+    # read more rows than the response itself
+    def has_validators(self):
+        return True
+
+    def get_cached_validators(self, request, *args, **kwargs):
+        if request.user.is_authenticated or not hasattr(self, 'cache_namespace'):
+            return self.get_validators(request, *args, **kwargs)
+        key = response_cache_key(self.cache_namespace, f'{type(self).__name__}:validators',
+                                 kwargs, request.query_params)
+        validators = get_cache().get(key)
+        if validators is None:
+            validators = self.get_validators(request, *args, **kwargs)
+            timeout = self.get_cache_timeout()
+            if timeout > 0 and not may_be_stale(self.cache_namespace):
+                get_cache().set(key, validators, timeout)
+        return validators
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_validators():
+            return super().get(request, *args, **kwargs)
+        state, last_modified = self.get_cached_validators(request, *args, **kwargs)
+        headers = validator_headers(type(self).__name__, request, kwargs, state, last_modified)
+        conditional = conditional_response(request, headers, last_modified)
+        if conditional is not None:
+            return conditional
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+
+# Returns the ETag and Last-Modified headers of a response from its validators
+def validator_headers(view_name, request, kwargs, state, last_modified):
+    fingerprint = repr((view_name, sorted(kwargs.items()), normalized_params(request.query_params),
+                        request.accepted_media_type, state))
+    headers = {'ETag': f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return headers
+
+
+# Returns the 304 (or 412) response to a conditional request its headers match, or None
+def conditional_response(request, headers, last_modified):
+    validators = HttpResponse(headers=headers)
+    conditional = get_conditional_response(
+        request, etag=headers['ETag'],
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+        response=validators)
+    return None if conditional is validators else conditional
@@ -0,0 +1,76 @@
+# Importing modules, functions and classes
+import csv
+import json
+from decimal import Decimal
+
+from .models import Product
+
+# Streaming catalog export.
+# Products are read through a database cursor a chunk at a time, with the relations
+# of each chunk prefetched in one query each, and written out row by row, so memory
+# stays flat whatever the size of the catalog.
+
+EXPORT_FORMATS = ['csv', 'ndjson']
+
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+FIELDS = ['id', 'name', 'description', 'category', 'price', 'discounted_price',
+          'stock_quantity', 'avg_rating', 'rating_count', 'ratings', 'images', 'created_at']
+
+# Separates the image URLs of the `images` column of a CSV file, as in imports
+CSV_IMAGE_SEPARATOR = '|'
+
+
+# Yields every product as a dict of exported fields. With a request, image URLs are
+# absolute like in the API.
+def export_rows(queryset=None, chunk_size=2000, request=None):
+    if queryset is None:
+        queryset = Product.objects.all()
+    products = queryset.select_related('category').for_catalog().order_by('id')
+
+    for product in products.iterator(chunk_size=chunk_size):
+        images = [image.image.url for image in product.images.all() if image.image]
+        if request is not None:
+            images = [request.build_absolute_uri(url) for url in images]
+        row = {
+            'id': product.id,
+            'name': product.name,
+            'description': product.description or '',
+            'category': product.category.name,
+            'price': product.price,
+            'discounted_price': product.discounted_price.quantize(Decimal('0.01')),
+            'stock_quantity': product.stock_quantity,
+            'avg_rating': product.avg_rating,
+            'rating_count': product.rating_count,
+            'ratings': product.rating_histogram,
+            'images': images,
+            'created_at': product.created_at.isoformat(),
+        }
+        # prefetched images point back to their product; dropping them breaks the
+        # reference cycle, so each chunk is freed at once instead of by the cyclic
+        # garbage collector, which lets them pile up between collections
+        del product._prefetched_objects_cache
+        yield row
+
+
+# A file-like object handing back what is written to it, so csv.writer can
+# format one line at a time
+class Echo:
+    def write(self, value):
+        return value
+
+
+# Yields the lines of an export in a format, as text
+def export_lines(rows, file_format):
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            row['images'] = CSV_IMAGE_SEPARATOR.join(row['images'])
+            row['ratings'] = ' '.join(f'{star}:{count}' for star, count in row['ratings'].items())
+            yield writer.writerow([row[field] for field in FIELDS])
+    elif file_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(row, default=str) + '\n'
+    else:
+        raise ValueError(f'Unknown format "{file_format}", use one of: {", ".join(EXPORT_FORMATS)}')
@@ -1,11 +1,14 @@
 # Importing classes
-from django_filters.rest_framework import FilterSet
+from django_filters.rest_framework import FilterSet, NumberFilter
 
 from .models import Product
 
 # Product Filter Class
 
 class ProductFilter(FilterSet):
+    # Products rated at least this many stars on average
+    min_rating = NumberFilter(field_name='avg_rating', lookup_expr='gte')
+
     class Meta:
         model = Product
         fields = {
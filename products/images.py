@@ -0,0 +1,194 @@
+# Importing modules, functions and classes
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max, Q
+from PIL import Image, ImageOps
+
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+# Background image pipeline.
+# Uploaded product images are stored as they are and the request returns; a pool of
+# worker threads then generates resized, re-encoded variants with Pillow, which
+# releases the GIL while decoding, resizing and encoding. No broker is needed: work
+# is queued in process, once the transaction saving the image has committed.
+
+# Variant field: (largest width and height, format, encoder options)
+VARIANTS = {
+    'thumbnail': ((200, 200), 'JPEG', {'quality': 80, 'optimize': True}),
+    'medium': ((800, 800), 'JPEG', {'quality': 85, 'optimize': True}),
+    'webp': ((1600, 1600), 'WEBP', {'quality': 80, 'method': 4}),
+}
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+# The file fields of a product image, all shared by images with the same content
+FILE_FIELDS = ['image', *VARIANTS]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                                           thread_name_prefix='product-images')
+        return _executor
+
+
+# Queues the variants of images for generation once the current transaction commits,
+# so workers never look for rows that are not saved yet
+def schedule_variants(image_ids):
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    def submit():
+        for image_id in image_ids:
+            if settings.IMAGE_PROCESSING_EAGER:
+                generate_variants(image_id)
+            else:
+                get_executor().submit(run_in_worker, image_id)
+    transaction.on_commit(submit)
+
+
+# Worker threads open their own database connection, closed after each image
+def run_in_worker(image_id):
+    try:
+        generate_variants(image_id)
+    except Exception:
+        logger.exception('Image worker failed on product image %s', image_id)
+    finally:
+        connection.close()
+
+
+# Renders one variant of an opened image as the bytes of an image file
+def render_variant(original, size, image_format, options):
+    variant = original.copy()
+    variant.thumbnail(size, Image.Resampling.LANCZOS)
+    if image_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    output = BytesIO()
+    variant.save(output, image_format, **options)
+    return output.getvalue()
+
+
+# Generates and stores every variant of an image, then marks it ready. Images stored
+# without their content hash (e.g. imported ones) get it too, so later copies of the
+# same file share theirs. Images that cannot be read are marked failed.
+def generate_variants(image_id):
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    try:
+        with image.image.open('rb') as source:
+            if not image.content_hash:
+                image.content_hash = file_digest(source)
+            with Image.open(source) as original:
+                # draft() lets JPEG decoding skip detail no variant needs
+                original.draft('RGB', VARIANTS['webp'][0])
+                original = ImageOps.exif_transpose(original)
+                for field, (size, image_format, options) in VARIANTS.items():
+                    content = render_variant(original, size, image_format, options)
+                    getattr(image, field).save(f'{stem}_{field}.{EXTENSIONS[image_format]}',
+                                               ContentFile(content), save=False)
+        image.status = ProductImage.READY
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Could not generate the variants of product image %s', image_id)
+        image.status = ProductImage.FAILED
+    # saving sends post_save, so cached product responses pick up the variants
+    try:
+        image.save(update_fields=['content_hash', 'thumbnail', 'medium', 'webp', 'status'])
+    except DatabaseError:
+        # the image was deleted meanwhile; its variant files are left to the orphan sweep
+        logger.info('Product image %s was deleted while processing', image_id)
+
+
+# Computes the hex SHA-256 digest of a file, a chunk at a time
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+# Adds an image file to the end of a product's images, storing its content once: a file
+# already on the product is not added again, and one stored for another product shares
+# that product's files, variants included when they are ready. Returns the image and
+# whether it was added.
+def add_image(product, file, content_hash=None):
+    content_hash = content_hash or file_digest(file)
+    existing = product.images.filter(content_hash=content_hash).first()
+    if existing is not None:
+        return existing, False
+
+    last = product.images.aggregate(last=Max('position'))['last']
+    image = ProductImage(product=product, content_hash=content_hash,
+                         position=0 if last is None else last + 1)
+    # an image whose variants are ready is preferred over one still pending
+    shared = ProductImage.objects.filter(content_hash=content_hash).exclude(
+        status=ProductImage.FAILED).order_by('-status', 'id').first()
+    if shared is None:
+        image.image.save(os.path.basename(file.name), file)
+        return image, True
+
+    image.image = shared.image.name
+    if shared.status == ProductImage.READY:
+        for field in VARIANTS:
+            setattr(image, field, getattr(shared, field).name)
+        image.status = ProductImage.READY
+    image.save()
+    return image, True
+
+
+# Deletes the stored files among `names` that no product image refers to any more
+def delete_unreferenced_files(names):
+    names = {name for name in names if name}
+    if not names:
+        return 0
+    condition = Q()
+    for field in FILE_FIELDS:
+        condition |= Q(**{f'{field}__in': names})
+    for row in ProductImage.objects.filter(condition).values_list(*FILE_FIELDS):
+        names.difference_update(row)
+    for name in names:
+        default_storage.delete(name)
+    return len(names)
+
+
+# Queues the files of deleted product images for deletion once the transaction
+# commits, in the worker pool; files still shared with other images are kept
+def schedule_file_cleanup(names):
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    def submit():
+        if settings.IMAGE_PROCESSING_EAGER:
+            delete_unreferenced_files(names)
+        else:
+            get_executor().submit(run_cleanup_in_worker, names)
+    transaction.on_commit(submit)
+
+
+def run_cleanup_in_worker(names):
+    try:
+        delete_unreferenced_files(names)
+    except Exception:
+        logger.exception('Could not delete the files of deleted product images')
+    finally:
+        connection.close()
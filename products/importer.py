@@ -0,0 +1,165 @@
+# Importing modules, functions and classes
+import csv
+import io
+import json
+import time
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import invalidate_catalog
+from .images import schedule_variants
+from .models import Category, Product, ProductImage
+from .search import index_products
+from .serializers import ProductImportSerializer
+
+# Streaming product import.
+# Rows are read one at a time from CSV or JSON Lines, validated with the product
+# serializer rules and written with bulk_create a batch at a time, so memory does not
+# grow with the size of the file. bulk_create sends no post_save signals, so each batch
+# is added to the search index and its images are queued for their variants here, and
+# the catalog cache is invalidated at the end.
+
+IMPORT_FORMATS = ['csv', 'jsonl']
+
+# Separates the image paths of the `images` column of a CSV file
+CSV_IMAGE_SEPARATOR = '|'
+
+# Number of row errors kept in a report, the others are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+# Picks the format of a file from its name, e.g. products.csv or products.jsonl
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'ndjson':
+        return 'jsonl'
+    if extension in IMPORT_FORMATS:
+        return extension
+    raise ValueError(f'Cannot tell the format of "{filename}", use one of: {", ".join(IMPORT_FORMATS)}')
+
+
+# Yields (row number, row) pairs of a text stream, a row being a dict of field values
+def read_rows(stream, file_format):
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            # empty cells are missing values, as CSV has no null
+            row = {field: value for field, value in row.items() if value not in ('', None)}
+            if 'images' in row:
+                row['images'] = [path for path in row['images'].split(CSV_IMAGE_SEPARATOR) if path]
+            yield number, row
+    elif file_format == 'jsonl':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # reported like any other row that is not an object
+                row = None
+            yield number, row
+    else:
+        raise ValueError(f'Unknown format "{file_format}", use one of: {", ".join(IMPORT_FORMATS)}')
+
+
+# Resolves category names to categories from an in-memory map, loaded once per import.
+# Unknown categories are rejected, or created when create_missing is set.
+class CategoryMap:
+    def __init__(self, user, create_missing=False):
+        self.user = user
+        self.create_missing = create_missing
+        self.categories = {category.name: category for category in Category.objects.all()}
+
+    def resolve(self, name):
+        if name not in self.categories:
+            if not self.create_missing:
+                raise serializers.ValidationError(f'Unknown category "{name}".')
+            self.categories[name] = Category.objects.create(name=name, created_by=self.user)
+        return self.categories[name]
+
+
+# Summary of an import: row counts, kept row errors and throughput
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def add_error(self, number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'errors': detail})
+
+    def as_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(self.rows / seconds) if seconds else 0,
+        }
+
+
+# Imports products from a text stream, created by `user`. `progress` is called with
+# the report after every batch written.
+def import_products(stream, file_format, user, batch_size=1000, create_categories=False,
+                    progress=None):
+    report = ImportReport()
+    categories = CategoryMap(user, create_missing=create_categories)
+    # a single serializer validates every row, so its fields are built once
+    serializer = ProductImportSerializer(context={'categories': categories})
+    batch = []
+
+    for number, row in read_rows(stream, file_format):
+        report.rows += 1
+        if not isinstance(row, dict):
+            report.add_error(number, {'non_field_errors': ['Row is not a JSON object.']})
+            continue
+        try:
+            data = serializer.run_validation(row)
+        except serializers.ValidationError as error:
+            report.add_error(number, error.detail)
+            continue
+
+        images = data.pop('images')
+        batch.append((Product(created_by=user, **data), images))
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            report.created += len(batch)
+            batch = []
+            if progress:
+                progress(report)
+
+    if batch:
+        write_batch(batch)
+        report.created += len(batch)
+        if progress:
+            progress(report)
+    if report.created:
+        invalidate_catalog('products')
+    return report
+
+
+# Writes a batch of (product, image paths) pairs: products and images in one
+# INSERT each, the products to the search index, and queues the images for their
+# variants once the batch commits, as the post_save signal would
+def write_batch(batch):
+    products = [product for product, images in batch]
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        images = ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=image, position=position)
+            for product, images in batch for position, image in enumerate(images)])
+        index_products(products)
+        schedule_variants([image.pk for image in images])
+
+
+# Wraps an uploaded file in a text stream read line by line
+def uploaded_file_stream(uploaded_file):
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
@@ -0,0 +1,400 @@
+# Importing modules, functions and classes
+import csv
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+import django
+from django.contrib.auth import authenticate, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from rest_framework.filters import SearchFilter
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from products.cache import get_cache
+from products.exporter import export_lines, export_rows
+from products.importer import import_products
+from products.models import Category, Product, Rating
+from products.pagination import ProductCursorPagination
+from products.search import ProductSearchFilter, index_products
+from products.serializers import (CheckoutSerializer, ProductBulkSerializer,
+                                  ProductSerializer)
+from products.synthetic import ADJECTIVES, NOUNS, PASSWORD, generate_catalog
+from products.views import ListProductView
+
+User = get_user_model()
+
+# Benchmark Command: times the API against a throwaway test database filled with
+# synthetic data, so it never touches the configured database
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks API endpoints against a synthetic catalog in a throwaway database'
+    scenarios = ['api', 'pagination', 'search', 'checkout', 'login', 'import', 'export', 'bulk']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help=f'Scenarios to run (default: all of {", ".join(self.scenarios)})')
+        parser.add_argument('--products', type=int, default=100000,
+                            help='Number of synthetic products to generate')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Number of timed requests per measurement')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Number of timed requests per route of the api scenario')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the synthetic catalog and requests of the api scenario')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='JSON results of an earlier run to compare the api scenario with')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or self.scenarios
+        unknown = set(scenarios) - set(self.scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.client = APIClient()
+            results = {}
+            for scenario in scenarios:
+                self.stdout.write(f'Running {scenario}...')
+                results[scenario] = getattr(self, f'bench_{scenario}')(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        results['environment'] = {
+            'python': platform.python_version(), 'django': django.get_version(),
+            'database': connection.vendor, 'products': options['products'], 'seed': options['seed'],
+        }
+        if options['output']:
+            # sorted keys, so results of two commits diff line by line
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['compare'] and 'api' in results:
+            self.compare(options['compare'], results['api']['routes'])
+
+    # Generates a flat catalog of products in a single category
+    def generate_products(self, count):
+        user = User.objects.create_user(username='benchmark', email='benchmark@alx.com',
+                                        password='benchmark@123')
+        category = Category.objects.create(name='Benchmark', created_by=user)
+        batch = [Product(name=f'{ADJECTIVES[i % 8]} {NOUNS[i // 8 % 8]} {i}',
+                         description=f'A {NOUNS[i // 64 % 8].lower()} friendly synthetic product',
+                         price=Decimal(i % 1000 + 1), category=category,
+                         stock_quantity=i % 50, created_by=user)
+                 for i in range(count)]
+        Product.objects.bulk_create(batch, batch_size=5000)
+        index_products(Product.objects.select_related('category').iterator(chunk_size=5000))
+
+    # Returns the median latency in milliseconds of repeated calls
+    def time_call(self, function, repeat=20):
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return round(statistics.median(latencies), 3)
+
+    # Returns the median latency in milliseconds of repeated GET requests
+    def time_get(self, url, params=None, repeat=20):
+        def get():
+            response = self.client.get(url, params)
+            assert response.status_code == 200, response.status_code
+        return self.time_call(get, repeat)
+
+    # Returns the latency percentiles in milliseconds and the requests/sec of requests
+    # timed one after the other
+    def summarize(self, latencies):
+        ordered = sorted(latencies)
+
+        def percentile(share):
+            return round(ordered[min(int(len(ordered) * share), len(ordered) - 1)], 3)
+
+        return {'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99),
+                'requests_per_sec': round(len(ordered) * 1000 / sum(ordered), 1)}
+
+    # Sends the requests drawn by `route`, a function returning (method, url, data, user),
+    # after a few untimed ones warming up the process. The catalog cache is cleared before
+    # each request unless `cached`, so they reach the database and serializers.
+    def measure_route(self, route, requests, cached=False):
+        client = APIClient()
+        latencies, queries = [], 0
+        for number in range(requests + 5):
+            method, url, data, user = route()
+            client.force_authenticate(user=user)
+            if not cached:
+                get_cache().clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if method == 'post':
+                    response = client.post(url, data, format='json')
+                else:
+                    response = client.get(url, data)
+                elapsed = time.perf_counter() - start
+            assert response.status_code == 200, (url, response.status_code)
+            if number >= 5:
+                latencies.append(elapsed * 1000)
+                queries += len(captured)
+        return {**self.summarize(latencies), 'queries_per_request': round(queries / requests, 2)}
+
+    # Drives the routes clients use most through the URL routing, middleware and views,
+    # against a synthetic catalog: product lists with filters, search and ordering, product
+    # details and ratings, a shopper's wishlist, logins and token refreshes. The catalog
+    # and the requests are drawn from --seed, so two runs send the same requests.
+    def bench_api(self, options):
+        seed = options['seed']
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            catalog = generate_catalog(products=options['products'], seed=seed)
+            rng = random.Random(seed)
+            shopper = User.objects.get(username=f'shopper{seed}-1')
+            refresh = str(RefreshToken.for_user(shopper))
+            product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+            rated_ids = list(Rating.objects.order_by('product_id').values_list('product_id', flat=True)
+                             .distinct()[:1000])
+            category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+            pages = min(max(len(product_ids) // 10, 1), 100)
+            products = reverse('products-list')
+
+            routes = {
+                'products_list': lambda: ('get', products, {'page': rng.randint(1, pages)}, None),
+                'products_filtered': lambda: ('get', products, {
+                    'category': rng.choice(category_ids), 'price__gte': 10, 'price__lte': 500,
+                    'min_rating': 3}, None),
+                'products_search': lambda: ('get', products, {
+                    'search': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'.lower()}, None),
+                'products_ordered': lambda: ('get', products, {
+                    'ordering': rng.choice(['-avg_rating', '-rating_count', '-created_at'])}, None),
+                'product_detail': lambda: (
+                    'get', reverse('products-detail', kwargs={'pk': rng.choice(product_ids)}), None, None),
+                'product_ratings': lambda: (
+                    'get', reverse('product-ratings-list', kwargs={'product_id': rng.choice(rated_ids)}),
+                    None, None),
+                'products_in_wishlist': lambda: ('get', products, {'in_wishlist': 'true'}, shopper),
+                'wishlist': lambda: ('get', reverse('wishlist-list'), None, shopper),
+                'wishlist_contains': lambda: ('get', reverse('wishlist-contains'), {
+                    'product_ids': ','.join(map(str, rng.sample(product_ids, min(10, len(product_ids)))))},
+                    shopper),
+                'login': lambda: ('post', reverse('login'),
+                                  {'username': shopper.username, 'password': PASSWORD}, None),
+                'token_refresh': lambda: ('post', reverse('token_refresh'), {'refresh': refresh}, None),
+            }
+            results = {'catalog': catalog, 'routes': {}}
+            for name, route in routes.items():
+                results['routes'][name] = self.measure_route(route, options['requests'])
+            results['routes']['products_list_cached'] = self.measure_route(
+                lambda: ('get', products, {'page': 1}, None), options['requests'], cached=True)
+        return results
+
+    # Prints how the latencies and queries of each api route changed since a baseline run
+    def compare(self, path, routes):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file).get('api', {}).get('routes', {})
+        self.stdout.write(f'{"route":<24}{"p50 ms":>22}{"p95 ms":>22}{"queries":>14}')
+        for name, result in routes.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            changes = [f'{result[key]:.2f} ({(result[key] / before[key] - 1) * 100:+.0f}%)'
+                       for key in ('p50_ms', 'p95_ms')]
+            queries = f'{before["queries_per_request"]:g} -> {result["queries_per_request"]:g}'
+            self.stdout.write(f'{name:<24}{changes[0]:>22}{changes[1]:>22}{queries:>14}')
+
+    # Compares page number and cursor pagination from the first to the deepest page
+    def bench_pagination(self, options):
+        self.generate_products(options['products'])
+        url = reverse('products-list')
+        page_size = ProductCursorPagination.page_size
+        last_page = max(options['products'] // page_size, 1)
+        pages = [page for page in (1, 10, 100, 1000, 10000) if page <= last_page]
+
+        paginator = ProductCursorPagination()
+        paginator.base_url = url
+        ordered = Product.objects.order_by('created_at', 'id')
+        results = {'page_number_ms': {}, 'cursor_ms': {}}
+        for page in pages:
+            results['page_number_ms'][page] = self.time_get(url, {'page': page}, options['repeat'])
+            params = {'paginator': 'cursor'}
+            if page > 1:
+                # the cursor a client holds after reading the previous page
+                previous = ordered[(page - 1) * page_size - 1]
+                position = paginator._get_position_from_instance(previous, paginator.ordering)
+                next_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+                params['cursor'] = parse_qs(urlparse(next_url).query)['cursor'][0]
+            results['cursor_ms'][page] = self.time_get(url, params, options['repeat'])
+        return results
+
+    # Compares the full-text search backend with DRF's icontains SearchFilter it replaced,
+    # timing the count and first page each backend produces for the product list
+    def bench_search(self, options):
+        if not Product.objects.exists():
+            self.generate_products(options['products'])
+        factory = APIRequestFactory()
+        results = {'fts_ms': {}, 'icontains_ms': {}}
+        for term in ('lamp', 'vintage chair', 'friendly'):
+            request = Request(factory.get('/', {'search': term}))
+            view = ListProductView(request=request)
+            queryset = Product.objects.order_by('created_at')
+            for key, backend in (('fts_ms', ProductSearchFilter), ('icontains_ms', SearchFilter)):
+                def first_page():
+                    filtered = backend().filter_queryset(request, queryset, view)
+                    return filtered.count(), list(filtered[:10])
+                results[key][term] = self.time_call(first_page, options['repeat'])
+        return results
+
+    # Compares checking out a 30-line cart in one UPDATE with a SELECT and save() per line
+    def bench_checkout(self, options):
+        if not Product.objects.exists():
+            self.generate_products(options['products'])
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:30])
+        Product.objects.filter(id__in=product_ids).update(stock_quantity=10 ** 9)
+        lines = [{'product_id': product_id, 'quantity': 2} for product_id in product_ids]
+
+        def checkout():
+            serializer = CheckoutSerializer(data={'lines': lines})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        def naive_loop():
+            with transaction.atomic():
+                for line in lines:
+                    product = Product.objects.get(pk=line['product_id'])
+                    product.stock_quantity -= line['quantity']
+                    product.save()
+
+        results = {}
+        for key, function in (('checkout', checkout), ('naive_loop', naive_loop)):
+            latency = self.time_call(function, options['repeat'])
+            results[key] = {'cart_ms': latency,
+                            'lines_per_sec': round(len(lines) * 1000 / latency)}
+        return results
+
+    # Times logins, which hash the password once, with and without a token pair, against
+    # the previous flow that authenticated a second time in the view. Requests run one
+    # at a time, so logins/sec is per core.
+    def bench_login(self, options):
+        credentials = {'username': 'benchmark-login', 'password': 'benchmark@123'}
+        User.objects.create_user(email='login@alx.com', **credentials)
+        url = reverse('login')
+
+        def login(data=credentials):
+            response = self.client.post(url, data, format='json')
+            assert response.status_code == 200, response.status_code
+
+        def double_hash():
+            authenticate(**credentials)
+            login()
+
+        results = {}
+        for key, function in (('login', login),
+                              ('login_jwt', lambda: login({**credentials, 'jwt': True})),
+                              ('double_hash', double_hash)):
+            latency = self.time_call(function, options['repeat'])
+            results[key] = {'login_ms': latency, 'logins_per_sec': round(1000 / latency, 1)}
+        return results
+
+    # Compares the streaming import of a CSV file of products with creating them one at
+    # a time like CreateProductView, on at most 1000 rows
+    def bench_import(self, options):
+        user = User.objects.create_user(username='benchmark-import', email='import@alx.com')
+        category = Category.objects.create(name='Benchmark Import', created_by=user)
+        rows = options['products']
+        # without images: each would queue variants, whose workers compete with the
+        # timed writes (and fail on the in-memory test database's table locks)
+        with tempfile.TemporaryFile('w+', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['name', 'description', 'price', 'category', 'stock_quantity'])
+            for i in range(rows):
+                writer.writerow([f'{ADJECTIVES[i % 8]} {NOUNS[i // 8 % 8]} {i}', 'Imported', i % 1000 + 1,
+                                 category.name, i % 50])
+            csv_file.seek(0)
+            report = import_products(csv_file, 'csv', user, batch_size=1000).as_dict()
+
+        one_at_a_time = min(rows, 1000)
+        start = time.perf_counter()
+        for i in range(one_at_a_time):
+            Product.objects.create(name=f'Single {i}', price=Decimal(i % 1000 + 1),
+                                   category=category, stock_quantity=1, created_by=user)
+        seconds = time.perf_counter() - start
+        return {'bulk_import': {'rows': report['created'], 'rows_per_sec': report['rows_per_sec']},
+                'one_at_a_time': {'rows': one_at_a_time,
+                                  'rows_per_sec': round(one_at_a_time / seconds)}}
+
+    # Compares the peak memory of streaming the catalog as NDJSON with serializing it
+    # all at once like the product list does for a page
+    def bench_export(self, options):
+        if not Product.objects.exists():
+            self.generate_products(options['products'])
+        results = {}
+
+        def stream():
+            for _ in export_lines(export_rows(), 'ndjson'):
+                pass
+
+        def materialize():
+            json.dumps(ProductSerializer(Product.objects.for_catalog(), many=True).data,
+                       default=str)
+
+        for key, function in (('stream', stream), ('materialize', materialize)):
+            start = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - start
+            # traced separately, as tracing slows every allocation down
+            tracemalloc.start()
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[key] = {'rows_per_sec': round(Product.objects.count() / seconds),
+                            'peak_mb': round(peak / 2 ** 20, 1)}
+        return results
+
+    # Compares a bulk PATCH of price and stock changes with validating and saving each
+    # product on its own like UpdateProductView, on at most 1000 products
+    def bench_bulk(self, options):
+        if not Product.objects.exists():
+            self.generate_products(options['products'])
+        products = list(Product.objects.order_by('id')[:min(options['products'], 1000)])
+        self.client.force_authenticate(user=products[0].created_by)
+        url = reverse('products-bulk')
+        results = {}
+
+        def changes(round_):
+            return [{'id': product.id, 'price': f'{(product.id + round_) % 1000 + 1}.00',
+                     'stock_quantity': round_} for product in products]
+
+        def bulk(round_):
+            response = self.client.patch(url, changes(round_), format='json')
+            assert response.status_code == 200, response.status_code
+
+        def one_at_a_time(round_):
+            for change in changes(round_):
+                product = Product.objects.get(pk=change['id'])
+                serializer = ProductBulkSerializer(product, data=change, partial=True)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        for key, function in (('bulk', bulk), ('one_at_a_time', one_at_a_time)):
+            start = time.perf_counter()
+            for round_ in range(3):
+                function(round_)
+            seconds = (time.perf_counter() - start) / 3
+            results[key] = {'changes': len(products),
+                            'changes_per_sec': round(len(products) / seconds)}
+        self.client.force_authenticate(user=None)
+        return results
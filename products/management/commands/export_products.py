@@ -0,0 +1,31 @@
+# Importing modules, functions and classes
+from django.core.management.base import BaseCommand
+
+from products.exporter import EXPORT_FORMATS, export_lines, export_rows
+
+# Exports the whole catalog as CSV or NDJSON to a file or standard output, reading
+# products a chunk at a time so memory stays flat on large catalogs.
+
+
+class Command(BaseCommand):
+    help = 'Exports every product as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='File to write, or - for standard output (default)')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv',
+                            help='Output format (default: csv)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of products read per database round trip')
+
+    def handle(self, *args, **options):
+        rows = export_rows(chunk_size=options['chunk_size'])
+        lines = export_lines(rows, options['format'])
+        if options['path'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['path'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f'Exported the catalog to {options["path"]}'))
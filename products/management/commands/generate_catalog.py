@@ -0,0 +1,38 @@
+# Importing modules, functions and classes
+from django.core.management.base import BaseCommand
+
+from products.synthetic import PASSWORD, generate_catalog
+
+# Generate Catalog Command: fills the configured database with a synthetic catalog,
+# the same for the same options and seed (see products/synthetic.py)
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic catalog of products, ratings, discounts, wishlists and images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Number of products')
+        parser.add_argument('--categories', type=int, default=20, help='Number of categories')
+        parser.add_argument('--users', type=int, default=50,
+                            help='Number of users rating products and keeping wishlists')
+        parser.add_argument('--discount-share', type=float, default=0.1,
+                            help='Share of the products with a discount')
+        parser.add_argument('--ratings-per-product', type=int, default=3,
+                            help='Average number of ratings per product')
+        parser.add_argument('--wishlist-size', type=int, default=5,
+                            help='Number of products in the wishlist of each user')
+        parser.add_argument('--pictures', type=int, default=8,
+                            help='Number of distinct pictures shared by the products')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random choices; usernames and category names '
+                                 'include it, so catalogs of different seeds can be added')
+
+    def handle(self, *args, **options):
+        counts = generate_catalog(
+            products=options['products'], categories=options['categories'], users=options['users'],
+            discount_share=options['discount_share'], ratings_per_product=options['ratings_per_product'],
+            wishlist_size=options['wishlist_size'], pictures=options['pictures'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(f'{count} {name}' for name, count in counts.items())))
+        self.stdout.write(f'Users are shopper{options["seed"]}-0 (staff) to '
+                          f'shopper{options["seed"]}-{counts["users"] - 1}, password "{PASSWORD}"')
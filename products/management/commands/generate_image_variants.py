@@ -0,0 +1,32 @@
+# Importing classes and functions
+from django.core.management.base import BaseCommand
+
+from products.images import generate_variants
+from products.models import ProductImage
+
+# Generates the resized variants of product images in this process, e.g. for images
+# uploaded before the image pipeline existed, or whose processing failed.
+
+
+class Command(BaseCommand):
+    help = 'Generates the thumbnail, medium and WebP variants of product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the variants of every image, not only pending ones')
+        parser.add_argument('--failed', action='store_true',
+                            help='Also retry images whose processing failed')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            statuses = [ProductImage.PENDING] + ([ProductImage.FAILED] if options['failed'] else [])
+            images = images.filter(status__in=statuses)
+
+        processed = 0
+        for image_id in images.values_list('id', flat=True).iterator():
+            generate_variants(image_id)
+            processed += 1
+        ready = ProductImage.objects.filter(status=ProductImage.READY).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images, {ready} images have their variants'))
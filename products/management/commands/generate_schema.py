@@ -0,0 +1,38 @@
+# Importing modules, functions and classes
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from e_commerce_api.schema import (code_fingerprint, generate_schema,
+                                   read_schema, write_schema)
+
+# Generate Schema Command: precomputes the OpenAPI schema served by the API docs (see
+# e_commerce_api/schema.py) into SCHEMA_DIR, to run at build or deploy time so that no
+# request has to generate it. Does nothing if the schema of the current code is already
+# there, unless --force is given; --check only reports whether it is.
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the OpenAPI schema of the API docs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=settings.SCHEMA_DIR, help='Where to store the schema')
+        parser.add_argument('--force', action='store_true', help='Regenerate a schema already stored')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if the schema of the current code is not stored, without generating it')
+
+    def handle(self, *args, **options):
+        fingerprint = code_fingerprint()
+        stored = read_schema(options['directory'], fingerprint) is not None
+        if options['check']:
+            if not stored:
+                raise CommandError(f'The schema of the current code ({fingerprint}) is not in '
+                                   f'{options["directory"]}; run generate_schema.')
+            self.stdout.write(f'The schema of the current code ({fingerprint}) is up to date.')
+            return
+        if stored and not options['force']:
+            self.stdout.write(f'The schema of the current code ({fingerprint}) is up to date.')
+            return
+
+        documents = generate_schema()
+        for path in write_schema(options['directory'], fingerprint, documents):
+            self.stdout.write(f'Wrote {path} ({path.stat().st_size} bytes)')
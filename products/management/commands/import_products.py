@@ -0,0 +1,59 @@
+# Importing modules, functions and classes
+import json
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import IMPORT_FORMATS, detect_format, import_products
+
+User = get_user_model()
+
+# Imports products from a CSV or JSON Lines file, or standard input, in batches.
+# CSV files have a header row with the name, description, price, category,
+# stock_quantity and images columns, images being media paths separated by "|".
+
+
+class Command(BaseCommand):
+    help = 'Imports products from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for standard input')
+        parser.add_argument('--user', required=True,
+                            help='Username recorded as the creator of the products')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products written per INSERT')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create unknown categories instead of rejecting their rows')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user "{options["user"]}"')
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        def progress(report):
+            self.stdout.write(f'{report.created} products imported, {report.failed} rows rejected')
+
+        stream = sys.stdin if options['path'] == '-' else \
+            open(options['path'], encoding='utf-8-sig', newline='')
+        try:
+            report = import_products(
+                stream, file_format, user, batch_size=options['batch_size'],
+                create_categories=options['create_categories'], progress=progress)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        result = report.as_dict()
+        for error in result['errors']:
+            self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} of {result["rows"]} rows in {result["seconds"]}s '
+            f'({result["rows_per_sec"]} rows/sec)'))
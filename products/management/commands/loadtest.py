@@ -0,0 +1,162 @@
+# Importing modules, functions and classes
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from e_commerce_api.database import PROFILES
+from products.models import Product
+
+from .benchmark import Command as BenchmarkCommand
+
+# Load Test Command: requests/sec of concurrent catalog reads and purchases, served
+# in-process by threads, against a throwaway database on the configured backend: a
+# temporary SQLite file, or a test database on the PostgreSQL server. Connections are
+# opened and closed around each request like the request handler does, so the cost of
+# connecting shows. With --compare, runs once per database profile in a subprocess.
+
+
+class Command(BaseCommand):
+    help = 'Measures requests/sec under concurrent load for the configured database profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of the load')
+        parser.add_argument('--products', type=int, default=2000,
+                            help='Number of synthetic products to generate')
+        parser.add_argument('--write-ratio', type=float, default=0.1,
+                            help='Share of requests that are purchases')
+        parser.add_argument('--compare', nargs='+', choices=PROFILES, metavar='PROFILE',
+                            help=f'Profiles to compare, among: {", ".join(PROFILES)}')
+        parser.add_argument('--database-url',
+                            help='PostgreSQL URL for the postgres profiles (default: DATABASE_URL)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(options)
+
+        setup_test_environment()
+        directory = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            # threads need a database file to share, not the in-memory test database
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory.name, 'loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            BenchmarkCommand().generate_products(options['products'])
+            Product.objects.update(stock_quantity=10 ** 9)
+            results = self.run_load(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            directory.cleanup()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def run_load(self, options):
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        user = Product.objects.first().created_by
+        pages = max(len(product_ids) // 10, 1)
+        deadline = time.perf_counter() + options['seconds']
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def request(client, rng):
+            if rng.random() < options['write_ratio']:
+                url = reverse('products-purchase', kwargs={'pk': rng.choice(product_ids)})
+                return client.post(url, {'quantity': 1}, format='json')
+            if rng.random() < 0.5:
+                return client.get(reverse('products-list'), {'page': rng.randint(1, pages)})
+            return client.get(reverse('products-detail', kwargs={'pk': rng.choice(product_ids)}))
+
+        def worker(seed):
+            client, rng, own = APIClient(), random.Random(seed), []
+            # authenticated, so reads skip the catalog cache and reach the database
+            client.force_authenticate(user=user)
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    close_old_connections()
+                    try:
+                        ok = request(client, rng).status_code < 400
+                    except Exception:
+                        ok = False
+                    close_old_connections()
+                    if ok:
+                        own.append((time.perf_counter() - start) * 1000)
+                    else:
+                        with lock:
+                            errors[0] += 1
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(own)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        latencies.sort()
+        percentile = (lambda share: round(latencies[min(int(len(latencies) * share), len(latencies) - 1)], 3)
+                      if latencies else None)
+        database = settings.DATABASES['default']
+        return {
+            'vendor': connection.vendor,
+            'conn_max_age': database.get('CONN_MAX_AGE', 0),
+            'pool': 'pool' in database.get('OPTIONS', {}),
+            'threads': options['threads'],
+            'requests': len(latencies),
+            'errors': errors[0],
+            'requests_per_sec': round(len(latencies) / seconds, 1),
+            'p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+            'p95_ms': percentile(0.95),
+        }
+
+    # Runs the load test in a subprocess per profile, which reads its database
+    # settings from the environment at startup
+    def compare(self, options):
+        postgres_url = options['database_url'] or os.environ.get('DATABASE_URL', '')
+        results = {}
+        for profile in options['compare']:
+            environ = {**os.environ, 'DB_PROFILE': profile}
+            if profile.startswith('postgres'):
+                if not postgres_url.startswith('postgres'):
+                    raise CommandError(f'The {profile} profile needs --database-url postgres://...')
+                environ['DATABASE_URL'] = postgres_url
+            else:
+                environ.pop('DATABASE_URL', None)
+            command = [sys.executable, '-m', 'django', 'loadtest', '--json',
+                       f'--threads={options["threads"]}', f'--seconds={options["seconds"]}',
+                       f'--products={options["products"]}', f'--write-ratio={options["write_ratio"]}']
+            self.stdout.write(f'Running {profile}...')
+            run = subprocess.run(command, env=environ, cwd=settings.BASE_DIR,
+                                 capture_output=True, text=True)
+            if run.returncode:
+                raise CommandError(f'{profile} failed:\n{run.stderr}')
+            results[profile] = json.loads(run.stdout.strip().splitlines()[-1])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        self.stdout.write(f'{"profile":<15}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        for profile, result in results.items():
+            self.stdout.write(f'{profile:<15}{result["requests_per_sec"]:>10}{result["p50_ms"]:>10}'
+                              f'{result["p95_ms"]:>10}{result["errors"]:>8}')
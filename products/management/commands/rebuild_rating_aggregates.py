@@ -0,0 +1,62 @@
+# Importing classes and functions
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from products.cache import invalidate_catalog
+from products.models import Product, Rating
+
+# Recomputes the rating aggregates of every product from its Rating rows, a batch of
+# products at a time: one grouped query and one bulk UPDATE per batch. Products whose
+# aggregates changed get a new updated_at, which their validators and replica lag use.
+
+AGGREGATE_FIELDS = ['avg_rating', 'rating_count',
+                    'ratings_1', 'ratings_2', 'ratings_3', 'ratings_4', 'ratings_5']
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the average, count and histogram of product ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, rebuilt, changed = 0, 0, 0
+        while True:
+            products = list(Product.objects.filter(pk__gt=last_id).order_by('pk')
+                            .only('pk', *AGGREGATE_FIELDS)[:batch_size])
+            if not products:
+                break
+            with transaction.atomic():
+                histograms, stale = {}, []
+                rows = (Rating.objects.filter(product__in=products)
+                        .values('product_id', 'rating').annotate(count=Count('id')))
+                for row in rows:
+                    histograms.setdefault(row['product_id'], {})[row['rating']] = row['count']
+                now = timezone.now()
+                for product in products:
+                    previous = [getattr(product, field) for field in AGGREGATE_FIELDS]
+                    histogram = histograms.get(product.pk, {})
+                    for star in range(1, 6):
+                        setattr(product, f'ratings_{star}', histogram.get(star, 0))
+                    product.rating_count = sum(histogram.values())
+                    product.avg_rating = (
+                        Decimal(sum(star * count for star, count in histogram.items()))
+                        / product.rating_count).quantize(Decimal('0.01')) if product.rating_count else 0
+                    if [getattr(product, field) for field in AGGREGATE_FIELDS] != previous:
+                        product.updated_at = now
+                        stale.append(product)
+                Product.objects.bulk_update(stale, AGGREGATE_FIELDS + ['updated_at'])
+            rebuilt += len(products)
+            changed += len(stale)
+            last_id = products[-1].pk
+
+        if changed:
+            invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates of {rebuilt} products, {changed} of them changed'))
@@ -0,0 +1,15 @@
+# Importing classes and functions
+from django.core.management.base import BaseCommand
+
+from products.stock import release_expired_reservations
+
+# Releases held stock whose reservation has expired. Reservations are also swept lazily
+# whenever new stock is reserved; run this from cron to free stock on quiet catalogs.
+
+
+class Command(BaseCommand):
+    help = 'Releases stock held by expired reservations'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
@@ -0,0 +1,244 @@
+# Importing modules, functions and classes
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from products.models import Category, Product
+from products.synthetic import generate_catalog
+
+# Serve Benchmark Command: requests/sec and latencies of concurrent catalog reads served
+# by a single worker, under WSGI and under ASGI. Each server runs in a subprocess, with
+# async views under ASGI (see ASYNC_VIEWS), against a throwaway database filled with a
+# synthetic catalog. Requests go through the WSGI or ASGI handler in-process, without a
+# socket: WSGI requests run on a pool of --threads threads, like a threaded worker, and
+# ASGI requests on one event loop. --db-latency adds a delay to every query, as a
+# database across a network would.
+
+SERVERS = ['wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent catalog reads served by one WSGI and one ASGI worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=SERVERS,
+                            help='Serve in this process with this server only (default: compare both)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64],
+                            help='Numbers of concurrent connections to measure')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each measurement')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the WSGI worker')
+        parser.add_argument('--products', type=int, default=2000,
+                            help='Number of synthetic products to generate')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Milliseconds added to every query, e.g. 2 for a database on the network')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the catalog response cache on (default: every read hits the database)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if not options['server']:
+            return self.compare(options)
+
+        setup_test_environment()
+        directory = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            # threads need a database file to share, not the in-memory test database
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory.name, 'servebench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(MEDIA_ROOT=directory.name):
+                generate_catalog(products=options['products'], pictures=2)
+            paths = self.request_paths()
+            connection.close()
+            if options['db_latency']:
+                self.add_db_latency(options['db_latency'] / 1000)
+            serve = self.serve_wsgi if options['server'] == 'wsgi' else self.serve_asgi
+            results = {'server': options['server'], 'async_views': settings.ASYNC_VIEWS,
+                       'threads': options['threads'] if options['server'] == 'wsgi' else None,
+                       'db_latency_ms': options['db_latency'], 'levels': []}
+            for concurrency in options['concurrency']:
+                results['levels'].append(serve(paths, concurrency, options))
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            directory.cleanup()
+        self.stdout.write(json.dumps(results) if options['json'] else json.dumps(results, indent=2))
+
+    # The catalog reads clients make: pages of products, products, categories and ratings
+    def request_paths(self):
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        pages = max(len(product_ids) // settings.REST_FRAMEWORK['PAGE_SIZE'], 1)
+        category_ids = list(Category.objects.values_list('id', flat=True))
+
+        def choose(rng):
+            kind = rng.random()
+            if kind < 0.4:
+                return reverse('products-list'), urlencode({'page': rng.randint(1, pages)})
+            if kind < 0.8:
+                return reverse('products-detail', kwargs={'pk': rng.choice(product_ids)}), ''
+            if kind < 0.9:
+                return reverse('category_detail', kwargs={'pk': rng.choice(category_ids)}), ''
+            return reverse('product-ratings-list', kwargs={'product_id': rng.choice(product_ids)}), ''
+        return choose
+
+    # Delays every query of every connection, in the thread that runs it
+    def add_db_latency(self, seconds):
+        def delay(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def install(connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        connection_created.connect(install, weak=False)
+
+    def summarize(self, concurrency, latencies, errors, seconds):
+        latencies.sort()
+        return {
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_sec': round(len(latencies) / seconds, 1),
+            'p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+            'p95_ms': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3)
+            if latencies else None,
+        }
+
+    # Runs `concurrency` clients on an event loop, each sending a request as soon as its
+    # last one is answered, for the given seconds after a few warmup requests each
+    def run_clients(self, request, paths, concurrency, options):
+        async def clients():
+            latencies, errors, warm = [], [0], []
+            ready, window = asyncio.Event(), {}
+
+            async def client(seed):
+                rng = random.Random(seed)
+                for _ in range(3):
+                    await request(*paths(rng))
+                warm.append(seed)
+                if len(warm) == concurrency:
+                    window['start'] = time.perf_counter()
+                    window['deadline'] = window['start'] + options['seconds']
+                    ready.set()
+                await ready.wait()
+                while time.perf_counter() < window['deadline']:
+                    start = time.perf_counter()
+                    if await request(*paths(rng)) < 400:
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    else:
+                        errors[0] += 1
+
+            await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+            return self.summarize(concurrency, latencies, errors[0], time.perf_counter() - window['start'])
+
+        return asyncio.run(clients())
+
+    def serve_wsgi(self, paths, concurrency, options):
+        application = get_wsgi_application()
+        pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+        def call(path, query):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'REMOTE_ADDR': '127.0.0.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+                'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            statuses = []
+            body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            return int(statuses[0].split()[0])
+
+        async def request(path, query):
+            return await asyncio.get_running_loop().run_in_executor(pool, call, path, query)
+
+        try:
+            return self.run_clients(request, paths, concurrency, options)
+        finally:
+            pool.shutdown()
+
+    def serve_asgi(self, paths, concurrency, options):
+        application = get_asgi_application()
+
+        async def request(path, query):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': query.encode(), 'headers': [(b'host', b'testserver')],
+                'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            }
+            sent, disconnected = [], asyncio.Event()
+
+            # the body is sent at once; the client then stays connected until answered
+            async def receive():
+                if not sent:
+                    sent.append(None)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            await application(scope, receive, send)
+            return statuses[0]
+
+        return self.run_clients(request, paths, concurrency, options)
+
+    # Runs each server in a subprocess, which reads ASYNC_VIEWS, the database settings and
+    # the cache timeout from the environment at startup
+    def compare(self, options):
+        results = {}
+        for server in SERVERS:
+            environ = {**os.environ, 'ASYNC_VIEWS': str(server == 'asgi')}
+            if server == 'asgi':
+                # as asgi.py does
+                environ.setdefault('DB_CONN_MAX_AGE', '0')
+            if not options['cache']:
+                environ['CATALOG_CACHE_TIMEOUT'] = '0'
+            command = [sys.executable, '-m', 'django', 'servebench', f'--server={server}', '--json',
+                       '--concurrency', *map(str, options['concurrency']),
+                       f'--seconds={options["seconds"]}', f'--threads={options["threads"]}',
+                       f'--products={options["products"]}', f'--db-latency={options["db_latency"]}']
+            self.stdout.write(f'Running {server}...')
+            run = subprocess.run(command, env=environ, cwd=settings.BASE_DIR,
+                                 capture_output=True, text=True)
+            if run.returncode:
+                raise CommandError(f'{server} failed:\n{run.stderr}')
+            results[server] = json.loads(run.stdout.strip().splitlines()[-1])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        self.stdout.write(f'{"server":<8}{"clients":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        for server, result in results.items():
+            for level in result['levels']:
+                self.stdout.write(f'{server:<8}{level["concurrency"]:>8}{level["requests_per_sec"]:>10}'
+                                  f'{level["p50_ms"]:>10}{level["p95_ms"]:>10}{level["errors"]:>8}')
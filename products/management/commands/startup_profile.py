@@ -0,0 +1,67 @@
+# Importing modules, functions and classes
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Startup Profile Command: profiles a cold start of the project in a fresh interpreter
+# (see e_commerce_api/startup.py) with `python -X importtime`, and reports the time of
+# each startup phase, and the import time per package and of the slowest modules.
+# With --lean, the cold start uses the lean configuration (LEAN_STARTUP=True).
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Profiles the import time of a cold start, per package and module'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/products/', help='URL path to resolve')
+        parser.add_argument('--top', type=int, default=20, help='Number of packages and modules to list')
+        parser.add_argument('--lean', action='store_true', help='Start with LEAN_STARTUP=True')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        environ = {**os.environ, 'LEAN_STARTUP': str(options['lean'])}
+        run = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'e_commerce_api.startup', options['path']],
+                             env=environ, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if run.returncode:
+            raise CommandError(f'The cold start failed:\n{run.stderr}')
+        results = json.loads(run.stdout.strip().splitlines()[-1])
+
+        # microseconds spent importing each module itself, and with the modules it imported
+        packages, modules = Counter(), []
+        for line in run.stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match:
+                own, cumulative, _, module = match.groups()
+                packages[module.split('.')[0]] += int(own)
+                modules.append((int(cumulative), int(own), module))
+        modules.sort(reverse=True)
+        results['import_seconds'] = round(sum(packages.values()) / 10 ** 6, 4)
+        results['packages'] = {package: round(own / 10 ** 6, 4)
+                               for package, own in packages.most_common(options['top'])}
+        results['modules'] = [{'module': module, 'seconds': round(cumulative / 10 ** 6, 4),
+                               'own_seconds': round(own / 10 ** 6, 4)}
+                              for cumulative, own, module in modules[:options['top']]]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        self.stdout.write(f'Cold start ({"lean" if results["lean"] else "default"} configuration), '
+                          f'resolving {options["path"]} to {results["view"]}:')
+        for phase, seconds in results['seconds'].items():
+            self.stdout.write(f'  {phase:<10}{seconds * 1000:>10.1f} ms')
+        self.stdout.write(f'{len(modules)} modules imported in {results["import_seconds"] * 1000:.1f} ms; '
+                          'per package:')
+        for package, seconds in results['packages'].items():
+            self.stdout.write(f'  {package:<40}{seconds * 1000:>10.1f} ms')
+        self.stdout.write('Slowest modules, with the modules they import:')
+        for row in results['modules']:
+            self.stdout.write(f'  {row["module"]:<50}{row["seconds"] * 1000:>10.1f} ms'
+                              f'{row["own_seconds"] * 1000:>10.1f} ms own')
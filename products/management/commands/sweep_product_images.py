@@ -0,0 +1,37 @@
+# Importing classes and functions
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from products.sweep import (hash_unhashed_images, sweep_expired_uploads,
+                            sweep_orphaned_files)
+
+# Deletes product image files no image refers to any more and abandoned uploads. The
+# files of deleted images are also removed in the background as they go; run this from
+# cron to catch the rest.
+
+
+class Command(BaseCommand):
+    help = 'Deletes orphaned product image files and expired uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int,
+                            help='Keep files newer than this (default: MEDIA_SWEEP_GRACE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List what would be deleted without deleting it')
+        parser.add_argument('--hash-missing', action='store_true',
+                            help='Also hash images stored before content hashes existed')
+
+    def handle(self, *args, **options):
+        if options['hash_missing']:
+            self.stdout.write(f'Hashed {hash_unhashed_images()} images')
+
+        grace = options['grace_minutes']
+        orphans = sweep_orphaned_files(
+            grace=None if grace is None else timedelta(minutes=grace), dry_run=options['dry_run'])
+        for name in orphans:
+            self.stdout.write(name)
+        uploads = sweep_expired_uploads(dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(orphans)} orphaned files and {uploads} expired uploads'))
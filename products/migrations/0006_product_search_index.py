@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Kept in the migration rather than imported from products.search, so that the
+# migration does not change when that module does
+FTS_TABLE = 'products_product_fts'
+
+
+# Whether the database can hold the full-text index: SQLite built with FTS5
+def search_index_enabled(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+# Creates the full-text index on SQLite builds with FTS5 and fills it with the existing catalog
+def create_search_index(apps, schema_editor):
+    if not search_index_enabled(schema_editor.connection):
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+        'name, description, category, tokenize="unicode61 remove_diacritics 2")')
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+        'SELECT p.id, p.name, COALESCE(p.description, \'\'), c.name '
+        'FROM products_product p INNER JOIN products_category c ON c.id = p.category_id')
+
+
+def drop_search_index(apps, schema_editor):
+    if not search_index_enabled(schema_editor.connection):
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_alter_discount_discount_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Fills the aggregates of the products rated before they existed
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Rating = apps.get_model('products', 'Rating')
+    histograms = {}
+    for row in Rating.objects.values('product_id', 'rating').annotate(count=Count('id')):
+        histograms.setdefault(row['product_id'], {})[row['rating']] = row['count']
+    for product_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        Product.objects.filter(pk=product_id).update(
+            rating_count=count,
+            avg_rating=round(sum(star * n for star, n in histogram.items()) / count, 2),
+            **{f'ratings_{star}': n for star, n in histogram.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
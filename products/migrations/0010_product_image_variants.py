@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='medium',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='webp',
+            field=models.ImageField(blank=True, null=True, upload_to='product_images/variants/'),
+        ),
+    ]
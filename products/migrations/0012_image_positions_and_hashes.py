@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Numbers the images of each product in the order they were added
+def number_image_positions(apps, schema_editor):
+    ProductImage = apps.get_model('products', 'ProductImage')
+    changed, product_id, position = [], None, 0
+    for image in ProductImage.objects.order_by('product_id', 'id').only('id', 'product_id'):
+        position = position + 1 if image.product_id == product_id else 0
+        product_id = image.product_id
+        if position:
+            image.position = position
+            changed.append(image)
+    ProductImage.objects.bulk_update(changed, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_image_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='imageupload',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='products.productimage'),
+        ),
+        migrations.RunPython(number_image_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# Keeps the first entry of every product added several times to a user's wishlist
+def delete_duplicate_entries(apps, schema_editor):
+    WishList = apps.get_model('products', 'WishList')
+    duplicates = WishList.objects.values('user_id', 'product_id').annotate(
+        count=Count('id'), first=Min('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        WishList.objects.filter(user_id=duplicate['user_id'], product_id=duplicate['product_id']) \
+            .exclude(pk=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_image_positions_and_hashes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_wishlist_product'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_catalog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_count', 'id'], name='product_rating_count_idx'),
+        ),
+    ]
@@ -1,10 +1,18 @@
 # Importing modules, functions and classes
+import math
+import uuid
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast
 from django.utils import timezone
 
+from .cache import invalidate_catalog
+
 User = get_user_model()
 
 # Category Model
@@ -14,6 +22,7 @@ class Category(models.Model):
                             null=False, blank=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['id']
@@ -45,10 +54,102 @@ class Discount(models.Model):
     end_date = models.DateTimeField()
     active = models.BooleanField(default=True)
     product = models.ManyToManyField('Product', related_name='discounts')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # only active discounts are ever looked up by period, see next_change
+            models.Index(fields=['start_date', 'end_date'], condition=models.Q(active=True),
+                         name='discount_active_period_idx'),
+            # covers Discount.state, read for the ETag of every product list
+            models.Index(fields=['updated_at', 'start_date', 'end_date'], name='discount_state_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    # Returns when the set of active discounts next changes, or None if it never does
+    @classmethod
+    def next_change(cls):
+        changes = cls.objects.filter(active=True).aggregate(**cls.next_change_aggregates())
+        return min(filter(None, changes.values()), default=None)
+
+    @classmethod
+    async def anext_change(cls):
+        changes = await cls.objects.filter(active=True).aaggregate(**cls.next_change_aggregates())
+        return min(filter(None, changes.values()), default=None)
+
+    @staticmethod
+    def next_change_aggregates():
+        now = timezone.now()
+        return {'next_start': models.Min('start_date', filter=models.Q(start_date__gt=now)),
+                'next_end': models.Min('end_date', filter=models.Q(end_date__gte=now))}
+
+    # Summarizes what decides which discounts are in effect: how many there are, when one
+    # was last changed and the last start or end date that has passed
+    @classmethod
+    def state(cls, discounts=None):
+        discounts = cls.objects.all() if discounts is None else discounts
+        return discounts.aggregate(**cls.state_aggregates())
+
+    @classmethod
+    async def astate(cls, discounts=None):
+        discounts = cls.objects.all() if discounts is None else discounts
+        return await discounts.aaggregate(**cls.state_aggregates())
+
+    @staticmethod
+    def state_aggregates():
+        now = timezone.now()
+        return {'count': models.Count('id'), 'updated': models.Max('updated_at'),
+                'started': models.Max('start_date', filter=models.Q(start_date__lte=now)),
+                'ended': models.Max('end_date', filter=models.Q(end_date__lt=now))}
+
+    # Applies this discount to a price, never going below zero
+    def apply(self, price):
+        if self.discount_type == Discount.PERCENTAGE:
+            return price * (1 - self.value / 100)
+        elif self.discount_type == Discount.FIXED:
+            return max(price - self.value, Decimal('0'))
+        return price
+
+
+# Product QuerySet
+class ProductQuerySet(models.QuerySet):
+    # Prefetches the discounts that are active right now, so that the discounted
+    # price of a whole page of products is resolved with a single extra query
+    def with_active_discounts(self):
+        now = timezone.now()
+        active_discounts = Discount.objects.filter(
+            active=True, start_date__lte=now, end_date__gte=now).order_by('id')
+        return self.prefetch_related(models.Prefetch(
+            'discounts', queryset=active_discounts, to_attr='active_discounts'))
+
+    # Fetches every relation ProductSerializer reads, in a fixed number of queries.
+    # category and created_by are serialized as primary keys straight from the
+    # foreign key columns, so they need no join.
+    def for_catalog(self):
+        return self.with_active_discounts().prefetch_related('images')
+
+    # Applies a rating change to the rating aggregates of these products: `added` is the
+    # star value of a new rating, `removed` that of a deleted one, both for an edited one.
+    # Should run in the transaction that changes the rating.
+    def apply_rating_change(self, added=None, removed=None):
+        changes = {'rating_count': F('rating_count') + (added is not None) - (removed is not None)}
+        if added != removed:
+            if added is not None:
+                changes[f'ratings_{added}'] = F(f'ratings_{added}') + 1
+            if removed is not None:
+                changes[f'ratings_{removed}'] = F(f'ratings_{removed}') - 1
+        self.update(**changes, updated_at=timezone.now())
+
+        # the average is recomputed from the histogram the first UPDATE left behind
+        stars = sum(F(f'ratings_{star}') * star for star in range(1, 6))
+        self.update(avg_rating=Case(
+            When(rating_count=0, then=Value(0)),
+            default=Cast(stars, models.FloatField()) / F('rating_count'),
+            output_field=models.DecimalField(max_digits=3, decimal_places=2)))
+        invalidate_catalog('products')
+
 
 # Product Model.
 class Product(models.Model):
@@ -56,47 +157,108 @@ class Product(models.Model):
     description = models.TextField(null=True)
     price = models.DecimalField(
         null=False, max_digits=8, decimal_places=2, default=0.0)
-    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    # looked up through the (category, price) index
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=False)
     stock_quantity = models.PositiveIntegerField(default=0, null=False)
     # image = models.ImageField(null=True, editable=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Rating aggregates, kept up to date by ProductQuerySet.apply_rating_change
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    ratings_1 = models.PositiveIntegerField(default=0)
+    ratings_2 = models.PositiveIntegerField(default=0)
+    ratings_3 = models.PositiveIntegerField(default=0)
+    ratings_4 = models.PositiveIntegerField(default=0)
+    ratings_5 = models.PositiveIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    # Indexes for the catalog's filters and orderings (see ProductFilter and ListProductView)
+    class Meta:
+        indexes = [
+            # category filter, alone or with a price range
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            # default ordering, with the id tie-break of cursor pagination
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['stock_quantity'], name='product_stock_idx'),
+            # min_rating filter and rating ordering
+            models.Index(fields=['avg_rating'], name='product_rating_idx'),
+            # rating count ordering, with the id tie-break of cursor pagination
+            models.Index(fields=['rating_count', 'id'], name='product_rating_count_idx'),
+            # ETag validators of unfiltered lists read a narrow index, not every row
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    # Reduces the stock with a single conditional UPDATE, so concurrent purchases can never oversell
     def reduce_stock(self, quantity):
-        if self.stock_quantity >= quantity:
-            self.stock_quantity -= quantity
-            self.save()
-        else:
+        updated = Product.objects.filter(pk=self.pk, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity, updated_at=timezone.now())
+        if updated:
+            invalidate_catalog('products')
+        self.refresh_from_db(fields=['stock_quantity'])
+        if not updated:
             raise ValidationError(f"Not enough stock. Available stock is {self.stock_quantity}")
 
+    # Number of ratings per star value
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'ratings_{star}') for star in range(1, 6)}
+
     # Discount Property
     @property
     def discounted_price(self):
-        active_discount = self.discounts.filter(active=True, start_date__lte=timezone.now(),
-                                                end_date__gte=timezone.now()).first()
+        # Uses the discounts prefetched by ProductQuerySet.with_active_discounts when available
+        if hasattr(self, 'active_discounts'):
+            active_discount = self.active_discounts[0] if self.active_discounts else None
+        else:
+            active_discount = self.discounts.filter(active=True, start_date__lte=timezone.now(),
+                                                    end_date__gte=timezone.now()).order_by('id').first()
         if active_discount:
-            if active_discount.discount_type == Discount.PERCENTAGE:
-                return self.price * (1 - active_discount.value / 100)
-            elif active_discount.discount_type == Discount.FIXED:
-                return max(self.price - active_discount.value, 0)
+            return active_discount.apply(self.price)
         return self.price
 
 
 # Product Image Model
 class ProductImage(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(
         upload_to='product_images/', null=True, blank=True, editable=True)
+    # Resized variants, generated in the background after upload (see images.py)
+    thumbnail = models.ImageField(upload_to='product_images/variants/', null=True, blank=True)
+    medium = models.ImageField(upload_to='product_images/variants/', null=True, blank=True)
+    webp = models.ImageField(upload_to='product_images/variants/', null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS, default=PENDING)
+    # Place of the image among the images of its product
+    position = models.PositiveIntegerField(default=0)
+    # Hex SHA-256 digest of the image file; images with the same content share their files
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ['position', 'id']
 
 
 # Rating Model
 class Rating(models.Model):
+    # looked up through the (product, user) and (product, -created_at) indexes
     product = models.ForeignKey(
-        Product, on_delete=models.CASCADE, related_name='rating')
+        Product, on_delete=models.CASCADE, related_name='rating', db_index=False)
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='rated')
     rating = models.PositiveIntegerField(choices=(
@@ -106,6 +268,10 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ['product', 'user']
+        indexes = [
+            # the ratings of a product, newest first
+            models.Index(fields=['product', '-created_at'], name='rating_product_created_idx'),
+        ]
 
     def __str__(self):
         return f"Rating: {self.user} gave {self.rating}-star to {self.product}"
@@ -115,8 +281,90 @@ class Rating(models.Model):
 
 class WishList(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # looked up through the unique (user, product) index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['created_at']
+        # A product is in a user's wishlist once; the index also serves per-user lookups
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_wishlist_product'),
+        ]
+
+
+# Stock Reservation Model: stock held for a user until it is confirmed, released or expires
+class StockReservation(models.Model):
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='stock_reservations')
+    status = models.CharField(max_length=10, choices=STATUS, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Reservation {self.id} ({self.status}) by {self.user}"
+
+
+# Stock Reservation Item Model
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(
+        StockReservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservation_items')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+
+
+# Image Upload Model: a resumable upload of a product image, sent in fixed-size chunks
+# stored on disk until the image is assembled (see uploads.py)
+class ImageUpload(models.Model):
+    OPEN = 'open'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS = [
+        (OPEN, 'Open'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='image_uploads')
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='image_uploads')
+    filename = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # Hex SHA-256 digest of the whole file, checked once it is assembled
+    sha256 = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS, default=OPEN)
+    image = models.ForeignKey(
+        ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.status}) of {self.filename}"
+
+    @property
+    def chunk_count(self):
+        return max(math.ceil(self.size / self.chunk_size), 1)
+
+    # Expected size of a chunk: chunk_size, except for the last one
+    def expected_chunk_size(self, index):
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.chunk_count - 1)
@@ -0,0 +1,95 @@
+# Importing modules and classes
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.response import Response
+
+# Product Cursor Pagination: keyset pagination over the catalog.
+# The position of a product is the value of every ordering field, the id last, so it is
+# unique: pages are fetched with a WHERE past the last seen position on all of them
+# (e.g. avg_rating < x OR (avg_rating = x AND id < y)) instead of an OFFSET scan, even
+# where most products tie on the first field, and rows inserted meanwhile never shift a
+# page. No COUNT(*) is run unless the client asks for it with ?count=true.
+
+
+class ProductCursorPagination(CursorPagination):
+    ordering = ('created_at', 'id')
+
+    # DRF's CursorPagination filters on the first ordering field only and skips ties with
+    # an offset; this is the same walk with the position of every field
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get('count') == 'true':
+            self.count = queryset.count()
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.after(ordering, current_position))
+
+        # one more row tells whether a page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next, self.has_previous = following_position is not None, current_position is not None
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    # Returns the condition on rows past a position, in the given ordering
+    def after(self, ordering, position):
+        values = json.loads(position)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition, equal = Q(), Q()
+        for order, value in zip(ordering, values):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is not None and cursor.position is not None:
+            try:
+                json.loads(cursor.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([str(getattr(instance, order.lstrip('-'))) for order in ordering])
+
+    # Keeps the ordering total by breaking ties on the primary key
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering[-1].lstrip('-') != 'id':
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
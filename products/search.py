@@ -0,0 +1,92 @@
+# Importing modules, functions and classes
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+# Full-text search index for the product catalog.
+# On SQLite builds with FTS5 the name, description and category name of every product
+# are kept in an inverted index (products_product_fts, rowid = product id). Other
+# backends fall back to DRF's icontains SearchFilter.
+
+FTS_TABLE = 'products_product_fts'
+
+# Relevance weights of the name, description and category columns for bm25()
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+_fts5_support = {}
+
+
+# Checks whether the database behind an alias can hold the full-text index
+def search_index_enabled(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    if using not in _fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            _fts5_support[using] = any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+    return _fts5_support[using]
+
+
+# Turns search terms into an FTS5 query that prefix-matches every word
+def build_match_query(terms):
+    words = [word for term in terms for word in re.findall(r'\w+', term)]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Adds or refreshes products in the index. Products should have their category loaded.
+def index_products(products, using=DEFAULT_DB_ALIAS):
+    if not search_index_enabled(using):
+        return
+    rows = [(product.id, product.name, product.description or '', product.category.name)
+            for product in products]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description, category) '
+            'VALUES (%s, %s, %s, %s)', rows)
+
+
+# Removes products from the index
+def unindex_products(product_ids, using=DEFAULT_DB_ALIAS):
+    if not search_index_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [(product_id,) for product_id in product_ids])
+
+
+# Refreshes the category name of every product in a category
+def reindex_category(category, using=DEFAULT_DB_ALIAS):
+    if not search_index_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {FTS_TABLE} SET category = %s WHERE rowid IN '
+            '(SELECT id FROM products_product WHERE category_id = %s)',
+            [category.name, category.id])
+
+
+# Product Search Filter: matches ?search= terms against the full-text index and,
+# unless an explicit ordering is requested, ranks the results by relevance
+
+
+class ProductSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        match_query = build_match_query(terms)
+        if not match_query or not search_index_enabled(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        # Joins the index so the MATCH drives the query and each product is read by primary key
+        table = queryset.model._meta.db_table
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        queryset = queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = "{table}"."id"', f'{FTS_TABLE} MATCH %s'],
+            params=[match_query])
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('search_rank', 'id')
+        return queryset
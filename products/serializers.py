@@ -1,13 +1,42 @@
 # Importing modules, functions and classes
+import os
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import File
+from django.core.validators import validate_image_file_extension
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from .models import Category, Discount, Product, ProductImage, Rating, WishList
+from .images import add_image
+from .models import (Category, Discount, ImageUpload, Product, ProductImage,
+                     Rating, StockReservation, StockReservationItem, WishList)
+from .stock import reserve_stock, take_stock_bulk
+from .uploads import received_chunks
 
 User = get_user_model()
 
+
+# Primary key field resolving its value among rows preloaded in the serializer context,
+# so that validating a batch of items costs one query per related model, not per item.
+# Falls back to a query when nothing was preloaded.
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 # Category Serializer
 
 
@@ -19,10 +48,65 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 # ProductImage Serializer
+# The variants are null until the image has been processed in the background
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnail', 'medium', 'webp', 'status', 'position']
+        read_only_fields = ['thumbnail', 'medium', 'webp', 'status', 'position']
+        extra_kwargs = {'image': {'required': True, 'allow_null': False}}
+
+
+# Image Order Serializer: the ids of every image of a product, in their new order
+class ImageOrderSerializer(serializers.Serializer):
+    order = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_order(self, value):
+        image_ids = set(self.context['product'].images.values_list('id', flat=True))
+        if len(value) != len(set(value)) or set(value) != image_ids:
+            raise serializers.ValidationError('Give the id of every image of the product once')
+        return value
+
+
+# Image Upload Serializer: opens a resumable upload of a product image. The chunk
+# size is set by the server; `received_chunks` tells a client which chunks to resend.
+class ImageUploadSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', max_length=64,
+                                    error_messages={'invalid': 'Expected a hex SHA-256 digest.'})
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    image = ProductImageSerializer(read_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'product', 'filename', 'size', 'sha256', 'chunk_size', 'chunk_count',
+                  'received_chunks', 'status', 'image', 'created_at']
+        read_only_fields = ['chunk_size', 'status', 'created_at']
+
+    def get_received_chunks(self, obj):
+        return received_chunks(obj) if obj.status == ImageUpload.OPEN else []
+
+    # Filename validation: keeps the base name only, with an image extension
+    def validate_filename(self, value):
+        value = os.path.basename(value.replace('\\', '/'))
+        try:
+            validate_image_file_extension(File(None, name=value))
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return value
+
+    # Size validation: no larger than UPLOAD_MAX_SIZE
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes')
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+    def create(self, validated_data):
+        return super().create({**validated_data, 'chunk_size': settings.UPLOAD_CHUNK_SIZE})
 
 
 # Discount Serializer
@@ -50,12 +134,15 @@ class ProductSerializer(serializers.ModelSerializer):
     price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.00'),
                                      max_value=Decimal('1000000.00'))
     discounted_price = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    in_wishlist = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'discounted_price', 'category',
-                  'stock_quantity', 'created_at', 'created_by', 'images', 'uploaded_images']
-        read_only_fields = ['created_by', 'created_at', 'images']
+                  'stock_quantity', 'avg_rating', 'rating_count', 'rating_histogram',
+                  'in_wishlist', 'created_at', 'created_by', 'images', 'uploaded_images']
+        read_only_fields = ['created_by', 'created_at', 'images', 'avg_rating', 'rating_count']
 
         # Name validation: Handles validation for name field to prevent empty field or whitespace
 
@@ -83,38 +170,79 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_discounted_price(self, obj):
         return obj.discounted_price
 
+    # Whether the product is in the user's wishlist, from the ids views put in the context
+    # for a whole page; null when they were not asked for
+    def get_in_wishlist(self, obj):
+        wishlist = self.context.get('wishlist')
+        return None if wishlist is None else obj.id in wishlist
+
     # Handles the process of creating a product with multiple images for each at a go
 
     def create(self, validated_data):
         uploaded_images = validated_data.pop("uploaded_images")
         product = Product.objects.create(**validated_data)
-        for image in uploaded_images:
-            ProductImage.objects.create(product=product, image=image)
+        self._handle_images(product, uploaded_images)
         return product
 
-    # Handles Product Update
+    # Handles Product Update: uploaded images are added after the existing ones, which
+    # are removed and reordered through the product images endpoint
     def update(self, instance, validated_data):
-        uploaded_images = validated_data.pop("uploaded_images")
+        uploaded_images = validated_data.pop("uploaded_images", [])
+        instance = super().update(instance, validated_data)
+        self._handle_images(instance, uploaded_images)
+        return instance
 
-        for attr, value in validated_data.items():
-            # Update the product fields
-            for attr, value in validated_data.items():
-                setattr(instance, attr, value)
-                instance.save()
+    # Adds the images a product does not have yet; identical files are stored once
+    def _handle_images(self, product, uploaded_images):
+        for image in uploaded_images:
+            add_image(product, image)
 
-            # Handle the images
-            self._handle_images(instance, uploaded_images)
 
-            return instance
+# Product Import Serializer: validates the rows of a product import with the product
+# rules. The category is given by name and images by their path in media storage.
+class ProductImportSerializer(ProductSerializer):
+    category = serializers.CharField(max_length=255)
+    images = serializers.ListField(child=serializers.CharField(max_length=100), default=list)
+    uploaded_images = None
+    discounted_price = None
+    rating_histogram = None
+    in_wishlist = None
 
-    def _handle_images(self, product, uploaded_images):
-        # If there are new images, delete the old ones
-        if uploaded_images:
-            product.images.all().delete()
+    class Meta:
+        model = Product
+        fields = ['name', 'description', 'price', 'category', 'stock_quantity', 'images']
 
-        # Create new image instances
-        for image in uploaded_images:
-            ProductImage.objects.create(product=product, image=image)
+    # Resolves the category through the importer's in-memory map
+    def validate_category(self, value):
+        return self.context['categories'].resolve(value)
+
+
+# Product Bulk Serializer: validates the items of bulk product changes, without images
+class ProductBulkSerializer(ProductSerializer):
+    category = PreloadedPrimaryKeyRelatedField(queryset=Category.objects.all())
+    uploaded_images = None
+    images = None
+    discounted_price = None
+    rating_histogram = None
+    in_wishlist = None
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'description', 'price', 'category', 'stock_quantity']
+
+    # Bulk views write the rows themselves; a single item saves like any model
+    # serializer, as there are no images to handle
+    def create(self, validated_data):
+        return serializers.ModelSerializer.create(self, validated_data)
+
+    def update(self, instance, validated_data):
+        return serializers.ModelSerializer.update(self, instance, validated_data)
+
+
+# Discount Bulk Serializer: validates the items of bulk discount changes
+class DiscountBulkSerializer(DiscountSerializer):
+    product = PreloadedPrimaryKeyRelatedField(queryset=Product.objects.all(), many=True,
+                                              required=False)
 
 
 # Serializer for the Rating Model
@@ -142,10 +270,122 @@ class WishListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = WishList
-        fields = ['id', 'product_id', 'product_name', 'user']
-        read_only_fields = ['user']
+        fields = ['id', 'product_id', 'product_name', 'user', 'created_at']
+        read_only_fields = ['user', 'created_at']
+
+    # Product validation: each product is in a user's wishlist once
+    def validate_product_id(self, value):
+        if WishList.objects.filter(user=self.context['request'].user, product=value).exists():
+            raise serializers.ValidationError('This product is already in your wishlist')
+        return value
 
     # validate and create WishList
     def create(self, validated_data):
         user = self.context['request'].user
-        return WishList.objects.create(user=user, **validated_data)
+        try:
+            with transaction.atomic():
+                return WishList.objects.create(user=user, **validated_data)
+        except IntegrityError:
+            # added by a concurrent request since validation
+            raise serializers.ValidationError(
+                {'product_id': ['This product is already in your wishlist']})
+
+
+# Wishlist Lookup Serializer: a page of product ids to look up in the user's wishlist
+class WishListLookupSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False,
+                                        max_length=100)
+
+
+# Purchase Serializer: the quantity of a product to buy
+class PurchaseSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=1)
+
+
+# Stock Reservation Item Serializer
+class StockReservationItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservationItem
+        fields = ['product', 'quantity']
+
+
+# Stock Reservation Serializer: holds stock for every item in one transaction
+class StockReservationSerializer(serializers.ModelSerializer):
+    items = StockReservationItemSerializer(many=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'status', 'items', 'created_at', 'expires_at']
+        read_only_fields = ['status', 'created_at', 'expires_at']
+
+    # Items validation: at least one item and each product only once
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError('A reservation needs at least one item')
+        product_ids = [item['product'].id for item in value]
+        if len(product_ids) != len(set(product_ids)):
+            raise serializers.ValidationError('Each product can only be reserved once per reservation')
+        return value
+
+    def create(self, validated_data):
+        lines = [(item['product'].id, item['quantity']) for item in validated_data['items']]
+        try:
+            return reserve_stock(self.context['request'].user, lines)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'items': error.messages})
+
+
+# Checkout Line Serializer
+class CheckoutLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+# Checkout Serializer: prices a whole cart and takes its stock in one transaction.
+# Errors are reported per line, in the order the lines were sent.
+class CheckoutSerializer(serializers.Serializer):
+    lines = CheckoutLineSerializer(many=True, allow_empty=False, max_length=100)
+
+    # Loads every product of the cart, with its active discounts, in one query each
+    def validate_lines(self, lines):
+        product_ids = [line['product_id'] for line in lines]
+        self.products = Product.objects.with_active_discounts().in_bulk(product_ids)
+
+        errors, seen = [], set()
+        for line in lines:
+            product = self.products.get(line['product_id'])
+            if line['product_id'] in seen:
+                errors.append({'product_id': ['Each product can only appear once per cart']})
+            elif product is None:
+                errors.append({'product_id': ['Product does not exist']})
+            elif product.stock_quantity < line['quantity']:
+                errors.append({'quantity': [
+                    f'Not enough stock. Available stock is {product.stock_quantity}']})
+            else:
+                errors.append({})
+            seen.add(line['product_id'])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return lines
+
+    def create(self, validated_data):
+        lines = validated_data['lines']
+        # priced before the stock is taken, so that nothing past the UPDATE can fail
+        summary = []
+        for line in lines:
+            unit_price = self.products[line['product_id']].discounted_price.quantize(Decimal('0.01'))
+            summary.append({
+                'product_id': line['product_id'],
+                'quantity': line['quantity'],
+                'unit_price': unit_price,
+                'line_total': unit_price * line['quantity'],
+            })
+
+        # the stock may have changed since validation: the UPDATE has the final word
+        shortages = take_stock_bulk([(line['product_id'], line['quantity']) for line in lines])
+        if shortages:
+            raise serializers.ValidationError({'lines': [
+                {'quantity': [f'Not enough stock. Available stock is {shortages[line["product_id"]]}']}
+                if line['product_id'] in shortages else {}
+                for line in lines]})
+        return {'lines': summary, 'total': sum(line['line_total'] for line in summary)}
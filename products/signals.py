@@ -0,0 +1,86 @@
+# Importing functions and classes
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .images import FILE_FIELDS, schedule_file_cleanup, schedule_variants
+from .models import Category, Discount, Product, ProductImage
+from .search import index_products, reindex_category, unindex_products
+
+# Keeps the product search index in step with product and category changes
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, using, **kwargs):
+    index_products([instance], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, using, **kwargs):
+    unindex_products([instance.id], using=using)
+
+
+@receiver(post_save, sender=Category)
+def reindex_saved_category(sender, instance, created, using, **kwargs):
+    if not created:
+        reindex_category(instance, using=using)
+
+
+# Invalidates cached catalog responses whenever what they show changes
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_cached_products(sender, **kwargs):
+    invalidate_catalog('products')
+
+
+@receiver(m2m_changed, sender=Discount.product.through)
+def invalidate_cached_discounted_products(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_catalog('products')
+
+
+# Category names are shown on, and searched through, product responses
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_cached_categories(sender, **kwargs):
+    invalidate_catalog('categories', 'products')
+
+
+# Bumps updated_at of the rows whose representation changes through a related model
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product_of_image(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# the links of a deleted discount go without m2m_changed
+@receiver(pre_delete, sender=Discount)
+def touch_products_of_discount(sender, instance, **kwargs):
+    instance.product.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Discount.product.through)
+def touch_discount_links(sender, instance, action, model, pk_set, **kwargs):
+    if action.startswith('post_'):
+        type(instance).objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        if pk_set:
+            model.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+
+
+# Queues new product images for resizing in the background
+
+@receiver(post_save, sender=ProductImage)
+def process_new_image(sender, instance, created, **kwargs):
+    if created and instance.image and instance.status == ProductImage.PENDING:
+        schedule_variants([instance.pk])
+
+
+# Deletes the files of deleted product images in the background, unless other
+# images share them
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_files(sender, instance, **kwargs):
+    schedule_file_cleanup([getattr(instance, field).name for field in FILE_FIELDS])
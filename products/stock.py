@@ -0,0 +1,127 @@
+# Importing modules, functions and classes
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .models import Product, StockReservation, StockReservationItem
+
+# Stock ledger: every change to stock_quantity is a conditional UPDATE evaluated by the
+# database, so concurrent purchases and reservations can never take more than is in stock.
+# Updates bypass the model signals, so they bump updated_at and invalidate cached catalog
+# responses themselves.
+
+
+# Takes stock of a product, returning False when there is not enough left
+def take_stock(product_id, quantity):
+    updated = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity, updated_at=timezone.now())
+    if updated:
+        invalidate_catalog('products')
+    return updated == 1
+
+
+# Attempts of take_stock_bulk; the last one locks the rows before taking their stock
+TAKE_STOCK_ATTEMPTS = 3
+
+
+# Takes stock for several (product_id, quantity) lines with a single UPDATE, all or nothing.
+# Every line is guarded by its own stock condition. Returns the {product_id: available}
+# shortages, empty when the stock was taken.
+def take_stock_bulk(lines):
+    product_ids = [product_id for product_id, _ in lines]
+    if len(set(product_ids)) != len(product_ids):
+        raise ValueError('Each product can only appear once in the lines of take_stock_bulk()')
+    condition = Q()
+    for product_id, quantity in lines:
+        condition |= Q(pk=product_id, stock_quantity__gte=quantity)
+    decrement = Case(*[When(pk=product_id, then=Value(quantity)) for product_id, quantity in lines],
+                     output_field=models.PositiveIntegerField())
+    for attempt in range(TAKE_STOCK_ATTEMPTS):
+        with transaction.atomic():
+            if attempt == TAKE_STOCK_ATTEMPTS - 1:
+                # the stock of locked rows cannot change between the check and the UPDATE
+                shortages = find_shortages(lines, Product.objects.select_for_update())
+                if shortages:
+                    return shortages
+            updated = Product.objects.filter(condition).update(
+                stock_quantity=F('stock_quantity') - decrement, updated_at=timezone.now())
+            if updated == len(lines):
+                invalidate_catalog('products')
+                return {}
+            transaction.set_rollback(True)
+        shortages = find_shortages(lines)
+        # stock came back between the UPDATE and the read: try again
+        if shortages:
+            return shortages
+    raise RuntimeError('The stock of locked products could not be taken')
+
+
+# Returns the {product_id: available} shortages of (product_id, quantity) lines
+def find_shortages(lines, products=Product.objects):
+    available = dict(products.filter(pk__in=[product_id for product_id, _ in lines])
+                     .values_list('id', 'stock_quantity'))
+    return {product_id: available.get(product_id, 0) for product_id, quantity in lines
+            if available.get(product_id, 0) < quantity}
+
+
+# Puts stock of a product back
+def return_stock(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(
+        stock_quantity=F('stock_quantity') + quantity, updated_at=timezone.now())
+    invalidate_catalog('products')
+
+
+# Holds stock for several (product_id, quantity) lines at once, all or nothing
+def reserve_stock(user, lines, hold=None):
+    release_expired_reservations()
+    hold = hold or settings.STOCK_RESERVATION_HOLD
+    with transaction.atomic():
+        shortages = take_stock_bulk(lines)
+        if shortages:
+            raise ValidationError([
+                f"Not enough stock for product {product_id}. Available stock is {available}"
+                for product_id, available in shortages.items()])
+        reservation = StockReservation.objects.create(
+            user=user, expires_at=timezone.now() + hold)
+        StockReservationItem.objects.bulk_create([
+            StockReservationItem(reservation=reservation, product_id=product_id, quantity=quantity)
+            for product_id, quantity in lines])
+    return reservation
+
+
+# Turns a held reservation into a purchase. The stock was already taken when it was held.
+def confirm_reservation(reservation):
+    if reservation.status == StockReservation.HELD and reservation.expires_at <= timezone.now():
+        release_reservation(reservation)
+    updated = StockReservation.objects.filter(
+        pk=reservation.pk, status=StockReservation.HELD).update(status=StockReservation.CONFIRMED)
+    reservation.refresh_from_db(fields=['status'])
+    if not updated:
+        raise ValidationError(f"Reservation is {reservation.status} and cannot be confirmed")
+    return reservation
+
+
+# Gives the stock of a held reservation back. Releasing twice is a no-op.
+def release_reservation(reservation):
+    with transaction.atomic():
+        updated = StockReservation.objects.filter(
+            pk=reservation.pk, status=StockReservation.HELD).update(status=StockReservation.RELEASED)
+        if updated:
+            for product_id, quantity in reservation.items.values_list('product_id', 'quantity'):
+                return_stock(product_id, quantity)
+    reservation.refresh_from_db(fields=['status'])
+    return reservation
+
+
+# Releases every held reservation whose hold has run out, returning how many were released
+def release_expired_reservations():
+    expired = StockReservation.objects.filter(
+        status=StockReservation.HELD, expires_at__lte=timezone.now())
+    released = 0
+    for reservation in expired:
+        if release_reservation(reservation).status == StockReservation.RELEASED:
+            released += 1
+    return released
@@ -0,0 +1,84 @@
+# Importing modules, functions and classes
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .images import FILE_FIELDS, delete_unreferenced_files, file_digest
+from .models import ImageUpload, ProductImage
+from .uploads import upload_path
+
+# Storage sweep.
+# The files of deleted product images are deleted as they go, in the image worker pool
+# (see images.py). The sweep catches what is left over: files no image refers to, from
+# images deleted before, or whose processing was cut short, and the chunks of uploads
+# abandoned for longer than UPLOAD_EXPIRY. Files newer than MEDIA_SWEEP_GRACE are kept,
+# as they may belong to an image whose transaction has not committed yet.
+
+IMAGE_DIRECTORY = 'product_images'
+
+
+# Yields the names of every stored file under a directory of the media storage
+def stored_files(directory):
+    try:
+        directories, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from stored_files(f'{directory}/{name}')
+
+
+# Deletes the image files older than `grace` that no product image refers to. Returns
+# their names; with dry_run nothing is deleted.
+def sweep_orphaned_files(grace=None, dry_run=False):
+    cutoff = timezone.now() - (settings.MEDIA_SWEEP_GRACE if grace is None else grace)
+    referenced = set()
+    for row in ProductImage.objects.values_list(*FILE_FIELDS).iterator():
+        referenced.update(row)
+    orphans = [name for name in stored_files(IMAGE_DIRECTORY)
+               if name not in referenced and default_storage.get_modified_time(name) < cutoff]
+    if not dry_run:
+        # references are checked again, for images saved while the storage was listed
+        delete_unreferenced_files(orphans)
+    return orphans
+
+
+# Deletes the uploads left open for longer than UPLOAD_EXPIRY, with their chunks, and
+# chunk directories of uploads that no longer exist. Returns the number of uploads.
+def sweep_expired_uploads(dry_run=False):
+    expired = ImageUpload.objects.filter(
+        status=ImageUpload.OPEN, created_at__lt=timezone.now() - settings.UPLOAD_EXPIRY)
+    paths = [upload_path(upload) for upload in expired]
+    try:
+        directories = os.listdir(settings.UPLOAD_DIR)
+    except FileNotFoundError:
+        directories = []
+    open_uploads = {str(pk) for pk in ImageUpload.objects.filter(
+        status=ImageUpload.OPEN).values_list('pk', flat=True)}
+    paths += [os.path.join(settings.UPLOAD_DIR, name) for name in directories
+              if name not in open_uploads]
+    if not dry_run:
+        count = expired.delete()[0]
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        return count
+    return len(expired)
+
+
+# Computes the content hash of the images stored before hashes existed, so that new
+# images with the same content share their files. Returns the number of images hashed.
+def hash_unhashed_images():
+    hashed = 0
+    for image in ProductImage.objects.filter(content_hash='').exclude(image='').iterator():
+        try:
+            with image.image.open('rb') as file:
+                image.content_hash = file_digest(file)
+        except OSError:
+            continue
+        ProductImage.objects.filter(pk=image.pk).update(content_hash=image.content_hash)
+        hashed += 1
+    return hashed
@@ -0,0 +1,120 @@
+# Importing modules, functions and classes
+import hashlib
+import random
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .cache import invalidate_catalog
+from .images import EXTENSIONS, VARIANTS, render_variant
+from .models import Category, Discount, Product, ProductImage, Rating, WishList
+from .search import index_products
+
+User = get_user_model()
+
+# Synthetic catalogs, for benchmarks and local development.
+# Everything is drawn from a random generator seeded by the caller, so the same
+# arguments give the same catalog, and rows are created in bulk: a catalog of 100,000
+# products takes seconds. Images are a handful of pictures stored once, with their
+# variants, and shared by every product that shows them.
+
+ADJECTIVES = ['Classic', 'Compact', 'Deluxe', 'Ergonomic', 'Portable', 'Rustic', 'Smart', 'Vintage']
+NOUNS = ['Backpack', 'Blender', 'Chair', 'Headphones', 'Kettle', 'Lamp', 'Speaker', 'Watch']
+DEPARTMENTS = ['Audio', 'Furniture', 'Garden', 'Kitchen', 'Lighting', 'Outdoor', 'Travel', 'Wearables']
+
+# Password of every generated user
+PASSWORD = 'synthetic@123'
+
+BATCH_SIZE = 5000
+
+
+# Stores a plain-colored picture and its variants, returning the fields of the product
+# images that show it
+def store_picture(number, rng):
+    color = tuple(rng.randrange(256) for _ in range(3))
+    output = BytesIO()
+    Image.new('RGB', (1200, 900), color).save(output, 'PNG')
+    content = output.getvalue()
+    fields = {'image': default_storage.save(f'product_images/synthetic-{number}.png', ContentFile(content)),
+              'content_hash': hashlib.sha256(content).hexdigest(), 'status': ProductImage.READY}
+    with Image.open(BytesIO(content)) as original:
+        for field, (size, image_format, options) in VARIANTS.items():
+            variant = render_variant(original, size, image_format, options)
+            fields[field] = default_storage.save(
+                f'product_images/variants/synthetic-{number}_{field}.{EXTENSIONS[image_format]}',
+                ContentFile(variant))
+    return fields
+
+
+# Generates a catalog: users (the first one staff), categories, products with one
+# image each, discounts over a share of the products, ratings and wishlists. Returns
+# the number of rows created per model.
+@transaction.atomic
+def generate_catalog(products=1000, categories=20, users=50, discount_share=0.1,
+                     ratings_per_product=3, wishlist_size=5, pictures=8, seed=0):
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    password = make_password(PASSWORD)
+    user_rows = User.objects.bulk_create([
+        User(username=f'shopper{seed}-{i}', email=f'shopper{seed}-{i}@example.com',
+             password=password, is_staff=i == 0)
+        for i in range(max(users, 1))])
+
+    category_rows = Category.objects.bulk_create([
+        Category(name=f'{DEPARTMENTS[i % len(DEPARTMENTS)]} {seed}-{i}', created_by=user_rows[0])
+        for i in range(max(categories, 1))])
+
+    product_rows = Product.objects.bulk_create([
+        Product(name=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}',
+                description=f'A {rng.choice(NOUNS).lower()} friendly synthetic product',
+                price=Decimal(rng.randint(100, 100000)) / 100, category=rng.choice(category_rows),
+                stock_quantity=rng.randint(0, 500), created_by=rng.choice(user_rows))
+        for i in range(products)], batch_size=BATCH_SIZE)
+
+    picture_fields = [store_picture(number, rng) for number in range(pictures)]
+    image_rows = ProductImage.objects.bulk_create([
+        ProductImage(product=product, position=0, **rng.choice(picture_fields))
+        for product in product_rows] if picture_fields else [], batch_size=BATCH_SIZE)
+
+    # a discount per ten products, half of them running, the others over or yet to start
+    periods = [(-30, 30), (-30, 30), (-30, -1), (7, 30)]
+    discount_rows = Discount.objects.bulk_create([
+        Discount(name=f'Synthetic discount {i}',
+                 discount_type=rng.choice([Discount.PERCENTAGE, Discount.FIXED]),
+                 value=Decimal(rng.randint(5, 30)),
+                 start_date=now + timedelta(days=start), end_date=now + timedelta(days=end))
+        for i, (start, end) in enumerate(rng.choice(periods)
+                                         for _ in range(round(products * discount_share / 10)))])
+    Discount.product.through.objects.bulk_create([
+        Discount.product.through(discount=discount, product=product)
+        for discount in discount_rows for product in rng.sample(product_rows, min(10, products))],
+        batch_size=BATCH_SIZE)
+
+    rating_rows = Rating.objects.bulk_create([
+        Rating(product=product, user=user, rating=rng.choice([1, 2, 3, 4, 4, 5, 5, 5]),
+               description='Synthetic review')
+        for product in product_rows
+        for user in rng.sample(user_rows, min(rng.randint(0, 2 * ratings_per_product), len(user_rows)))],
+        batch_size=BATCH_SIZE)
+    call_command('rebuild_rating_aggregates', stdout=StringIO())
+
+    wishlist_rows = WishList.objects.bulk_create([
+        WishList(user=user, product=product)
+        for user in user_rows for product in rng.sample(product_rows, min(wishlist_size, products))],
+        batch_size=BATCH_SIZE)
+
+    index_products(product_rows)
+    invalidate_catalog()
+    return {'users': len(user_rows), 'categories': len(category_rows), 'products': len(product_rows),
+            'images': len(image_rows), 'discounts': len(discount_rows), 'ratings': len(rating_rows),
+            'wishlists': len(wishlist_rows)}
@@ -1,22 +1,74 @@
 # Importing modules, functions and classes
+import gc
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import (AsyncRequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
 
-from .models import Category, Discount, Product, Rating, WishList
+from e_commerce_api.metrics import request_metrics
+from e_commerce_api.routers import ReplicaRouter
+
+from .async_views import (AsyncCachedView, AsyncDetailProductView,
+                          AsyncListCategoryView, AsyncListProductView,
+                          AsyncRatingListView)
+from .cache import get_cache
+from .exporter import export_lines, export_rows
+from .models import (Category, Discount, ImageUpload, Product, ProductImage,
+                     Rating, StockReservation, StockReservationItem, WishList)
+from .serializers import ProductSerializer
+from .stock import (TAKE_STOCK_ATTEMPTS, reserve_stock, take_stock,
+                    take_stock_bulk)
+from .views import ImageUploadView, ListProductView, RatingView
 
 User = get_user_model()
 
+
+# Returns an uploaded PNG file of the given size
+def make_image_file(width, height, name='photo.png'):
+    output = BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+# Returns the bytes of a PNG image of random pixels, which barely compresses
+def make_noise_image(width, height):
+    output = BytesIO()
+    Image.frombytes('RGB', (width, height), os.urandom(width * height * 3)).save(output, 'PNG')
+    return output.getvalue()
+
+
 # Testing the Product App Functionalities
 
 class ProductsTestCase(TestCase):
     # Setting up variables and users
     def setUp(self):
+        # the catalog cache is invalidated on commit, which tests roll back instead
+        get_cache().clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='testuser', email='testuser@alx.com', password='testing@123')
@@ -167,6 +219,43 @@ class ProductsTestCase(TestCase):
         self.assertEqual(WishList.objects.count(), 1)
         self.assertEqual(WishList.objects.first().user, self.user)
 
+    # Test wishlists are per user, hold a product once and answer membership lookups
+    def test_wishlist_scoped_to_user(self):
+        other = Product.objects.create(name='Other Product', price=Decimal('5.00'),
+                                       category=self.category, stock_quantity=1,
+                                       created_by=self.admin_user)
+        WishList.objects.create(user=self.admin_user, product=other)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            reverse('product-wishlist-list', kwargs={'product_id': self.product.id}), {})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('wishlist-list'), {'product_id': self.product.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('wishlist-list'))
+        self.assertEqual([entry['product_name'] for entry in response.data['results']],
+                         ['Test Product'])
+        response = self.client.get(reverse('wishlist-contains'),
+                                   {'product_ids': f'{self.product.id},{other.id}'})
+        self.assertEqual(response.data, {self.product.id: True, other.id: False})
+
+        # the wishlist state of a page of products costs one query, and is part of the ETag
+        url = reverse('products-list') + '?in_wishlist=true'
+        response = self.client.get(url)
+        self.assertEqual([product['in_wishlist'] for product in response.data['results']],
+                         [True, False])
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=Decimal('1.00'), category=self.category,
+                    stock_quantity=1, created_by=self.admin_user) for i in range(8)])
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('products-list') + '?in_wishlist=true&search=Test')
+        with CaptureQueriesContext(connection) as full_page:
+            etag = self.client.get(url)['ETag']
+        self.assertEqual(len(small_page), len(full_page))
+        WishList.objects.create(user=self.user, product=other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertIsNone(self.client.get(reverse('products-list')).data['results'][0]['in_wishlist'])
+
     # Test creating discount
     def test_create_discount(self):
         self.client.force_authenticate(user=self.admin_user)
@@ -217,3 +306,1213 @@ class ProductsTestCase(TestCase):
         response = self.client.get(url, {'ordering': '-created_at'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
+
+    # Test discounted prices of a page are resolved with a constant number of queries
+    def test_discounted_price_query_count(self):
+        discount = Discount.objects.create(
+            name='Flash Sale', discount_type='fixed', value=Decimal('10.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        discount.product.add(self.product)
+        for i in range(20):
+            Product.objects.create(name=f'Product {i}', price=Decimal('20.00'),
+                                   category=self.category, created_by=self.admin_user)
+
+        # one query for the products and one for their active discounts, whatever the page size
+        for page_size in (1, 5, 21):
+            with self.assertNumQueries(2):
+                products = list(Product.objects.order_by('id').with_active_discounts()[:page_size])
+                prices = [product.discounted_price for product in products]
+            self.assertEqual(prices[0], Decimal('90.00'))
+
+        # prefetched prices match the ones computed one product at a time
+        lazy_prices = [product.discounted_price for product in Product.objects.order_by('id')]
+        self.assertEqual(prices, lazy_prices)
+
+    # Test the product list stays within its query budget whatever the number of products
+    def test_list_products_query_budget(self):
+        url = reverse('products-list')
+        discount = Discount.objects.create(
+            name='Flash Sale', discount_type='percentage', value=Decimal('10.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        for i in range(15):
+            product = Product.objects.create(name=f'Product {i}', price=Decimal('20.00'),
+                                             category=self.category, created_by=self.admin_user)
+            discount.product.add(product)
+            ProductImage.objects.create(product=product, image=f'product_images/{i}.png')
+
+        # count, products, images and discounts, plus the validators (product and discount
+        # state) and the next discount change bounding the cache
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][1]['images']), 1)
+
+    # Test the product detail stays within its query budget
+    def test_product_detail_query_budget(self):
+        ProductImage.objects.create(product=self.product, image='product_images/a.png')
+        ProductImage.objects.create(product=self.product, image='product_images/b.png')
+        url = reverse('products-detail', kwargs={'pk': self.product.id})
+
+        # product, images and discounts, plus the validators (product and discount state)
+        # and the next discount change bounding the cache
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['images']), 2)
+
+    # Test keyset pagination walks the catalog without COUNT or OFFSET queries
+    def test_list_products_cursor_pagination(self):
+        url = reverse('products-list')
+        for i in range(14):
+            Product.objects.create(name=f'Product {i}', price=Decimal('20.00'),
+                                   category=self.category, created_by=self.admin_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'paginator': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertNotIn('ETag', response)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+        first_page = [product['id'] for product in response.data['results']]
+        self.assertEqual(len(first_page), 10)
+
+        # rows inserted while paging neither repeat nor shift the next page
+        Product.objects.create(name='Late Product', price=Decimal('20.00'),
+                               category=self.category, created_by=self.admin_user)
+        response = self.client.get(response.data['next'])
+        second_page = [product['id'] for product in response.data['results']]
+        self.assertEqual(len(second_page), 6)
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertEqual(first_page + second_page[:5],
+                         list(Product.objects.order_by('created_at', 'id').values_list('id', flat=True)[:15]))
+
+        # descending order and an explicit count
+        response = self.client.get(url, {'paginator': 'cursor', 'ordering': '-created_at', 'count': 'true'})
+        self.assertEqual(response.data['count'], 16)
+        self.assertEqual(response.data['results'][0]['name'], 'Late Product')
+
+        # orderings where most products tie are walked on (avg_rating, id), without OFFSET
+        Product.objects.filter(name__in=['Product 3', 'Product 7']).update(avg_rating=Decimal('4.50'))
+        seen, link = [], None
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'paginator': 'cursor', 'ordering': '-avg_rating'})
+            while True:
+                seen += [product['id'] for product in response.data['results']]
+                if not response.data['next']:
+                    break
+                link = response.data['next']
+                response = self.client.get(link)
+        self.assertNotIn('OFFSET', ' '.join(query['sql'] for query in queries))
+        self.assertEqual(seen, list(Product.objects.order_by('-avg_rating', '-id').values_list('id', flat=True)))
+        # and back from the last page
+        previous = self.client.get(self.client.get(link).data['previous'])
+        self.assertEqual([product['id'] for product in previous.data['results']], seen[:10])
+
+    # Test the full-text search matches prefixes across name, description and category
+    def test_product_search_index(self):
+        url = reverse('products-list')
+        Product.objects.create(name='Garden Hose', description='Flexible hose',
+                               price=Decimal('20.00'), category=self.category, created_by=self.admin_user)
+        lamp = Product.objects.create(name='Desk Lamp', description='Warm light for the garden shed',
+                                      price=Decimal('30.00'), category=self.category,
+                                      created_by=self.admin_user)
+
+        # name matches rank above description matches
+        response = self.client.get(url, {'search': 'gard'})
+        self.assertEqual([product['name'] for product in response.data['results']],
+                         ['Garden Hose', 'Desk Lamp'])
+
+        # category names are searchable and follow renames
+        self.category.name = 'Lighting'
+        self.category.save()
+        response = self.client.get(url, {'search': 'light'})
+        self.assertEqual(len(response.data['results']), 3)
+
+        # saves and deletes keep the index up to date
+        lamp.name = 'Floor Lamp'
+        lamp.save()
+        response = self.client.get(url, {'search': 'floor lamp'})
+        self.assertEqual([product['id'] for product in response.data['results']], [lamp.id])
+        lamp.delete()
+        response = self.client.get(url, {'search': 'floor'})
+        self.assertEqual(len(response.data['results']), 0)
+
+    # Test purchasing reduces stock and never goes below zero
+    def test_purchase_product(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('products-purchase', kwargs={'pk': self.product.id})
+        response = self.client.post(url, {'quantity': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stock_quantity'], 295)
+
+        response = self.client.post(url, {'quantity': 296})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 295)
+
+    # Test reservations hold stock for several products at once, all or nothing
+    def test_stock_reservation(self):
+        self.client.force_authenticate(user=self.user)
+        other = Product.objects.create(name='Other Product', price=Decimal('5.00'),
+                                       category=self.category, stock_quantity=2,
+                                       created_by=self.admin_user)
+        url = reverse('stock-reservations-list')
+
+        # not enough of the second product: nothing is held
+        data = {'items': [{'product': self.product.id, 'quantity': 10},
+                          {'product': other.id, 'quantity': 3}]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 300)
+
+        data['items'][1]['quantity'] = 2
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], StockReservation.HELD)
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (290, 0))
+
+        # releasing gives the stock back, and a released reservation cannot be confirmed
+        reservation_url = reverse('stock-reservations-detail', kwargs={'pk': response.data['id']})
+        self.client.post(reservation_url + 'release/')
+        response = self.client.post(reservation_url + 'confirm/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        other.refresh_from_db()
+        self.assertEqual(other.stock_quantity, 2)
+
+        # expired holds are released, fresh ones can be confirmed
+        response = self.client.post(url, {'items': [{'product': other.id, 'quantity': 2}]},
+                                    format='json')
+        StockReservation.objects.filter(id=response.data['id']).update(expires_at=timezone.now())
+        response = self.client.post(url, {'items': [{'product': other.id, 'quantity': 2}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reservation_url = reverse('stock-reservations-detail', kwargs={'pk': response.data['id']})
+        response = self.client.post(reservation_url + 'confirm/')
+        self.assertEqual(response.data['status'], StockReservation.CONFIRMED)
+
+    # Test checkout takes the stock of a whole cart in one transaction
+    def test_checkout(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('checkout')
+        other = Product.objects.create(name='Other Product', price=Decimal('5.00'),
+                                       category=self.category, stock_quantity=2,
+                                       created_by=self.admin_user)
+        discount = Discount.objects.create(
+            name='Flash Sale', discount_type='percentage', value=Decimal('10.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        discount.product.add(self.product)
+
+        # every failing line is reported and nothing is taken
+        data = {'lines': [{'product_id': self.product.id, 'quantity': 3},
+                          {'product_id': other.id, 'quantity': 5},
+                          {'product_id': 9999, 'quantity': 1}]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['lines']
+        self.assertEqual(errors[0], {})
+        self.assertIn('quantity', errors[1])
+        self.assertIn('product_id', errors[2])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 300)
+
+        # products and discounts are loaded once, stock taken with a single UPDATE
+        data['lines'] = data['lines'][:2]
+        data['lines'][1]['quantity'] = 2
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 1)
+        self.assertEqual(response.data['lines'][0]['unit_price'], Decimal('90.00'))
+        self.assertEqual(response.data['total'], Decimal('280.00'))
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, other.stock_quantity), (297, 0))
+
+        # a fixed discount larger than the price makes the product free
+        giveaway = Discount.objects.create(
+            name='Giveaway', discount_type='fixed', value=Decimal('500.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        discount.product.remove(self.product)
+        giveaway.product.add(self.product)
+        response = self.client.post(url, {'lines': [{'product_id': self.product.id, 'quantity': 1}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lines'][0]['unit_price'], Decimal('0.00'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 296)
+
+    # Test bulk stock takes reject repeated products and give up after a bounded retry
+    def test_take_stock_bulk_guards(self):
+        with self.assertRaises(ValueError):
+            take_stock_bulk([(self.product.id, 1), (self.product.id, 2)])
+        # stock that always seems to come back once the UPDATE missed it
+        with mock.patch('products.stock.find_shortages', return_value={}) as find_shortages, \
+                self.assertRaises(RuntimeError):
+            take_stock_bulk([(self.product.id, 1000)])
+        self.assertEqual(find_shortages.call_count, TAKE_STOCK_ATTEMPTS + 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 300)
+
+    # Test anonymous catalog reads are cached until the catalog changes
+    def test_catalog_response_cache(self):
+        url = reverse('products-list')
+        response = self.client.get(url, {'search': 'test', 'page': ''})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # same query in another parameter order, served without touching the database
+        with self.assertNumQueries(0):
+            response = self.client.get(url + '?page=&search=test')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['stock_quantity'], 300)
+
+        # stock changes and saves invalidate the cached pages once they commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.reduce_stock(10)
+            self.assertEqual(self.client.get(url, {'search': 'test'})['X-Cache'], 'HIT')
+        response = self.client.get(url, {'search': 'test'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['stock_quantity'], 290)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Renamed Category'
+            self.category.save()
+        response = self.client.get(reverse('category_detail', kwargs={'pk': self.category.id}))
+        self.assertEqual(response.data['name'], 'Renamed Category')
+
+        # authenticated users bypass the cache
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url, {'search': 'test'})
+        self.assertNotIn('X-Cache', response)
+
+        # counters are exposed to admins
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse('catalog-cache-stats'))
+        self.assertGreaterEqual(response.data['views']['ListProductView']['hits'], 1)
+
+    # Test renaming a category invalidates cached categories and the products showing it
+    def test_catalog_cache_category_rename(self):
+        category_url = reverse('category_detail', kwargs={'pk': self.category.id})
+        products_url = reverse('products-list')
+        self.client.get(category_url)
+        self.client.get(products_url, {'search': 'renamed'})
+        self.assertEqual(self.client.get(category_url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Renamed Category'
+            self.category.save()
+        response = self.client.get(category_url)
+        self.assertEqual((response.data['name'], response['X-Cache']), ('Renamed Category', 'MISS'))
+        response = self.client.get(products_url, {'search': 'renamed'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['id'], self.product.id)
+
+    # Test cached product responses expire when a discount starts or ends
+    def test_catalog_cache_discount_boundary(self):
+        Discount.objects.create(
+            name='Tomorrow Sale', discount_type='percentage', value=Decimal('10.00'),
+            start_date=timezone.now() + timezone.timedelta(seconds=30),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        view = ListProductView()
+        self.assertLessEqual(view.get_cache_timeout(), 30)
+
+    # Test conditional GETs are answered with 304 without serializing anything
+    def test_conditional_get(self):
+        url = reverse('products-list')
+        detail_url = reverse('products-detail', kwargs={'pk': self.product.id})
+        etag = self.client.get(url)['ETag']
+        last_modified = self.client.get(detail_url)['Last-Modified']
+
+        with mock.patch.object(ProductSerializer, 'to_representation') as to_representation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            to_representation.assert_not_called()
+
+        # deleting the newest product moves no date forward: lists have no Last-Modified
+        with self.captureOnCommitCallbacks(execute=True):
+            newest = Product.objects.create(name='Newest Product', price=Decimal('10.00'),
+                                            category=self.category, stock_quantity=1,
+                                            created_by=self.admin_user)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            newest.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+        # another page or filter has its own validator
+        response = self.client.get(url, {'search': 'test'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a discount on the product changes the validator
+        with self.captureOnCommitCallbacks(execute=True):
+            discount = Discount.objects.create(
+                name='Flash Sale', discount_type='percentage', value=Decimal('10.00'),
+                start_date=timezone.now() - timezone.timedelta(days=1),
+                end_date=timezone.now() + timezone.timedelta(days=1))
+            discount.product.add(self.product)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['discounted_price'], Decimal('90.00'))
+
+        # and so does deleting it, on the product's own Last-Modified
+        Product.objects.filter(pk=self.product.pk).update(
+            updated_at=timezone.now() - timezone.timedelta(minutes=1))
+        Discount.objects.filter(pk=discount.pk).update(
+            updated_at=timezone.now() - timezone.timedelta(minutes=1))
+        last_modified = self.client.get(detail_url)['Last-Modified']
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.delete()
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['discounted_price'], Decimal('100.00'))
+
+        # so do authenticated reads, which are never cached
+        self.client.force_authenticate(user=self.user)
+        url = reverse('category_detail', kwargs={'pk': self.category.id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.category.name = 'Renamed Category'
+        self.category.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_200_OK)
+
+    # Test rating writes keep the product's rating aggregates up to date
+    def test_rating_aggregates(self):
+        url = reverse('product-ratings-list', kwargs={'product_id': self.product.id})
+        self.client.force_authenticate(user=self.user)
+        rating_id = self.client.post(url, {'rating': 4}).data['id']
+        self.client.force_authenticate(user=self.admin_user)
+        self.client.post(url, {'rating': 1})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.avg_rating, Decimal('2.50'))
+        self.assertEqual(self.product.rating_histogram, {1: 1, 2: 0, 3: 0, 4: 1, 5: 0})
+
+        detail_url = reverse('product-ratings-detail',
+                             kwargs={'product_id': self.product.id, 'pk': rating_id})
+        self.client.force_authenticate(user=self.user)
+        self.client.patch(detail_url, {'rating': 5})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.avg_rating, Decimal('3.00'))
+        self.assertEqual(self.product.ratings_4, 0)
+        self.assertEqual(self.product.ratings_5, 1)
+
+        # a rating deleted twice at once is only taken out once
+        stale = Rating.objects.get(pk=rating_id)
+        self.client.delete(detail_url)
+        RatingView().perform_destroy(stale)
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('products-detail', kwargs={'pk': self.product.id}))
+        self.assertEqual(response.data['avg_rating'], '1.00')
+        self.assertEqual(response.data['rating_count'], 1)
+        self.assertEqual(response.data['rating_histogram'], {'1': 1, '2': 0, '3': 0, '4': 0, '5': 0})
+
+    # Test filtering and ordering products by their average rating
+    def test_product_rating_filter(self):
+        rated = Product.objects.create(
+            name='Rated Product', price=Decimal('10.00'), category=self.category,
+            stock_quantity=5, created_by=self.admin_user)
+        Rating.objects.create(product=rated, user=self.user, rating=5)
+        detail_url = reverse('products-detail', kwargs={'pk': rated.id})
+        etag = self.client.get(detail_url)['ETag']
+        unrated_updated_at = Product.objects.get(pk=self.product.pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_rating_aggregates', stdout=StringIO())
+        # only the products whose aggregates changed are marked as updated
+        self.assertEqual(Product.objects.get(pk=self.product.pk).updated_at, unrated_updated_at)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['avg_rating'], '5.00')
+
+        url = reverse('products-list')
+        response = self.client.get(url, {'min_rating': 4})
+        self.assertEqual([p['id'] for p in response.data['results']], [rated.id])
+        response = self.client.get(url, {'ordering': '-avg_rating'})
+        self.assertEqual([p['id'] for p in response.data['results']], [rated.id, self.product.id])
+
+    # Test importing a CSV file of products through the admin endpoint
+    def test_import_products(self):
+        url = reverse('products-import')
+        csv_file = SimpleUploadedFile('products.csv', (
+            'name,description,price,category,stock_quantity,images\n'
+            'Imported Lamp,A desk lamp,25.50,Test Category,4,product_images/lamp.png|product_images/lamp2.png\n'
+            'Broken Lamp,,-1,Test Category,4,\n'
+            'Imported Chair,,80,Unknown Category,2,\n'
+            'Imported Kettle,,30,Test Category,7,\n').encode())
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(url, {'file': csv_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        csv_file.seek(0)
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_EAGER=True):
+            default_storage.save('product_images/lamp.png', make_image_file(400, 300))
+            default_storage.save('product_images/lamp2.png', make_image_file(300, 400))
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {'file': csv_file, 'batch_size': 1}, format='multipart')
+            # imported images get their variants and content hash, as uploaded ones do
+            image = ProductImage.objects.get(image='product_images/lamp.png')
+            self.assertEqual(image.status, ProductImage.READY)
+            self.assertEqual(len(image.content_hash), 64)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['rows'], response.data['created']), (4, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertIn('category', response.data['errors'][1]['errors'])
+
+        lamp = Product.objects.get(name='Imported Lamp')
+        self.assertEqual((lamp.price, lamp.created_by), (Decimal('25.50'), self.admin_user))
+        self.assertEqual(lamp.images.count(), 2)
+        response = self.client.get(reverse('products-list'), {'search': 'kettle'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Imported Kettle'])
+
+    # Test the import command reads JSON Lines and can create categories
+    def test_import_products_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as jsonl_file:
+            jsonl_file.write('{"name": "Imported Lamp", "price": "12.00", "category": "Lighting",'
+                             ' "stock_quantity": 3}\n[1, 2]\n')
+            jsonl_file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_products', jsonl_file.name, user='admin',
+                         create_categories=True, stdout=out, stderr=err)
+        self.assertIn('Imported 1 of 2 rows', out.getvalue())
+        self.assertIn('Row 2', err.getvalue())
+        self.assertEqual(Product.objects.get(name='Imported Lamp').category.name, 'Lighting')
+
+    # Test exporting the catalog as CSV and NDJSON
+    def test_export_products(self):
+        ProductImage.objects.create(product=self.product, image='product_images/a.png')
+        Rating.objects.create(product=self.product, user=self.user, rating=4)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        url = reverse('products-export')
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(url, {'output': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['category'], 'Test Category')
+        self.assertEqual(rows[0]['discounted_price'], '100.00')
+        self.assertEqual(rows[0]['ratings']['4'], 1)
+        self.assertEqual(rows[0]['images'], ['http://testserver/media/product_images/a.png'])
+
+        response = self.client.get(url)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'description'])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        # a fixed discount larger than the price does not cut the stream short
+        free = Product.objects.create(name='Free Product', price=Decimal('5.00'), category=self.category,
+                                      stock_quantity=1, created_by=self.admin_user)
+        discount = Discount.objects.create(
+            name='Giveaway', discount_type='fixed', value=Decimal('50.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        discount.product.add(free)
+        response = self.client.get(url, {'output': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['discounted_price'] for row in rows], ['100.00', '0.00'])
+
+    # Test the memory an export uses does not grow with the size of the catalog
+    def test_export_products_memory(self):
+        def peak_export_memory():
+            tracemalloc.start()
+            for _ in export_lines(export_rows(chunk_size=500), 'ndjson'):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+
+        def add_products(count):
+            Product.objects.bulk_create([
+                Product(name=f'Product {i}', description='x' * 200, price=Decimal('10.00'),
+                        category=self.category, stock_quantity=1, created_by=self.admin_user)
+                for i in range(count)])
+
+        add_products(2000)
+        small_catalog = peak_export_memory()
+        add_products(8000)
+        large_catalog = peak_export_memory()
+        # five times the products, the same chunk in memory at a time
+        self.assertLess(large_catalog, small_catalog * 1.5)
+        self.assertLess(large_catalog, 8 * 2 ** 20)
+
+    # Test creating, updating and deleting products in bulk
+    def test_bulk_products(self):
+        url = reverse('products-bulk')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(url, [
+            {'name': 'Bulk Lamp', 'price': '20.00', 'category': self.category.id, 'stock_quantity': 5},
+            {'name': 'Bulk Chair', 'price': '50.00', 'category': self.category.id, 'stock_quantity': 2},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(Product.objects.filter(id__in=ids, created_by=self.user).count(), 2)
+
+        # one invalid item rejects the whole batch
+        response = self.client.patch(url, [
+            {'id': ids[0], 'price': '25.00'},
+            {'id': ids[1], 'category': 9999},
+            {'id': 9999, 'price': '1.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['valid', 'invalid', 'invalid'])
+        self.assertEqual(Product.objects.get(id=ids[0]).price, Decimal('20.00'))
+
+        changes = [{'id': ids[0], 'price': '25.00'}, {'id': ids[1], 'name': 'Bulk Stool'},
+                   {'id': self.product.id, 'stock_quantity': 300}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, changes, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        update = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "products_product"')]
+        # unchanged rows and columns are not written
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"stock_quantity"', update[0])
+        self.assertNotIn('"description"', update[0])
+        self.assertEqual(Product.objects.get(id=ids[0]).price, Decimal('25.00'))
+        search = self.client.get(reverse('products-list'), {'search': 'stool'})
+        self.assertEqual([p['id'] for p in search.data['results']], [ids[1]])
+
+        response = self.client.delete(url, ids, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Product.objects.filter(id__in=ids).exists())
+
+    # Test creating categories and discounts in bulk
+    def test_bulk_categories_and_discounts(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('category_bulk'), [{'name': 'Garden'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(reverse('category_bulk'), [{'name': 'Garden'}, {'name': 'Garden'}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Category.objects.filter(name='Garden').exists())
+        response = self.client.patch(reverse('category_bulk'),
+                                     [{'id': self.category.id, 'name': 'Outdoor'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        search = self.client.get(reverse('products-list'), {'search': 'outdoor'})
+        self.assertEqual(len(search.data['results']), 1)
+
+        response = self.client.post(reverse('discounts-bulk'), [{
+            'name': 'Flash Sale', 'discount_type': 'percentage', 'value': '10.00',
+            'start_date': timezone.now() - timezone.timedelta(days=1),
+            'end_date': timezone.now() + timezone.timedelta(days=1),
+            'product': [self.product.id]}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse('products-detail', kwargs={'pk': self.product.id}))
+        self.assertEqual(response.data['discounted_price'], Decimal('90.00'))
+
+    # Test uploaded images get resized variants once their request has committed
+    def test_product_image_variants(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_EAGER=True):
+            self.client.force_authenticate(user=self.user)
+            data = {'name': 'Photographed Product', 'price': '50.00', 'category': self.category.id,
+                    'stock_quantity': 20, 'uploaded_images': [make_image_file(2400, 1200)]}
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('products-create'), data, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+            image = ProductImage.objects.get(product__name='Photographed Product')
+            self.assertEqual(image.status, ProductImage.READY)
+            with Image.open(image.thumbnail.path) as thumbnail:
+                self.assertEqual(thumbnail.size, (200, 100))
+            with Image.open(image.webp.path) as webp:
+                self.assertEqual((webp.format, webp.size), ('WEBP', (1600, 800)))
+
+            response = self.client.get(reverse('products-detail', kwargs={'pk': image.product_id}))
+            self.assertTrue(response.data['images'][0]['medium'].endswith('_medium.jpg'))
+
+            # unreadable uploads are marked failed
+            broken = ProductImage(product=self.product)
+            broken.image.save('broken.png', SimpleUploadedFile('broken.png', b'not an image'), save=False)
+            with self.captureOnCommitCallbacks(execute=True):
+                broken.save()
+            broken.refresh_from_db()
+            self.assertEqual(broken.status, ProductImage.FAILED)
+
+    # Test images are added, deduplicated, reordered and removed one at a time
+    def test_product_image_management(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_EAGER=True):
+            self.client.force_authenticate(user=self.user)
+            url = reverse('product-images-list', kwargs={'product_id': self.product.id})
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.client.post(url, {'image': make_image_file(300, 200)}, format='multipart')
+            self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+            second = self.client.post(url, {'image': make_image_file(200, 300, 'tall.png')},
+                                      format='multipart')
+            self.assertEqual(second.data['position'], 1)
+
+            # the same content is not added twice to a product, and is stored once
+            again = self.client.post(url, {'image': make_image_file(300, 200, 'copy.png')},
+                                     format='multipart')
+            self.assertEqual((again.status_code, again.data['id']), (status.HTTP_200_OK, first.data['id']))
+            other = Product.objects.create(name='Other Product', price=Decimal('5.00'),
+                                           category=self.category, stock_quantity=1,
+                                           created_by=self.user)
+            shared = self.client.post(
+                reverse('product-images-list', kwargs={'product_id': other.id}),
+                {'image': make_image_file(300, 200, 'copy.png')}, format='multipart')
+            self.assertEqual(shared.status_code, status.HTTP_201_CREATED)
+            original = ProductImage.objects.get(pk=first.data['id'])
+            copy = ProductImage.objects.get(pk=shared.data['id'])
+            self.assertEqual((copy.image.name, copy.thumbnail.name, copy.status),
+                             (original.image.name, original.thumbnail.name, ProductImage.READY))
+            stored = os.listdir(os.path.join(media_root, 'product_images'))
+            self.assertEqual(len([name for name in stored if name.endswith('.png')]), 2)
+
+            response = self.client.post(url + 'reorder/', {'order': [first.data['id']]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.post(url + 'reorder/', {'order': [second.data['id'], first.data['id']]},
+                                        format='json')
+            self.assertEqual([image['id'] for image in response.data], [second.data['id'], first.data['id']])
+            detail = self.client.get(reverse('products-detail', kwargs={'pk': self.product.id}))
+            self.assertEqual(detail.data['images'][0]['id'], second.data['id'])
+
+            # updating a product adds its new images to the ones it has
+            response = self.client.patch(
+                reverse('products-update', kwargs={'pk': self.product.id}),
+                {'uploaded_images': [make_image_file(100, 100, 'square.png')]}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.product.images.count(), 3)
+
+            # files are deleted once no image refers to them
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(reverse('product-images-detail',
+                                           kwargs={'product_id': self.product.id, 'pk': first.data['id']}))
+            self.assertTrue(os.path.exists(copy.image.path))
+            with self.captureOnCommitCallbacks(execute=True):
+                other.delete()
+            self.assertFalse(os.path.exists(copy.image.path))
+            self.assertFalse(os.path.exists(copy.thumbnail.path))
+
+    # Test the storage sweep deletes orphaned files and abandoned uploads only
+    def test_sweep_product_images(self):
+        with tempfile.TemporaryDirectory() as root, \
+                self.settings(MEDIA_ROOT=os.path.join(root, 'media'),
+                              UPLOAD_DIR=os.path.join(root, 'uploads')):
+            image = ProductImage(product=self.product)
+            image.image.save('kept.png', make_image_file(50, 50))
+            orphan = os.path.join(root, 'media', 'product_images', 'variants', 'orphan.jpg')
+            os.makedirs(os.path.dirname(orphan))
+            with open(orphan, 'wb') as file:
+                file.write(b'left over')
+            upload = ImageUpload.objects.create(user=self.user, product=self.product,
+                                                filename='a.png', size=10, chunk_size=10,
+                                                sha256='0' * 64)
+            ImageUpload.objects.filter(pk=upload.pk).update(
+                created_at=timezone.now() - timezone.timedelta(days=2))
+            os.makedirs(os.path.join(root, 'uploads', str(upload.pk)))
+
+            call_command('sweep_product_images', '--dry-run', '--grace-minutes=0', stdout=StringIO())
+            self.assertTrue(os.path.exists(orphan))
+            call_command('sweep_product_images', '--grace-minutes=60', stdout=StringIO())
+            self.assertTrue(os.path.exists(orphan))
+            call_command('sweep_product_images', '--grace-minutes=0', '--hash-missing', stdout=StringIO())
+            self.assertFalse(os.path.exists(orphan))
+            self.assertTrue(os.path.exists(image.image.path))
+            self.assertFalse(ImageUpload.objects.exists())
+            self.assertEqual(os.listdir(os.path.join(root, 'uploads')), [])
+            image.refresh_from_db()
+            self.assertEqual(len(image.content_hash), 64)
+
+    # Test the synthetic catalog generator fills every model consistently
+    def test_generate_catalog(self):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            call_command('generate_catalog', '--products=50', '--users=5', '--pictures=2',
+                         '--discount-share=0.4', stdout=StringIO())
+            products = Product.objects.exclude(pk=self.product.pk)
+            self.assertEqual(products.count(), 50)
+            self.assertEqual(ProductImage.objects.filter(status=ProductImage.READY).count(), 50)
+            self.assertEqual(len(set(ProductImage.objects.values_list('content_hash', flat=True))), 2)
+            self.assertEqual(Discount.objects.count(), 2)
+            self.assertEqual(WishList.objects.count(), 25)
+            for product in products.filter(rating_count__gt=0)[:5]:
+                self.assertEqual(product.rating_count, Rating.objects.filter(product=product).count())
+
+            response = self.client.get(reverse('products-list'), {'search': 'synthetic'})
+            self.assertEqual(response.data['count'], 50)
+
+    # Test requests are timed and counted in the Server-Timing header and the metrics
+    def test_request_instrumentation(self):
+        request_metrics.reset()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products-list'))
+        timings = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(sorted(timings), ['app', 'db', 'render', 'total'])
+        self.assertIn(f'desc="{len(queries)} queries"', timings['db'])
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin_user)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_requests_total{view="products-list",status="200"} 1', metrics)
+        self.assertIn('http_request_db_queries_count{view="products-list"} 1', metrics)
+        self.assertIn(f'http_response_size_bytes_sum{{view="products-list"}} {len(response.content)}',
+                      metrics)
+
+        with override_settings(SLOW_QUERY_MS=0), self.assertLogs('e_commerce_api.middleware', 'WARNING') as logs:
+            self.client.get(reverse('products-detail', kwargs={'pk': self.product.pk}))
+        self.assertIn('"event": "slow_query"', logs.output[0])
+
+    # Test the async catalog views answer as the DRF views they stand in for
+    async def test_async_catalog_views(self):
+        await Rating.objects.acreate(product=self.product, user=self.user, rating=4, description='Good')
+        await WishList.objects.acreate(user=self.user, product=self.product)
+        cases = [
+            (AsyncListProductView, {}, {}, None),
+            (AsyncListProductView, {}, {'search': 'test', 'ordering': '-avg_rating'}, None),
+            (AsyncListProductView, {}, {'paginator': 'cursor', 'count': 'true'}, None),
+            (AsyncListProductView, {}, {'page': 9}, None),
+            (AsyncListProductView, {}, {'in_wishlist': 'true'}, self.user),
+            (AsyncDetailProductView, {'pk': self.product.pk}, {}, None),
+            (AsyncDetailProductView, {'pk': 0}, {}, None),
+            (AsyncListCategoryView, {}, {}, None),
+            (AsyncRatingListView, {'product_id': self.product.pk}, {}, None),
+        ]
+        for view_class, kwargs, params, user in cases:
+            await get_cache().aclear()
+            sync_request = APIRequestFactory().get('/api/catalog/', params)
+            async_request = AsyncRequestFactory().get('/api/catalog/', params)
+            if user:
+                force_authenticate(sync_request, user)
+                force_authenticate(async_request, user)
+            expected = (await sync_to_async(view_class().drf_view())(sync_request, **kwargs)).render()
+            await get_cache().aclear()
+            response = (await view_class.as_view()(async_request, **kwargs)).render()
+            with self.subTest(view=view_class.__name__, params=params):
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+        # anonymous responses are cached, and revalidated, as by the DRF views
+        view = AsyncListProductView.as_view()
+        await view(AsyncRequestFactory().get('/api/products/'))
+        response = await view(AsyncRequestFactory().get('/api/products/'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = await view(AsyncRequestFactory().get('/api/products/',
+                                                        headers={'If-None-Match': response['ETag']}))
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a view missing part of its behaviour fails when it is defined
+        with self.assertRaisesMessage(TypeError, 'does not implement get_validators'):
+            type('AsyncBrokenView', (AsyncCachedView,), {'view_class': ListProductView})
+
+# Testing the query plans of hot catalog queries: every query the catalog views run
+# must reach its rows through an index, never by scanning a whole table
+
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@alx.com')
+        self.category = Category.objects.create(name='Test Category', created_by=self.user)
+        self.product = Product.objects.create(name='Test Product', price=Decimal('100.00'),
+                                              category=self.category, stock_quantity=5,
+                                              created_by=self.user)
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=Decimal(i), category=self.category,
+                    stock_quantity=i, created_by=self.user) for i in range(1, 30)])
+        Rating.objects.create(product=self.product, user=self.user, rating=4)
+        discount = Discount.objects.create(
+            name='Sale', value=Decimal('10.00'), start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1))
+        discount.product.add(self.product)
+        WishList.objects.create(user=self.user, product=self.product)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    # Returns the full scans in the plans of the SELECT queries a request runs
+    def full_scans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                # a SCAN without USING INDEX or USING COVERING INDEX reads the whole table
+                scans += [f'{detail}: {query["sql"]}' for *_, detail in cursor.fetchall()
+                          if detail.startswith('SCAN ') and 'INDEX' not in detail]
+        return scans
+
+    def test_hot_queries_use_indexes(self):
+        products = reverse('products-list')
+        urls = [
+            products,
+            f'{products}?category={self.category.id}&price__gte=10&price__lte=20',
+            f'{products}?price__gte=10',
+            f'{products}?stock_quantity=5',
+            f'{products}?min_rating=4',
+            f'{products}?ordering=-avg_rating',
+            f'{products}?ordering=-rating_count',
+            f'{products}?paginator=cursor',
+            f'{products}?in_wishlist=true',
+            reverse('products-detail', kwargs={'pk': self.product.id}),
+            reverse('product-ratings-list', kwargs={'product_id': self.product.id}),
+            reverse('wishlist-list'),
+            f'{reverse("wishlist-contains")}?product_ids={self.product.id}',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.full_scans(url), [])
+
+    # Test orderings are read from an index instead of sorting the whole table
+    def test_orderings_use_indexes(self):
+        querysets = [
+            Product.objects.order_by('created_at', 'id')[:10],
+            Product.objects.order_by('-avg_rating')[:10],
+            Product.objects.order_by('-rating_count')[:10],
+            Product.objects.order_by('-rating_count', '-id')[:10],
+            Rating.objects.filter(product=self.product).order_by('-created_at')[:10],
+        ]
+        for queryset in querysets:
+            with self.subTest(sql=str(queryset.query)):
+                self.assertNotIn('TEMP B-TREE', queryset.explain())
+
+# Testing stock changes under concurrent purchases and reservations
+
+class StockConcurrencyTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', email='testuser@alx.com', password='testing@123')
+        category = Category.objects.create(name='Test Category', created_by=self.user)
+        self.product = Product.objects.create(
+            name='Test Product', price=Decimal('100.00'), category=category,
+            stock_quantity=50, created_by=self.user)
+
+    # Runs an operation, retrying while another thread holds the SQLite write lock.
+    # Operations are single statements or transactions, so a locked attempt left no trace.
+    def run_with_retry(self, operation):
+        while True:
+            try:
+                return operation()
+            except OperationalError:
+                time.sleep(0.001)
+            finally:
+                connection.close()
+
+    def test_no_overselling_under_concurrency(self):
+        attempts = 200
+
+        # even attempts buy one unit, odd attempts reserve one
+        def take_one(attempt):
+            if attempt % 2:
+                try:
+                    self.run_with_retry(lambda: reserve_stock(self.user, [(self.product.pk, 1)]))
+                    return True
+                except ValidationError:
+                    return False
+            return self.run_with_retry(lambda: take_stock(self.product.pk, 1))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            outcomes = list(executor.map(take_one, range(attempts)))
+        elapsed = time.perf_counter() - start
+
+        self.product.refresh_from_db()
+        held = sum(StockReservationItem.objects.values_list('quantity', flat=True))
+        self.assertEqual(sum(outcomes), 50)
+        self.assertEqual(self.product.stock_quantity, 0)
+        print(f"Stock operations: {attempts} in {elapsed:.2f}s "
+              f"({attempts / elapsed:.0f}/sec), {held} units reserved")
+
+
+# Testing images are processed by the background workers
+
+class ImageWorkerTestCase(TransactionTestCase):
+    def test_variants_generated_in_background(self):
+        user = User.objects.create_user(username='testuser', email='testuser@alx.com')
+        category = Category.objects.create(name='Test Category', created_by=user)
+        product = Product.objects.create(name='Test Product', price=Decimal('100.00'),
+                                         category=category, stock_quantity=5, created_by=user)
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            # outside a transaction, the image is queued as soon as it is saved
+            image = ProductImage.objects.create(product=product, image=make_image_file(800, 800))
+            for _ in range(200):
+                image.refresh_from_db()
+                if image.status != ProductImage.PENDING:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(image.status, ProductImage.READY)
+            self.assertTrue(os.path.exists(image.thumbnail.path))
+
+# Testing rating aggregates under concurrent rating writes
+
+class RatingConcurrencyTestCase(TransactionTestCase):
+    def setUp(self):
+        # the users are never logged in, so they are created without a password hash
+        self.users = [User.objects.create_user(username=f'rater{i}', email=f'rater{i}@alx.com')
+                      for i in range(40)]
+        category = Category.objects.create(name='Test Category', created_by=self.users[0])
+        self.product = Product.objects.create(
+            name='Test Product', price=Decimal('100.00'), category=category,
+            stock_quantity=50, created_by=self.users[0])
+
+    def test_rating_aggregates_under_concurrency(self):
+        # every user rates the product, then changes the rating and a third deletes it. The
+        # viewset is called directly, as test clients share exceptions between threads;
+        # a write locked out by another thread is rolled back whole and retried.
+        factory = APIRequestFactory()
+        create_rating = RatingView.as_view({'post': 'create'})
+        change_rating = RatingView.as_view({'patch': 'partial_update', 'delete': 'destroy'})
+
+        def rate(index):
+            def call(view, method, data=None, **kwargs):
+                while True:
+                    request = getattr(factory, method)('/', data, format='json')
+                    force_authenticate(request, user=self.users[index])
+                    try:
+                        return view(request, product_id=self.product.id, **kwargs)
+                    except OperationalError:
+                        time.sleep(0.001)
+                    finally:
+                        connection.close()
+
+            rating_id = call(create_rating, 'post', {'rating': index % 5 + 1}).data['id']
+            call(change_rating, 'patch', {'rating': (index + 2) % 5 + 1}, pk=rating_id)
+            if index % 3 == 0:
+                call(change_rating, 'delete', pk=rating_id)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(rate, range(len(self.users))))
+
+        self.product.refresh_from_db()
+        incremental = (self.product.avg_rating, self.product.rating_count,
+                       self.product.rating_histogram)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, Rating.objects.count())
+        self.assertEqual(incremental, (self.product.avg_rating, self.product.rating_count,
+                                       self.product.rating_histogram))
+
+
+# Testing resumable chunked image uploads
+
+class ImageUploadTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='testuser@alx.com')
+        category = Category.objects.create(name='Test Category', created_by=self.user)
+        self.product = Product.objects.create(name='Test Product', price=Decimal('100.00'),
+                                              category=category, stock_quantity=5,
+                                              created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = self.settings(MEDIA_ROOT=os.path.join(directory.name, 'media'),
+                                   UPLOAD_DIR=os.path.join(directory.name, 'uploads'),
+                                   UPLOAD_CHUNK_SIZE=256 * 1024)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        # a pool of the test's own, drained of variants before MEDIA_ROOT is restored
+        executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+        patched = mock.patch('products.images._executor', executor)
+        patched.start()
+        self.addCleanup(patched.stop)
+        self.addCleanup(executor.shutdown)
+
+    def open_upload(self, content, sha256=None):
+        response = self.client.post(reverse('image-uploads-list'), {
+            'product': self.product.id, 'filename': 'large.png', 'size': len(content),
+            'sha256': sha256 or hashlib.sha256(content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def put_chunk(self, upload, content, index):
+        chunk_size = upload['chunk_size']
+        return self.client.put(
+            reverse('image-uploads-chunk', args=[upload['id'], index]),
+            content[index * chunk_size:(index + 1) * chunk_size],
+            content_type='application/octet-stream')
+
+    # Test chunks sent in parallel and out of order are assembled into a product image
+    def test_parallel_chunk_upload(self):
+        content = make_noise_image(700, 700)
+        upload = self.open_upload(content)
+        self.assertGreater(upload['chunk_count'], 4)
+
+        # the viewset is called directly, as test clients share exceptions between threads
+        factory = APIRequestFactory()
+        view = ImageUploadView.as_view({'put': 'chunk'})
+
+        def send(index):
+            chunk_size = upload['chunk_size']
+            request = factory.put('/', content[index * chunk_size:(index + 1) * chunk_size],
+                                  content_type='application/octet-stream')
+            force_authenticate(request, user=self.user)
+            try:
+                return view(request, pk=upload['id'], index=str(index)).status_code
+            finally:
+                connection.close()
+
+        indexes = list(range(upload['chunk_count']))[::-1]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(set(executor.map(send, indexes[1:])), {status.HTTP_200_OK})
+
+        # an interrupted upload resumes with the chunks it is missing
+        response = self.client.get(reverse('image-uploads-detail', args=[upload['id']]))
+        self.assertEqual(response.data['received_chunks'], sorted(indexes[1:]))
+        response = self.client.post(reverse('image-uploads-complete', args=[upload['id']]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.put_chunk(upload, content, indexes[0]).status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('image-uploads-complete', args=[upload['id']]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], ImageUpload.COMPLETE)
+        image = ProductImage.objects.get(product=self.product)
+        with image.image.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertFalse(os.path.exists(os.path.join(settings.UPLOAD_DIR, str(upload['id']))))
+
+    # Test chunks of the wrong size and files not matching their digest are rejected
+    def test_upload_rejects_invalid_chunks_and_checksum(self):
+        content = make_noise_image(300, 300)
+        upload = self.open_upload(content, sha256='0' * 64)
+        response = self.client.put(reverse('image-uploads-chunk', args=[upload['id'], 0]),
+                                   b'too short', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.put_chunk(upload, content, upload['chunk_count'])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for index in range(upload['chunk_count']):
+            self.assertEqual(self.put_chunk(upload, content, index).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('image-uploads-complete', args=[upload['id']]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ImageUpload.objects.get(pk=upload['id']).status, ImageUpload.FAILED)
+        self.assertFalse(ProductImage.objects.exists())
+
+        # other users cannot see the upload
+        other = User.objects.create_user(username='otheruser', email='otheruser@alx.com')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('image-uploads-detail', args=[upload['id']]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # Test the memory an upload uses is bounded by the chunk size, not the file size
+    def test_upload_memory_bounded_by_chunk_size(self):
+        content = make_noise_image(1500, 1500)
+        upload = self.open_upload(content)
+        chunk_size = upload['chunk_size']
+        self.assertGreater(len(content), 20 * chunk_size)
+        chunks = [content[index * chunk_size:(index + 1) * chunk_size]
+                  for index in range(upload['chunk_count'])]
+
+        # the peak of each request is measured on its own, as test client responses
+        # hold on to their request in reference cycles until they are collected
+        peaks = []
+        tracemalloc.start()
+        for index, chunk in enumerate(chunks):
+            gc.collect()
+            tracemalloc.reset_peak()
+            response = self.client.put(reverse('image-uploads-chunk', args=[upload['id'], index]),
+                                       chunk, content_type='application/octet-stream')
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        gc.collect()
+        tracemalloc.reset_peak()
+        response = self.client.post(reverse('image-uploads-complete', args=[upload['id']]))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # the test client holds a couple of copies of the chunk it sends; the file is over 20 chunks
+        self.assertLess(max(peaks), 4 * chunk_size)
+
+
+# Testing catalog reads are served by a read replica, here a second SQLite database
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'], 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        # declared here, as the test runner only knows the databases of the settings
+        cls.databases = cls.databases | {'replica'}
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(
+            username='testuser', email='testuser@alx.com', password='testing@123')
+        category = Category.objects.create(name='Test Category', created_by=self.user)
+        self.product = Product.objects.create(
+            name='Test Product', price=Decimal('100.00'), category=category,
+            stock_quantity=50, created_by=self.user)
+        # the replica has the same rows, with a name telling it apart
+        for instance in (self.user, category, self.product):
+            instance.save(using='replica', force_insert=True)
+        Product.objects.using('replica').filter(pk=self.product.pk).update(name='Replica Product')
+        self.url = reverse('products-detail', kwargs={'pk': self.product.pk})
+
+    def test_reads_go_to_replica_until_a_write(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.url).data['name'], 'Replica Product')
+        with transaction.atomic():
+            self.assertEqual(ReplicaRouter().db_for_read(Product), 'default')
+
+        # a write pins the client to the primary
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('products-purchase', kwargs={'pk': self.product.pk}),
+                               {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.cookies['use_primary']['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(client.get(self.url).data['name'], 'Test Product')
+
+        # other clients still read from the replica, without caching what it returns
+        # shortly after a write
+        response = APIClient().get(self.url)
+        self.assertEqual((response.data['name'], response['X-Cache']), ('Replica Product', 'MISS'))
+        self.assertEqual(APIClient().get(self.url)['X-Cache'], 'MISS')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        now = timezone.now()
+        Product.objects.filter(pk=self.product.pk).update(updated_at=now - timezone.timedelta(seconds=30))
+        Product.objects.using('replica').filter(pk=self.product.pk).update(
+            updated_at=now - timezone.timedelta(seconds=60))
+        self.assertEqual(APIClient().get(self.url).data['name'], 'Test Product')
+
+        get_cache().clear()
+        Product.objects.using('replica').filter(pk=self.product.pk).update(
+            updated_at=now - timezone.timedelta(seconds=30))
+        self.assertEqual(APIClient().get(self.url).data['name'], 'Replica Product')
+
+        # so does a replica behind on categories only
+        get_cache().clear()
+        Category.objects.filter(pk=self.product.category_id).update(
+            updated_at=now - timezone.timedelta(seconds=30))
+        Category.objects.using('replica').filter(pk=self.product.category_id).update(
+            updated_at=now - timezone.timedelta(seconds=60))
+        self.assertEqual(APIClient().get(self.url).data['name'], 'Test Product')
@@ -0,0 +1,133 @@
+# Importing modules, functions and classes
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .images import add_image
+from .models import ImageUpload
+
+# Resumable image uploads.
+# A client opens an upload with the size and SHA-256 digest of an image, then sends it
+# in fixed-size chunks, in any order and in parallel. Each chunk is streamed to its own
+# file, a small block at a time, so a dropped connection only loses the chunk in flight
+# and memory stays bounded whatever the size of the image. Once every chunk is there,
+# they are joined into one file, checked against the digest and added to the images of
+# the product, which queues its variants like any other image.
+
+# Bytes read from a request or a chunk file at a time
+READ_SIZE = 64 * 1024
+
+CHUNK_SUFFIX = '.part'
+
+
+def upload_path(upload):
+    return os.path.join(settings.UPLOAD_DIR, str(upload.pk))
+
+
+def chunk_path(upload, index):
+    return os.path.join(upload_path(upload), f'{index}{CHUNK_SUFFIX}')
+
+
+# Indexes of the chunks of an upload stored so far
+def received_chunks(upload):
+    try:
+        names = os.listdir(upload_path(upload))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len(CHUNK_SUFFIX)]) for name in names if name.endswith(CHUNK_SUFFIX))
+
+
+# Streams a chunk of `length` bytes from a file-like object to disk. The chunk is written
+# to a temporary file and renamed once complete, so a chunk is either whole or missing,
+# and a chunk sent twice simply replaces the first copy.
+def write_chunk(upload, index, stream, length):
+    if upload.status != ImageUpload.OPEN:
+        raise ValidationError(f'The upload is {upload.status}')
+    if not 0 <= index < upload.chunk_count:
+        raise ValidationError(f'Chunk index must be between 0 and {upload.chunk_count - 1}')
+    expected = upload.expected_chunk_size(index)
+    if length != expected:
+        raise ValidationError(f'Chunk {index} must be {expected} bytes, got {length}')
+
+    os.makedirs(upload_path(upload), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=upload_path(upload), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            remaining = expected
+            while remaining:
+                block = stream.read(min(READ_SIZE, remaining))
+                if not block:
+                    raise ValidationError(f'Chunk {index} ended after {expected - remaining} bytes')
+                output.write(block)
+                remaining -= len(block)
+        os.replace(temporary, chunk_path(upload, index))
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def delete_chunks(upload):
+    shutil.rmtree(upload_path(upload), ignore_errors=True)
+
+
+# Copies every chunk of an upload, in order, into a file, returning the hex SHA-256
+# digest of what was written
+def join_chunks(upload, output):
+    digest = hashlib.sha256()
+    for index in range(upload.chunk_count):
+        with open(chunk_path(upload, index), 'rb') as chunk:
+            while block := chunk.read(READ_SIZE):
+                digest.update(block)
+                output.write(block)
+    output.seek(0)
+    return digest.hexdigest()
+
+
+# Checks that a file is an image Pillow can read, without decoding its pixels
+def is_image(file):
+    try:
+        with Image.open(file) as image:
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+    finally:
+        file.seek(0)
+    return True
+
+
+# Assembles the chunks of an upload into a new image of its product. An upload missing
+# chunks stays open so they can still be sent; one whose digest does not match, or that
+# is not an image, is marked failed and its chunks are deleted.
+def complete_upload(upload):
+    error = None
+    with transaction.atomic():
+        # the lock makes concurrent requests to complete an upload wait for the first one
+        upload = ImageUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status != ImageUpload.OPEN:
+            raise ValidationError(f'The upload is {upload.status}')
+        missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+        if missing:
+            raise ValidationError(f'Missing chunks: {", ".join(map(str, missing))}')
+
+        with tempfile.TemporaryFile(dir=settings.UPLOAD_DIR) as assembled:
+            if join_chunks(upload, assembled) != upload.sha256:
+                error = 'The SHA-256 digest of the uploaded file does not match'
+            elif not is_image(assembled):
+                error = 'The uploaded file is not a valid image'
+            else:
+                upload.image = add_image(upload.product, File(assembled, name=upload.filename),
+                                         content_hash=upload.sha256)[0]
+
+        upload.status = ImageUpload.FAILED if error else ImageUpload.COMPLETE
+        upload.save(update_fields=['status', 'image'])
+        transaction.on_commit(lambda: delete_chunks(upload))
+    if error:
+        raise ValidationError(error)
+    return upload
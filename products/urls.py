@@ -1,28 +1,58 @@
 # Importing modules, functions and classes
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (CreateCategoryView, CreateProductView, DeleteCategoryView,
-                    DeleteProductView, DetailCategoryView, DetailProductView,
-                    DiscountView, ListCategoryView, ListProductView,
-                    RatingView, UpdateCategoryView, UpdateProductView,
-                    WishListView)
+from .async_views import (AsyncDetailCategoryView, AsyncDetailProductView,
+                          AsyncListCategoryView, AsyncListProductView,
+                          AsyncRatingListView)
+from .views import (BulkCategoryView, BulkDiscountView, BulkProductView,
+                    CatalogCacheStatsView, CheckoutView, CreateCategoryView,
+                    CreateProductView, DeleteCategoryView, DeleteProductView,
+                    DetailCategoryView, DetailProductView, DiscountView,
+                    ExportProductsView, ImageUploadView, ImportProductsView,
+                    ListCategoryView, ListProductView, ProductImageView,
+                    PurchaseProductView, RatingView, StockReservationView,
+                    UpdateCategoryView, UpdateProductView, WishListView)
 
 router = DefaultRouter()
 
-# Viewset Routers for Product Rating, Wishlist and Discount
+# Viewset Routers for Product Rating, Wishlist, Discount and Images
 router.register(r'products/(?P<product_id>\d+)/ratings',
                 RatingView, basename='product-ratings')
 router.register(r'products/(?P<product_id>\d+)/wishlist',
                 WishListView, basename='product-wishlist')
 router.register(r'products/(?P<product_id>\d+)/discounts',
                 DiscountView, basename='product-discount')
+router.register(r'products/(?P<product_id>\d+)/images',
+                ProductImageView, basename='product-images')
+router.register(r'wishlist', WishListView, basename='wishlist')
+router.register(r'reservations', StockReservationView,
+                basename='stock-reservations')
+router.register(r'uploads', ImageUploadView, basename='image-uploads')
+
+# Hot catalog reads, by native async views when ASYNC_VIEWS is on
+if settings.ASYNC_VIEWS:
+    catalog_views = {
+        'category_list': AsyncListCategoryView.as_view(),
+        'category_detail': AsyncDetailCategoryView.as_view(),
+        'products-list': AsyncListProductView.as_view(),
+        'products-detail': AsyncDetailProductView.as_view(),
+    }
+else:
+    catalog_views = {
+        'category_list': ListCategoryView.as_view(),
+        'category_detail': DetailCategoryView.as_view(),
+        'products-list': ListProductView.as_view(),
+        'products-detail': DetailProductView.as_view(),
+    }
 
 urlpatterns = [
     # Category Enpoint URLs
     path('category/create/', CreateCategoryView.as_view(), name='category_create'),
-    path('category/', ListCategoryView.as_view(), name='category_list'),
-    path('category/<int:pk>/', DetailCategoryView.as_view(), name='category_detail'),
+    path('category/bulk/', BulkCategoryView.as_view(), name='category_bulk'),
+    path('category/', catalog_views['category_list'], name='category_list'),
+    path('category/<int:pk>/', catalog_views['category_detail'], name='category_detail'),
     path('category/<int:pk>/update/',
          UpdateCategoryView.as_view(), name='category_update'),
     path('category/<int:pk>/delete/',
@@ -30,14 +60,26 @@ urlpatterns = [
 
     # Products Endpoint URLs
     path('products/create/', CreateProductView.as_view(), name='products-create'),
-    path('products/', ListProductView.as_view(), name='products-list'),
-    path('products/<int:pk>/', DetailProductView.as_view(), name='products-detail'),
+    path('products/', catalog_views['products-list'], name='products-list'),
+    path('products/<int:pk>/', catalog_views['products-detail'], name='products-detail'),
     path('products/<int:pk>/update/',
          UpdateProductView.as_view(), name='products-update'),
     path('products/<int:pk>/delete/',
          DeleteProductView.as_view(), name='products-delete'),
+    path('products/<int:pk>/purchase/',
+         PurchaseProductView.as_view(), name='products-purchase'),
+    path('products/bulk/', BulkProductView.as_view(), name='products-bulk'),
+    path('products/export/', ExportProductsView.as_view(), name='products-export'),
+    path('products/import/', ImportProductsView.as_view(), name='products-import'),
+    path('discounts/bulk/', BulkDiscountView.as_view(), name='discounts-bulk'),
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
+
+    # Catalog cache counters
+    path('cache/stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
 
     # Viewset Endpoint URL for Ratings, Wishlist & Discounts
+    *([path('products/<int:product_id>/ratings/', AsyncRatingListView.as_view(),
+            name='product-ratings-list')] if settings.ASYNC_VIEWS else []),
     path('', include(router.urls)),
 
 ]
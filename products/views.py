@@ -1,15 +1,112 @@
 # Importing modules and classes
+import math
+import shutil
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics, permissions, viewsets
-from rest_framework.filters import OrderingFilter, SearchFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework import (generics, mixins, permissions, serializers, status,
+                            viewsets)
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from .bulk import BulkChangeView
+from .cache import (CachedResponseMixin, ConditionalGetMixin, cache_stats,
+                    invalidate_catalog)
+from .exporter import CONTENT_TYPES, EXPORT_FORMATS, export_lines, export_rows
 from .filters import ProductFilter
-from .models import Category, Discount, Product, Rating, WishList
-from .serializers import (CategorySerializer, DiscountSerializer,
-                          ProductSerializer, RatingSerializer,
-                          WishListSerializer)
+from .images import add_image
+from .importer import (IMPORT_FORMATS, detect_format, import_products,
+                       uploaded_file_stream)
+from .models import (Category, Discount, ImageUpload, Product, ProductImage,
+                     Rating, StockReservation, WishList)
+from .pagination import ProductCursorPagination
+from .search import ProductSearchFilter, index_products, reindex_category
+from .serializers import (CategorySerializer, CheckoutSerializer,
+                          DiscountBulkSerializer, DiscountSerializer,
+                          ImageOrderSerializer, ImageUploadSerializer,
+                          ProductBulkSerializer, ProductImageSerializer,
+                          ProductSerializer, PurchaseSerializer,
+                          RatingSerializer, StockReservationSerializer,
+                          WishListLookupSerializer, WishListSerializer)
+from .stock import confirm_reservation, release_reservation
+from .uploads import complete_upload, upload_path, write_chunk
+
+# Product Cache Mixin: caches product responses no longer than the next discount
+# start or end, so cached prices are never stale, and validates them against the
+# product and discount update times. With ?in_wishlist=true, authenticated users get
+# the wishlist state of the products, looked up with one query per page.
+
+class ProductCacheMixin(ConditionalGetMixin, CachedResponseMixin):
+    cache_namespace = 'products'
+
+    def get_cache_timeout(self):
+        if not hasattr(self, '_cache_timeout'):
+            timeout = super().get_cache_timeout()
+            next_change = Discount.next_change()
+            if next_change:
+                timeout = min(timeout, math.ceil((next_change - timezone.now()).total_seconds()))
+            self._cache_timeout = timeout
+        return self._cache_timeout
+
+    # Cursor pages read a window of the catalog, without the COUNT of every matching
+    # product the validators would run
+    def has_validators(self):
+        return not isinstance(self.paginator, CursorPagination)
+
+    def get_validators(self, request, *args, **kwargs):
+        products = self.filter_queryset(self.get_queryset())
+        discounts = Discount.objects.all()
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is not None:
+            products = products.filter(pk=lookup)
+            discounts = discounts.filter(product=lookup)
+        products = products.aggregate(count=Count('id'), updated=Max('updated_at'))
+        discounts = Discount.state(discounts)
+        changes = [products['updated'], discounts['updated'], discounts['started'], discounts['ended']]
+        wishlist = None
+        if self.wants_wishlist():
+            # wishlists are short: the ids of the whole wishlist make an exact validator
+            wishlist = sorted(WishList.objects.filter(user=request.user).values_list('product_id', flat=True))
+        # deleting a row moves no date forward: lists are only validated by their ETag,
+        # which has the row count
+        last_modified = max(filter(None, changes), default=None) if lookup is not None else None
+        return (products, discounts, wishlist), last_modified
+
+    def wants_wishlist(self):
+        return (self.request.user.is_authenticated
+                and self.request.query_params.get('in_wishlist') == 'true')
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.wants_wishlist():
+            products = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context'] = {**self.get_serializer_context(), 'wishlist': set(
+                WishList.objects.filter(user=self.request.user, product__in=[p.pk for p in products])
+                .values_list('product_id', flat=True))}
+        return super().get_serializer(*args, **kwargs)
+
+
+# Category Cache Mixin
+
+class CategoryCacheMixin(ConditionalGetMixin, CachedResponseMixin):
+    cache_namespace = 'categories'
+
+    def get_validators(self, request, *args, **kwargs):
+        categories = self.filter_queryset(self.get_queryset())
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is not None:
+            categories = categories.filter(pk=lookup)
+        categories = categories.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return categories, categories['updated'] if lookup is not None else None
 
 
 # Create Category View
@@ -25,14 +122,14 @@ class CreateCategoryView(generics.CreateAPIView):
 
 # List Category View
 
-class ListCategoryView(generics.ListAPIView):
+class ListCategoryView(CategoryCacheMixin, generics.ListAPIView):
     queryset = Category.objects.all().order_by('id')
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
 # Detail Category View
 
-class DetailCategoryView(generics.RetrieveAPIView):
+class DetailCategoryView(CategoryCacheMixin, generics.RetrieveAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
@@ -66,30 +163,49 @@ class CreateProductView(generics.CreateAPIView):
 
 # List Products View
 
-class ListProductView(generics.ListAPIView):
+class ListProductView(ProductCacheMixin, generics.ListAPIView):
     queryset = Product.objects.all().order_by('created_at')
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
 
-    # Allows for partial matches in product names for flexible search results.
-    search_fields = ['name', 'category__name']
+    # Prefix matches on product names, descriptions and category names, ranked by relevance.
+    # Used as icontains lookups on databases without the full-text index.
+    search_fields = ['name', 'description', 'category__name']
 
-    # Allows for ordering product list by the date posted
-    ordering_fields = ['created_at']
+    # Allows for ordering product list by the date posted or by rating
+    ordering_fields = ['created_at', 'avg_rating', 'rating_count']
 
     # Handles pagination for product list, only 10 products are displayed per page
     pagination_class = PageNumberPagination
 
+    # Paginators clients can opt into with ?paginator=<name>, e.g. ?paginator=cursor
+    pagination_classes = {'cursor': ProductCursorPagination}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            name = request.query_params.get('paginator') if request else None
+            self._paginator = self.pagination_classes.get(name, self.pagination_class)()
+        return self._paginator
+
+    # Fetches the images and active discounts of the whole page in one query each
+    def get_queryset(self):
+        return super().get_queryset().for_catalog()
+
 # Detail Products View
 
-class DetailProductView(generics.RetrieveAPIView):
+class DetailProductView(ProductCacheMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        return super().get_queryset().for_catalog()
+
 # Update Products View
 
 class UpdateProductView(generics.UpdateAPIView):
@@ -109,6 +225,203 @@ class DeleteProductView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [JWTAuthentication]
 
+# Import Products View: streams a CSV or JSON Lines file of products into the catalog,
+# writing them in batches. Admin only.
+
+class ImportProductsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file is None:
+            raise serializers.ValidationError({'file': 'This field is required.'})
+        try:
+            file_format = request.data.get('format') or detect_format(uploaded_file.name)
+            batch_size = int(request.data.get('batch_size', 1000))
+            if file_format not in IMPORT_FORMATS or batch_size < 1:
+                raise ValueError(
+                    f'Use a format in {", ".join(IMPORT_FORMATS)} and a positive batch size')
+        except ValueError as error:
+            raise serializers.ValidationError({'file': str(error)})
+
+        report = import_products(
+            uploaded_file_stream(uploaded_file), file_format, request.user, batch_size=batch_size,
+            create_categories=request.data.get('create_categories') in ('true', '1'))
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+# Export Products View: streams the whole catalog as CSV or NDJSON (`?output=ndjson`),
+# reading products a chunk at a time. Admin only.
+
+class ExportProductsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request, *args, **kwargs):
+        # `format` is taken by DRF's format suffixes, hence `output`
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise serializers.ValidationError(
+                {'output': f'Use one of: {", ".join(EXPORT_FORMATS)}'})
+
+        lines = export_lines(export_rows(request=request), file_format)
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+# Purchase Product View: buys a quantity of a product, reducing its stock atomically
+
+class PurchaseProductView(generics.GenericAPIView):
+    queryset = Product.objects.all()
+    serializer_class = PurchaseSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def post(self, request, *args, **kwargs):
+        product = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantity = serializer.validated_data['quantity']
+        try:
+            product.reduce_stock(quantity)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'quantity': error.messages})
+        return Response({
+            'product': product.id,
+            'quantity': quantity,
+            'stock_quantity': product.stock_quantity
+        }, status=status.HTTP_200_OK)
+
+# Checkout View: buys a whole cart, taking the stock of every line in one UPDATE
+
+class CheckoutView(generics.GenericAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+
+# Stock Reservation View: holds stock for a user until it is confirmed, released or expires
+
+class StockReservationView(mixins.CreateModelMixin, mixins.ListModelMixin,
+                           mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = StockReservationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def get_queryset(self):
+        # the schema generator inspects the view without a user
+        if getattr(self, 'swagger_fake_view', False):
+            return StockReservation.objects.none()
+        return StockReservation.objects.filter(
+            user=self.request.user).prefetch_related('items')
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        reservation = self.get_object()
+        try:
+            confirm_reservation(reservation)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'status': error.messages})
+        return Response(self.get_serializer(reservation).data)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        reservation = release_reservation(self.get_object())
+        return Response(self.get_serializer(reservation).data)
+
+
+# Product Image View: lists, adds and removes the images of a product one at a time.
+# `POST reorder/` with the ids of every image in their new order reorders them.
+
+class ProductImageView(mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    serializer_class = ProductImageSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    authentication_classes = [JWTAuthentication]
+    pagination_class = None
+
+    def get_product(self):
+        if not hasattr(self, '_product'):
+            self._product = get_object_or_404(Product, pk=self.kwargs['product_id'])
+        return self._product
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ProductImage.objects.none()
+        return ProductImage.objects.filter(product_id=self.kwargs['product_id'])
+
+    # Adds an image to the end; a file the product already has is not added again
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        image, added = add_image(self.get_product(), serializer.validated_data['image'])
+        return Response(self.get_serializer(image).data,
+                        status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
+    # Positions are written with one UPDATE, which sends no signals
+    @action(detail=False, methods=['post'])
+    def reorder(self, request, product_id=None):
+        product = self.get_product()
+        with transaction.atomic():
+            serializer = ImageOrderSerializer(data=request.data, context={'product': product})
+            serializer.is_valid(raise_exception=True)
+            images = product.images.in_bulk(serializer.validated_data['order'])
+            for position, image_id in enumerate(serializer.validated_data['order']):
+                images[image_id].position = position
+            ProductImage.objects.bulk_update(images.values(), ['position'])
+            Product.objects.filter(pk=product.pk).update(updated_at=timezone.now())
+            invalidate_catalog('products')
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+
+# Image Upload View: resumable uploads of product images. A client opens an upload,
+# PUTs the raw bytes of each chunk to chunks/<index>/, in any order and in parallel,
+# then POSTs to complete/ to assemble the image. Deleting an open upload cancels it.
+
+class ImageUploadView(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                      mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    serializer_class = ImageUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ImageUpload.objects.none()
+        return ImageUpload.objects.filter(user=self.request.user).select_related('image')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        path = upload_path(instance)
+        instance.delete()
+        transaction.on_commit(lambda: shutil.rmtree(path, ignore_errors=True))
+
+    # The body is read straight from the request stream, never parsed into request.data,
+    # so a chunk is not held in memory
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        upload = self.get_object()
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            write_chunk(upload, int(index), request.stream, length)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'chunk': error.messages})
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            upload = complete_upload(self.get_object())
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'upload': error.messages})
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+
 
 # Rating View
 
@@ -130,17 +443,63 @@ class RatingView(viewsets.ModelViewSet):
         context['product_id'] = self.kwargs.get('product_id')
         return context
 
-# WishList View
+    # Rating writes update the product's rating aggregates in the same transaction
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            rating = serializer.save()
+            Product.objects.filter(pk=rating.product_id).apply_rating_change(added=rating.rating)
 
-class WishListView(viewsets.ModelViewSet):
-    queryset = WishList.objects.all()
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # reads the stored rating under a row lock, so concurrent edits see each other
+            removed = Rating.objects.select_for_update().get(pk=serializer.instance.pk).rating
+            rating = serializer.save()
+            Product.objects.filter(pk=rating.product_id).apply_rating_change(
+                added=rating.rating, removed=removed)
+
+    # A rating deleted by two requests at once is taken out of the aggregates once
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            deleted, _ = Rating.objects.filter(pk=instance.pk).delete()
+            if deleted:
+                Product.objects.filter(pk=instance.product_id).apply_rating_change(removed=instance.rating)
+
+# WishList View: the wishlist of the authenticated user. Under products/<product_id>/
+# it only has that product, which new entries are for when no product_id is given.
+# `GET contains/?product_ids=1,2,3` tells which of a page of products are in it.
+
+class WishListView(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                   mixins.DestroyModelMixin, viewsets.GenericViewSet):
     serializer_class = WishListSerializer
-    permission_classes = []
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['request'] = self.request
-        return context
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return WishList.objects.none()
+        entries = WishList.objects.filter(user=self.request.user).select_related('product')
+        if 'product_id' in self.kwargs:
+            entries = entries.filter(product_id=self.kwargs['product_id'])
+        return entries
+
+    def create(self, request, *args, **kwargs):
+        data = request.data
+        if 'product_id' in self.kwargs and 'product_id' not in data:
+            data = {'product_id': self.kwargs['product_id']}
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def contains(self, request, product_id=None):
+        ids = [pk for pk in request.query_params.get('product_ids', '').split(',') if pk]
+        serializer = WishListLookupSerializer(data={'product_ids': ids})
+        serializer.is_valid(raise_exception=True)
+        product_ids = serializer.validated_data['product_ids']
+        found = set(WishList.objects.filter(user=request.user, product_id__in=product_ids)
+                    .values_list('product_id', flat=True))
+        return Response({product_id: product_id in found for product_id in product_ids})
 
 # Discount View
 
@@ -148,3 +507,50 @@ class DiscountView(viewsets.ModelViewSet):
     queryset = Discount.objects.all()
     serializer_class = DiscountSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+# Bulk Product View: creates, updates or deletes many products in one request
+
+class BulkProductView(BulkChangeView):
+    model = Product
+    serializer_class = ProductBulkSerializer
+    preloaded_fields = {'category': Category}
+    owner_field = 'created_by'
+
+    def get_queryset(self):
+        return Product.objects.select_related('category')
+
+    def after_write(self, created=(), updated=(), deleted=(), changed_fields=()):
+        # deleted products leave the index through their post_delete signal
+        if created or set(changed_fields) & {'name', 'description', 'category'}:
+            index_products([*created, *updated])
+        invalidate_catalog('products')
+
+# Bulk Category View: creates, updates or deletes many categories in one request
+
+class BulkCategoryView(BulkChangeView):
+    model = Category
+    serializer_class = CategorySerializer
+    permission_classes = [permissions.IsAdminUser]
+    owner_field = 'created_by'
+
+    def after_write(self, created=(), updated=(), deleted=(), changed_fields=()):
+        if 'name' in changed_fields:
+            for category in updated:
+                reindex_category(category)
+        invalidate_catalog('products', 'categories')
+
+# Bulk Discount View: creates, updates or deletes many discounts in one request
+
+class BulkDiscountView(BulkChangeView):
+    model = Discount
+    serializer_class = DiscountBulkSerializer
+    preloaded_fields = {'product': Product}
+
+# Catalog Cache Stats View: hit and miss counters of the catalog response cache
+
+class CatalogCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_stats.as_dict())